@@ -1,43 +1,234 @@
-from flask import Flask
-from flask_cors import CORS
-import os
-from app.database.sql_provider import SQLProvider
-from app.database.redis_provider import RedisProvider
-
-def create_app():
-    app = Flask(__name__)
-    CORS(app, supports_credentials=True)
-    
-    app.config['sql_provider'] = SQLProvider(
-        host=os.getenv('DB_HOST', 'db'),
-        database=os.getenv('DB_NAME', 'clinic'),
-        user=os.getenv('DB_USER', 'clinic'),
-        password=os.getenv('DB_PASSWORD', 'clinic')
-    )
-
-    RedisProvider.initialize(
-        host=os.getenv('REDIS_HOST', 'redis'),
-        port=int(os.getenv('REDIS_PORT', 6379))
-    )
-
-    app.config['SECRET_KEY'] = os.getenv('SECRET_KEY', 'your-secret-key')
-
-    from app.routes import main_bp
-    from app.routes.auth import auth_bp
-    from app.routes.profile import profile_bp
-    from app.routes.schedule import schedule_bp
-    from app.routes.appointment import appointment_bp
-    from app.routes.doctor import doctor_bp
-    from app.routes.reports import reports_bp
-    from app.routes.admin import admin_bp
-
-    app.register_blueprint(main_bp)
-    app.register_blueprint(auth_bp, url_prefix='/api/auth')
-    app.register_blueprint(profile_bp)
-    app.register_blueprint(schedule_bp)
-    app.register_blueprint(appointment_bp)
-    app.register_blueprint(doctor_bp)
-    app.register_blueprint(reports_bp)
-    app.register_blueprint(admin_bp)
-    
+from flask import Flask, jsonify
+from flask_cors import CORS
+import os
+import redis
+from app.database.governor import QueryGovernor, QueryLimitError, QueryLimits
+from app.database.sql_provider import SQLProvider
+from app.database.redis_provider import RedisProvider
+from app.database.rate_limiter import Bucket, RateLimiter
+from app.database.report_jobs import ReportJobQueue
+from app.database.response_cache import ResponseCache
+from app.database.session_cache import SessionCache
+from app.database.session_denylist import SessionDenylist
+from app.database.slot_holds import SlotHolds
+from app.database.slot_index import SlotAvailabilityIndex
+from app.utils.conditional import init_conditional_requests
+from app.utils.password_hasher import PasswordHasher, PasswordHasherBusyError
+from app.utils.session_token import SessionTokenSigner
+
+# SQL файлы, без которых приложение не запустится
+REQUIRED_QUERIES = [
+    'appointment/create_appointment.sql',
+    'appointment/get_doctor_appointments.sql',
+    'appointment/get_doctor_appointments_range.sql',
+    'appointment/get_doctor_schedule.sql',
+    'appointment/get_doctor_week_schedule.sql',
+    'appointment/search_doctor_appointments.sql',
+    'appointment/search_doctor_schedules.sql',
+    'auth/check_user.sql',
+    'auth/create_doctor.sql',
+    'auth/create_schedule.sql',
+    'auth/get_identity.sql',
+    'auth/get_user.sql',
+    'auth/update_password_hash.sql',
+    'department/get_head.sql',
+    'doctor/get_appointments.sql',
+    'patient/get_appointments.sql',
+    'patient/get_diagnoses.sql',
+    'profile/delete_appointment.sql',
+    'profile/get_appointment_slot.sql',
+    'profile/get_user_appointments.sql',
+    'reports/doctor_patients_month.sql',
+    'reports/patients_by_diagnosis.sql',
+    'reports/total_patients_month.sql',
+    'schedule/get_departments.sql',
+    'schedule/get_doctors_by_department.sql',
+    'schedule/get_doctors_schedule.sql'
+]
+
+# Часто выполняемые запросы, которые держим подготовленными на каждом соединении пула
+PREPARED_QUERIES = [
+    'appointment/create_appointment.sql',
+    'appointment/get_doctor_appointments.sql',
+    'appointment/get_doctor_schedule.sql',
+    'auth/check_user.sql',
+    'auth/get_user.sql',
+    'profile/delete_appointment.sql',
+    'profile/get_appointment_slot.sql'
+]
+
+# Ограничения запросов по blueprint'ам: время выполнения (сек) и максимум строк в результате
+QUERY_LIMITS = {
+    'appointment': QueryLimits(timeout=3, max_rows=10000),
+    'auth': QueryLimits(timeout=3, max_rows=100),
+    'schedule': QueryLimits(timeout=5, max_rows=10000),
+    'doctor': QueryLimits(timeout=5, max_rows=100000),
+    'profile': QueryLimits(timeout=5, max_rows=100000),
+    'reports': QueryLimits(timeout=30, max_rows=100000),
+    'admin': QueryLimits(timeout=30, max_rows=1000000)
+}
+
+# Cache-Control для GET ответов по blueprint'ам: no-cache - браузер хранит ответ, но каждый раз
+# переспрашивает сервер с If-None-Match и получает 304, если ничего не изменилось
+CACHE_CONTROL = {
+    'schedule': 'public, no-cache',
+    'main': 'private, no-cache',
+    'appointment': 'private, no-cache',
+    'doctor': 'private, no-cache',
+    'profile': 'private, no-cache',
+    'patient': 'private, no-cache',
+    'reports': 'private, no-cache',
+    'auth': 'no-store',
+    'admin': 'no-store'
+}
+
+def create_app():
+    app = Flask(__name__)
+    CORS(app, supports_credentials=True)
+    
+    app.config['sql_provider'] = SQLProvider(
+        host=os.getenv('DB_HOST', 'db'),
+        database=os.getenv('DB_NAME', 'clinic'),
+        user=os.getenv('DB_USER', 'clinic'),
+        password=os.getenv('DB_PASSWORD', 'clinic'),
+        pool_min_size=int(os.getenv('DB_POOL_MIN_SIZE', 1)),
+        pool_max_size=int(os.getenv('DB_POOL_MAX_SIZE', 10)),
+        pool_timeout=float(os.getenv('DB_POOL_TIMEOUT', 5)),
+        pool_max_idle_time=float(os.getenv('DB_POOL_MAX_IDLE_TIME', 300)),
+        pool_max_lifetime=float(os.getenv('DB_POOL_MAX_LIFETIME', 3600)),
+        prepared_queries=PREPARED_QUERIES if os.getenv('DB_PREPARED_STATEMENTS', '1') == '1' else (),
+        bulk_batch_size=int(os.getenv('DB_BULK_BATCH_SIZE', 500)),
+        slow_query_threshold=float(os.getenv('DB_SLOW_QUERY_MS', 500)) / 1000,
+        replica_hosts=[host.strip() for host in os.getenv('DB_REPLICA_HOSTS', '').split(',') if host.strip()],
+        replica_max_lag=float(os.getenv('DB_REPLICA_MAX_LAG', 5)),
+        governor=QueryGovernor(
+            default=QueryLimits(
+                timeout=float(os.getenv('DB_QUERY_TIMEOUT', 10)),
+                max_rows=int(os.getenv('DB_QUERY_MAX_ROWS', 100000))
+            ),
+            blueprint_limits=QUERY_LIMITS
+        )
+    )
+    app.config['sql_provider'].queries.require(REQUIRED_QUERIES)
+
+    RedisProvider.initialize(
+        host=os.getenv('REDIS_HOST', 'redis'),
+        port=int(os.getenv('REDIS_PORT', 6379)),
+        max_connections=int(os.getenv('REDIS_MAX_CONNECTIONS', 50)),
+        pool_timeout=float(os.getenv('REDIS_POOL_TIMEOUT', 2)),
+        socket_timeout=float(os.getenv('REDIS_SOCKET_TIMEOUT', 1)),
+        socket_connect_timeout=float(os.getenv('REDIS_CONNECT_TIMEOUT', 1)),
+        health_check_interval=int(os.getenv('REDIS_HEALTH_CHECK_INTERVAL', 30)),
+        retries=int(os.getenv('REDIS_RETRIES', 2))
+    )
+    app.config['session_cache'] = SessionCache(
+        max_entries=int(os.getenv('SESSION_CACHE_SIZE', 10000)),
+        ttl=float(os.getenv('SESSION_CACHE_TTL', 5))
+    )
+
+    # Попытки входа и регистрации: ёмкость корзины и пополнение в секунду
+    app.config['rate_limiter'] = RateLimiter({
+        'login_ip': Bucket(
+            'login_ip',
+            burst=int(os.getenv('LOGIN_IP_BURST', 20)),
+            refill_rate=float(os.getenv('LOGIN_IP_RATE', 0.5))
+        ),
+        'login_user': Bucket(
+            'login_user',
+            burst=int(os.getenv('LOGIN_USER_BURST', 5)),
+            refill_rate=float(os.getenv('LOGIN_USER_RATE', 0.1))
+        ),
+        'register_ip': Bucket(
+            'register_ip',
+            burst=int(os.getenv('REGISTER_IP_BURST', 5)),
+            refill_rate=float(os.getenv('REGISTER_IP_RATE', 0.05))
+        )
+    })
+
+    # Справочные ответы (расписания, отделения, типы отчётов) меняются несколько раз в день
+    app.config['response_cache'] = ResponseCache(
+        ttl=int(os.getenv('RESPONSE_CACHE_TTL', 300)),
+        local_ttl=float(os.getenv('RESPONSE_CACHE_LOCAL_TTL', 5)),
+        max_local_entries=int(os.getenv('RESPONSE_CACHE_LOCAL_ENTRIES', 1000))
+    )
+
+    # Генерация отчётов идёт в отдельном процессе worker.py: у его запросов свои, более мягкие ограничения
+    app.config['report_jobs'] = ReportJobQueue(job_ttl=int(os.getenv('REPORT_JOB_TTL', 86400)))
+    app.config['REPORT_WORKER_CONCURRENCY'] = int(os.getenv('REPORT_WORKER_CONCURRENCY', 2))
+    app.config['REPORT_JOB_LIMITS'] = QueryLimits(
+        timeout=float(os.getenv('REPORT_JOB_QUERY_TIMEOUT', 300)),
+        max_rows=int(os.getenv('REPORT_JOB_MAX_ROWS', 1000000))
+    )
+
+    app.config['slot_index'] = SlotAvailabilityIndex(ttl=int(os.getenv('SLOT_INDEX_TTL', 86400)))
+    # Сколько секунд выбранное время держится за пациентом до подтверждения записи
+    app.config['slot_holds'] = SlotHolds(ttl=int(os.getenv('SLOT_HOLD_TTL', 300)))
+
+    app.config['password_hasher'] = PasswordHasher(
+        rounds=int(os.getenv('BCRYPT_ROUNDS', 12)),
+        max_workers=int(os.getenv('PASSWORD_HASH_WORKERS', os.cpu_count() or 2)),
+        max_queue=int(os.getenv('PASSWORD_HASH_QUEUE', 32)),
+        timeout=float(os.getenv('PASSWORD_HASH_TIMEOUT', 5))
+    )
+
+    app.config['SECRET_KEY'] = os.getenv('SECRET_KEY', 'your-secret-key')
+
+    from app.routes.auth import SESSION_MODE_REDIS, SESSION_MODE_TOKEN, SESSION_TTL
+    # redis - сессия хранится в Redis, token - подписанный токен с локальной проверкой
+    app.config['SESSION_MODE'] = os.getenv('SESSION_MODE', SESSION_MODE_REDIS)
+    if app.config['SESSION_MODE'] not in (SESSION_MODE_REDIS, SESSION_MODE_TOKEN):
+        raise ValueError(f"Unknown SESSION_MODE: {app.config['SESSION_MODE']}")
+    app.config['session_signer'] = SessionTokenSigner(app.config['SECRET_KEY'], SESSION_TTL)
+    app.config['session_denylist'] = SessionDenylist(
+        session_ttl=SESSION_TTL.total_seconds(),
+        refresh_interval=float(os.getenv('SESSION_DENYLIST_REFRESH', 2))
+    )
+
+    @app.errorhandler(QueryLimitError)
+    def handle_query_limit(error):
+        response = jsonify({'error': str(error)})
+        response.status_code = error.status_code
+        if error.status_code == 503:
+            response.headers['Retry-After'] = '5'
+        return response
+
+    @app.errorhandler(PasswordHasherBusyError)
+    def handle_password_hasher_busy(error):
+        response = jsonify({'error': str(error)})
+        response.status_code = error.status_code
+        response.headers['Retry-After'] = '2'
+        return response
+
+    @app.errorhandler(redis.ConnectionError)
+    @app.errorhandler(redis.TimeoutError)
+    def handle_redis_unavailable(error):
+        # Redis не ответил за отведённые таймауты - отвечаем сразу, а не держим воркер
+        print(f"Redis unavailable: {str(error)}")
+        response = jsonify({'error': 'Сервис временно недоступен'})
+        response.status_code = 503
+        response.headers['Retry-After'] = '5'
+        return response
+
+    init_conditional_requests(app, CACHE_CONTROL)
+
+    from app.routes import main_bp
+    from app.routes.auth import auth_bp
+    from app.routes.profile import profile_bp
+    from app.routes.schedule import schedule_bp
+    from app.routes.appointment import appointment_bp
+    from app.routes.doctor import doctor_bp
+    from app.routes.patient import patient_bp
+    from app.routes.reports import reports_bp
+    from app.routes.admin import admin_bp
+
+    app.register_blueprint(main_bp)
+    app.register_blueprint(auth_bp, url_prefix='/api/auth')
+    app.register_blueprint(profile_bp)
+    app.register_blueprint(schedule_bp)
+    app.register_blueprint(appointment_bp)
+    app.register_blueprint(doctor_bp)
+    app.register_blueprint(patient_bp)
+    app.register_blueprint(reports_bp)
+    app.register_blueprint(admin_bp)
+    
     return app 
\ No newline at end of file
@@ -0,0 +1,35 @@
+from typing import Dict, Iterable, List, Sequence
+
+# Форматы результата запроса
+RESULT_DICTS = 'dicts'
+RESULT_ROWS = 'rows'
+RESULT_COLUMNS = 'columns'
+
+
+class CompactResult:
+    """Результат без словаря на каждую строку: имена столбцов один раз и строки кортежами.
+
+    В колоночном виде (columnar=True) вместо строк хранится по одному списку на столбец.
+    rows может быть генератором из stream_query - тогда результат читается один раз.
+    """
+
+    def __init__(self, columns: Sequence[str], rows: Iterable[Sequence], columnar: bool = False):
+        self.columns = list(columns)
+        self.columnar = columnar
+        if columnar:
+            rows = list(rows)
+            self.values: List[List] = [list(column) for column in zip(*rows)] if rows else [[] for _ in self.columns]
+            self.rows = None
+        else:
+            self.rows = rows
+            self.values = None
+
+    def __len__(self) -> int:
+        if self.columnar:
+            return len(self.values[0]) if self.values else 0
+        return len(self.rows)
+
+    def to_dict(self) -> Dict:
+        if self.columnar:
+            return {'columns': self.columns, 'values': self.values}
+        return {'columns': self.columns, 'rows': self.rows if isinstance(self.rows, list) else list(self.rows)}
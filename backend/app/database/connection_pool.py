@@ -0,0 +1,273 @@
+import mysql.connector
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Deque, Dict, Optional
+
+
+class PoolTimeoutError(Exception):
+    """Не удалось получить соединение из пула за отведённое время"""
+
+
+class PooledConnection:
+    def __init__(self, connection):
+        self.connection = connection
+        self.created_at = time.monotonic()
+        self.last_used = self.created_at
+        # Подготовленные на сервере запросы этого соединения: имя запроса -> курсор
+        self.statements: Dict[str, object] = {}
+
+
+class ConnectionPool:
+    """Ограниченный потокобезопасный пул соединений MySQL.
+
+    min_size соединений открываются заранее (fill) и пополняются в фоне, когда пул
+    становится меньше min_size: после закрытия устаревших или не ответивших на ping.
+    """
+
+    def __init__(
+        self,
+        connection_params: Dict,
+        min_size: int = 1,
+        max_size: int = 10,
+        timeout: float = 5.0,
+        max_idle_time: float = 300.0,
+        max_lifetime: float = 3600.0
+    ):
+        if min_size < 0 or max_size < 1 or min_size > max_size:
+            raise ValueError("Некорректные границы размера пула")
+
+        self.connection_params = connection_params
+        self.min_size = min_size
+        self.max_size = max_size
+        self.timeout = timeout
+        self.max_idle_time = max_idle_time
+        self.max_lifetime = max_lifetime
+
+        self._idle: Deque[PooledConnection] = deque()
+        self._in_use: Dict[int, PooledConnection] = {}
+        self._size = 0
+        self._lock = threading.Condition(threading.Lock())
+        self._filling = False
+
+        # Счётчики для статистики
+        self._waiting = 0
+        self._checkouts = 0
+        self._timeouts = 0
+        self._created = 0
+        self._closed = 0
+        self._total_wait_time = 0.0
+        self._max_wait_time = 0.0
+
+    def _connect(self) -> PooledConnection:
+        connection = mysql.connector.connect(**self.connection_params)
+        with self._lock:
+            self._created += 1
+        return PooledConnection(connection)
+
+    def _close(self, pooled: PooledConnection):
+        try:
+            pooled.connection.close()
+        except Exception:
+            pass
+        with self._lock:
+            self._closed += 1
+
+    def _is_expired(self, pooled: PooledConnection, now: float) -> bool:
+        return self.max_lifetime > 0 and now - pooled.created_at > self.max_lifetime
+
+    def _is_valid(self, pooled: PooledConnection) -> bool:
+        # Проверяем соединение перед выдачей: упавшее соединение не должно попасть в запрос
+        try:
+            pooled.connection.ping(reconnect=False)
+            return True
+        except Exception:
+            return False
+
+    def fill(self) -> int:
+        """Открывает соединения до min_size и возвращает их число. Ошибку подключения не пробрасывает:
+        недостающие соединения откроются при следующем пополнении или по запросу"""
+        opened = 0
+        while True:
+            with self._lock:
+                if self._size >= self.min_size:
+                    return opened
+                self._size += 1
+            try:
+                pooled = self._connect()
+            except Exception as e:
+                with self._lock:
+                    self._size -= 1
+                    self._lock.notify()
+                print(f"Connection pool fill failed: {str(e)}")
+                return opened
+            with self._lock:
+                self._idle.append(pooled)
+                self._lock.notify()
+            opened += 1
+
+    def fill_async(self):
+        """Пополняет пул до min_size в фоновом потоке, если он меньше и пополнение ещё не идёт"""
+        with self._lock:
+            if self._filling or self._size >= self.min_size:
+                return
+            self._filling = True
+        threading.Thread(target=self._fill_worker, name='db-pool-fill', daemon=True).start()
+
+    def _fill_worker(self):
+        try:
+            self.fill()
+        finally:
+            with self._lock:
+                self._filling = False
+
+    def _evict_idle(self, now: float) -> list:
+        """Убирает простаивающие и устаревшие соединения. Вызывается под блокировкой"""
+        evicted = []
+        kept: Deque[PooledConnection] = deque()
+        while self._idle:
+            pooled = self._idle.popleft()
+            idle_too_long = (
+                self.max_idle_time > 0
+                and now - pooled.last_used > self.max_idle_time
+                and self._size - len(evicted) > self.min_size
+            )
+            if idle_too_long or self._is_expired(pooled, now):
+                evicted.append(pooled)
+            else:
+                kept.append(pooled)
+        self._idle = kept
+        self._size -= len(evicted)
+        return evicted
+
+    def acquire(self):
+        started = time.monotonic()
+        deadline = started + self.timeout
+
+        while True:
+            pooled = None
+            need_new = False
+            with self._lock:
+                evicted = self._evict_idle(time.monotonic())
+                self._waiting += 1
+                try:
+                    while not self._idle and self._size >= self.max_size:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            self._timeouts += 1
+                            raise PoolTimeoutError(
+                                f"Нет свободных соединений в пуле (max_size={self.max_size})"
+                            )
+                        self._lock.wait(remaining)
+                finally:
+                    self._waiting -= 1
+
+                if self._idle:
+                    # LIFO: самые "тёплые" соединения выдаются первыми, старые успевают простоять и уйти
+                    pooled = self._idle.pop()
+                else:
+                    self._size += 1
+                    need_new = True
+
+            for stale in evicted:
+                self._close(stale)
+            if evicted:
+                self.fill_async()
+
+            if need_new:
+                try:
+                    pooled = self._connect()
+                except Exception:
+                    with self._lock:
+                        self._size -= 1
+                        self._lock.notify()
+                    raise
+            elif not self._is_valid(pooled):
+                with self._lock:
+                    self._size -= 1
+                    self._lock.notify()
+                self._close(pooled)
+                self.fill_async()
+                continue
+
+            waited = time.monotonic() - started
+            with self._lock:
+                self._in_use[id(pooled.connection)] = pooled
+                self._checkouts += 1
+                self._total_wait_time += waited
+                self._max_wait_time = max(self._max_wait_time, waited)
+            return pooled.connection
+
+    def release(self, connection, discard: bool = False):
+        with self._lock:
+            pooled = self._in_use.pop(id(connection), None)
+        if pooled is None:
+            return
+
+        if not discard:
+            try:
+                # Незавершённая транзакция не должна достаться следующему запросу
+                if connection.in_transaction:
+                    connection.rollback()
+            except Exception:
+                discard = True
+
+        now = time.monotonic()
+        if discard or self._is_expired(pooled, now):
+            with self._lock:
+                self._size -= 1
+                self._lock.notify()
+            self._close(pooled)
+            self.fill_async()
+            return
+
+        pooled.last_used = now
+        with self._lock:
+            self._idle.append(pooled)
+            self._lock.notify()
+
+    def statement_cache(self, connection) -> Dict[str, object]:
+        with self._lock:
+            pooled = self._in_use.get(id(connection))
+        return pooled.statements if pooled is not None else {}
+
+    @contextmanager
+    def connection(self):
+        connection = self.acquire()
+        discard = False
+        try:
+            yield connection
+        except Exception as e:
+            # Соединение могло оборваться или в нём остался недочитанный результат - в пул его не возвращаем
+            discard = isinstance(e, mysql.connector.errors.OperationalError) or getattr(e, 'discard_connection', False)
+            raise
+        finally:
+            self.release(connection, discard=discard)
+
+    def close_all(self):
+        with self._lock:
+            idle = list(self._idle)
+            self._idle.clear()
+            self._size -= len(idle)
+            self._lock.notify_all()
+        for pooled in idle:
+            self._close(pooled)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                'size': self._size,
+                'idle': len(self._idle),
+                'in_use': len(self._in_use),
+                'waiting': self._waiting,
+                'min_size': self.min_size,
+                'max_size': self.max_size,
+                'checkouts': self._checkouts,
+                'timeouts': self._timeouts,
+                'created': self._created,
+                'closed': self._closed,
+                'total_wait_time': round(self._total_wait_time, 6),
+                'avg_wait_time': round(self._total_wait_time / self._checkouts, 6) if self._checkouts else 0.0,
+                'max_wait_time': round(self._max_wait_time, 6)
+            }
@@ -0,0 +1,224 @@
+import heapq
+import itertools
+import mysql.connector
+import re
+import threading
+import time
+from flask import has_request_context, request
+from mysql.connector import errorcode
+from typing import Callable, Dict, List, Optional, Tuple
+
+_SELECT_RE = re.compile(r'^\s*SELECT\b', re.IGNORECASE)
+# Сколько запросов с подсказкой MAX_EXECUTION_TIME держим готовыми
+HINT_CACHE_SIZE = 1024
+
+
+class QueryLimitError(Exception):
+    """Запрос остановлен governor'ом"""
+    status_code = 503
+    # Соединение с недочитанным результатом нельзя возвращать в пул
+    discard_connection = False
+
+
+class QueryTimeoutError(QueryLimitError):
+    status_code = 503
+
+
+class QueryRowLimitError(QueryLimitError):
+    status_code = 413
+    discard_connection = True
+
+
+class QueryLimits:
+    def __init__(self, timeout: Optional[float] = None, max_rows: Optional[int] = None):
+        self.timeout = timeout
+        self.max_rows = max_rows
+
+
+class _Watchdog:
+    """Один фоновый поток на все запросы: по истечении срока вызывает callback (KILL QUERY).
+
+    cancel дожидается уже начатого callback: пока он не закончен, соединение не вернётся в пул,
+    и KILL QUERY не попадёт в чужой запрос на том же соединении.
+    """
+
+    def __init__(self):
+        self._heap: List = []
+        # Запланированные и ещё не сработавшие; отменённые остаются в куче до своего срока
+        self._active = set()
+        self._running: Optional[int] = None
+        self._counter = itertools.count()
+        self._lock = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+
+    def schedule(self, delay: float, callback: Callable) -> int:
+        token = next(self._counter)
+        with self._lock:
+            heapq.heappush(self._heap, (time.monotonic() + delay, token, callback))
+            self._active.add(token)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='query-watchdog', daemon=True)
+                self._thread.start()
+            self._lock.notify()
+        return token
+
+    def cancel(self, token: int):
+        with self._lock:
+            self._active.discard(token)
+            while self._running == token:
+                self._lock.wait()
+
+    def _run(self):
+        while True:
+            with self._lock:
+                while not self._heap:
+                    self._lock.wait()
+                deadline, token, callback = self._heap[0]
+                if token not in self._active:
+                    heapq.heappop(self._heap)
+                    continue
+                remaining = deadline - time.monotonic()
+                if remaining > 0:
+                    self._lock.wait(remaining)
+                    continue
+                heapq.heappop(self._heap)
+                self._active.discard(token)
+                self._running = token
+            try:
+                callback()
+            except Exception as e:
+                print(f"Query watchdog callback failed: {str(e)}")
+            finally:
+                with self._lock:
+                    self._running = None
+                    self._lock.notify_all()
+
+
+class QueryWatch:
+    def __init__(self):
+        self.token: Optional[int] = None
+        self.killed = False
+
+
+class QueryGovernor:
+    """Ограничения времени выполнения и числа строк с настройками по blueprint'ам"""
+
+    def __init__(
+        self,
+        default: Optional[QueryLimits] = None,
+        blueprint_limits: Optional[Dict[str, QueryLimits]] = None,
+        kill_grace: float = 1.0
+    ):
+        self.default = default or QueryLimits()
+        self.blueprint_limits = blueprint_limits or {}
+        self.kill_grace = kill_grace
+        self._watchdog = _Watchdog()
+        self._lock = threading.Lock()
+        self._counters: Dict[str, Dict[str, int]] = {}
+        # (запрос, мс) -> запрос с подсказкой. Подготовленный курсор mysql-connector переподготавливает
+        # запрос, если получил не тот же объект строки (проверка `is`), поэтому строку с подсказкой
+        # нужно строить один раз и дальше отдавать тот же объект
+        self._hinted: Dict[Tuple[str, int], str] = {}
+
+    def resolve(self, limits: Optional[QueryLimits], blueprint: Optional[str]) -> QueryLimits:
+        if limits is not None:
+            return limits
+        return self.blueprint_limits.get(blueprint, self.default)
+
+    def add_hint(self, query: str, limits: QueryLimits) -> str:
+        """Подсказка MAX_EXECUTION_TIME: сервер сам прервёт SELECT по истечении времени"""
+        if not limits.timeout or not _SELECT_RE.match(query):
+            return query
+        milliseconds = int(limits.timeout * 1000)
+        key = (query, milliseconds)
+        hinted = self._hinted.get(key)
+        if hinted is None:
+            hinted = _SELECT_RE.sub(f"SELECT /*+ MAX_EXECUTION_TIME({milliseconds}) */", query, count=1)
+            with self._lock:
+                # Произвольные запросы из админки не должны раздувать кеш без предела
+                if len(self._hinted) >= HINT_CACHE_SIZE:
+                    self._hinted.clear()
+                hinted = self._hinted.setdefault(key, hinted)
+        return hinted
+
+    def watch(self, connection_params: Dict, connection, limits: QueryLimits) -> Optional[QueryWatch]:
+        """Страховка для запросов, на которые подсказка не действует (INSERT/UPDATE, зависший сервер)"""
+        if not limits.timeout:
+            return None
+        watch = QueryWatch()
+        connection_id = connection.connection_id
+        # Срабатывает в потоке watchdog, где контекста запроса уже нет
+        blueprint = self._blueprint()
+
+        def kill():
+            watch.killed = True
+            self.kill_query(connection_params, connection_id, blueprint)
+
+        watch.token = self._watchdog.schedule(limits.timeout + self.kill_grace, kill)
+        return watch
+
+    def unwatch(self, watch: Optional[QueryWatch]):
+        """Вызывается до возврата соединения в пул: ждёт KILL QUERY, если он уже начат"""
+        if watch is not None:
+            self._watchdog.cancel(watch.token)
+
+    def kill_query(self, connection_params: Dict, connection_id: int, blueprint: Optional[str] = None):
+        # Отдельное соединение: занятое выполняет тот самый запрос
+        self._count('kills', blueprint)
+        connection = mysql.connector.connect(**connection_params)
+        try:
+            cursor = connection.cursor()
+            cursor.execute(f"KILL QUERY {int(connection_id)}")
+            cursor.close()
+        finally:
+            connection.close()
+
+    def fetch(self, cursor, limits: QueryLimits, connection_params: Dict, connection) -> List:
+        if not limits.max_rows:
+            return cursor.fetchall()
+        rows = cursor.fetchmany(limits.max_rows + 1)
+        if len(rows) > limits.max_rows:
+            self.row_limit_exceeded(limits, connection_params, connection)
+        return rows
+
+    def row_limit_exceeded(self, limits: QueryLimits, connection_params: Dict, connection):
+        self._count('row_limit_hits')
+        try:
+            self.kill_query(connection_params, connection.connection_id)
+        except Exception as e:
+            print(f"KILL QUERY failed: {str(e)}")
+        raise QueryRowLimitError(f"Результат превышает {limits.max_rows} строк")
+
+    def translate(self, error: Exception, watch: Optional[QueryWatch]) -> Exception:
+        """Ошибки прерывания запроса сервером превращаются в QueryTimeoutError"""
+        errno = getattr(error, 'errno', None)
+        killed = watch is not None and watch.killed
+        if errno == errorcode.ER_QUERY_TIMEOUT or (killed and errno == errorcode.ER_QUERY_INTERRUPTED):
+            self._count('timeouts')
+            return QueryTimeoutError("Превышено время выполнения запроса")
+        return error
+
+    def _blueprint(self) -> Optional[str]:
+        return request.blueprint if has_request_context() else None
+
+    def _count(self, counter: str, blueprint: Optional[str] = None):
+        blueprint = blueprint or self._blueprint()
+        with self._lock:
+            counters = self._counters.setdefault(blueprint or '-', {'timeouts': 0, 'row_limit_hits': 0, 'kills': 0})
+            counters[counter] += 1
+
+    def stats(self) -> Dict:
+        with self._lock:
+            by_blueprint = {name: dict(counters) for name, counters in self._counters.items()}
+        totals = {'timeouts': 0, 'row_limit_hits': 0, 'kills': 0}
+        for counters in by_blueprint.values():
+            for name, value in counters.items():
+                totals[name] += value
+        return {
+            'totals': totals,
+            'by_blueprint': by_blueprint,
+            'limits': {
+                name: {'timeout': limits.timeout, 'max_rows': limits.max_rows}
+                for name, limits in dict(self.blueprint_limits, default=self.default).items()
+            }
+        }
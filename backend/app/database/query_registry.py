@@ -0,0 +1,49 @@
+import pathlib
+from typing import Dict, Iterable, Optional
+
+
+class QueryNotFoundError(KeyError):
+    """Запрошенный .sql файл отсутствует в реестре"""
+
+
+class QueryRegistry:
+    """Реестр SQL запросов: все файлы из sql_queries читаются один раз при старте"""
+
+    def __init__(self, sql_path: pathlib.Path):
+        self.sql_path = sql_path
+        self._queries: Dict[str, str] = {}
+        self._names: Dict[str, str] = {}
+
+    def load(self):
+        if not self.sql_path.is_dir():
+            raise FileNotFoundError(f"Каталог с запросами не найден: {self.sql_path}")
+
+        queries = {}
+        for path in sorted(self.sql_path.rglob('*.sql')):
+            name = path.relative_to(self.sql_path).as_posix()
+            # Завершающая ";" не нужна драйверу и мешает серверной подготовке запроса
+            queries[name] = path.read_text(encoding='utf-8').strip().rstrip(';').rstrip()
+
+        self._queries = queries
+        self._names = {text: name for name, text in queries.items()}
+
+    def require(self, names: Iterable[str]):
+        missing = [name for name in names if name not in self._queries]
+        if missing:
+            raise QueryNotFoundError(f"Не найдены SQL файлы: {', '.join(missing)}")
+
+    def get(self, name: str) -> str:
+        try:
+            return self._queries[name]
+        except KeyError:
+            raise QueryNotFoundError(f"SQL файл не найден: {name}") from None
+
+    def name_of(self, query: str) -> Optional[str]:
+        """Имя файла по тексту запроса, полученному через get()"""
+        return self._names.get(query)
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._queries
+
+    def __len__(self) -> int:
+        return len(self._queries)
@@ -0,0 +1,133 @@
+import hashlib
+import json
+import logging
+import re
+import threading
+from collections import deque
+from typing import Deque, Dict, List, Optional
+
+slow_query_logger = logging.getLogger('app.slow_query')
+
+_WHITESPACE_RE = re.compile(r'\s+')
+
+# Ключ, в который складываются запросы сверх лимита различных ключей
+OVERFLOW_KEY = 'other'
+
+
+def normalize_query(query: str) -> str:
+    return _WHITESPACE_RE.sub(' ', query).strip().rstrip(';').strip()
+
+
+def inline_key(query: str) -> str:
+    """Ключ для запроса, написанного прямо в коде: короткий хэш нормализованного текста"""
+    digest = hashlib.sha1(normalize_query(query).encode('utf-8')).hexdigest()
+    return f"inline:{digest[:12]}"
+
+
+def redact_params(params) -> Optional[object]:
+    """Оставляет только типы параметров: значения (логины, хэши, паспорта) в лог не попадают"""
+    if params is None:
+        return None
+    if isinstance(params, dict):
+        return {key: type(value).__name__ for key, value in params.items()}
+    # Для пакетных вставок параметров тысячи, в журнал хватит начала списка
+    return [type(value).__name__ for value in list(params)[:50]]
+
+
+def _percentile(sorted_values: List[float], fraction: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+class QueryMetrics:
+    def __init__(self, key: str, text: str, sample_size: int):
+        self.key = key
+        self.text = text
+        self.calls = 0
+        self.errors = 0
+        self.total_time = 0.0
+        self.max_time = 0.0
+        self.rows_returned = 0
+        self.rows_affected = 0
+        # Последние замеры, по ним считаются перцентили
+        self.samples: Deque[float] = deque(maxlen=sample_size)
+
+    def snapshot(self) -> Dict:
+        samples = sorted(self.samples)
+        return {
+            'key': self.key,
+            'query': self.text[:300],
+            'calls': self.calls,
+            'errors': self.errors,
+            'total_ms': round(self.total_time * 1000, 3),
+            'avg_ms': round(self.total_time * 1000 / self.calls, 3) if self.calls else 0.0,
+            'p50_ms': round(_percentile(samples, 0.50) * 1000, 3),
+            'p95_ms': round(_percentile(samples, 0.95) * 1000, 3),
+            'p99_ms': round(_percentile(samples, 0.99) * 1000, 3),
+            'max_ms': round(self.max_time * 1000, 3),
+            'rows_returned': self.rows_returned,
+            'rows_affected': self.rows_affected
+        }
+
+
+class QueryStats:
+    """Потокобезопасная статистика выполнения запросов и журнал медленных запросов"""
+
+    def __init__(self, slow_threshold: float = 0.5, sample_size: int = 1000, max_keys: int = 500):
+        self.slow_threshold = slow_threshold
+        self.sample_size = sample_size
+        self.max_keys = max_keys
+        self._metrics: Dict[str, QueryMetrics] = {}
+        self._lock = threading.Lock()
+
+    def record(
+        self,
+        key: str,
+        query: str,
+        params,
+        duration: float,
+        rows_returned: int = 0,
+        rows_affected: int = 0,
+        error: Optional[BaseException] = None
+    ):
+        with self._lock:
+            metrics = self._metrics.get(key)
+            if metrics is None:
+                if len(self._metrics) >= self.max_keys:
+                    key = OVERFLOW_KEY
+                    metrics = self._metrics.get(key)
+                if metrics is None:
+                    metrics = QueryMetrics(key, normalize_query(query), self.sample_size)
+                    self._metrics[key] = metrics
+
+            metrics.calls += 1
+            metrics.total_time += duration
+            metrics.max_time = max(metrics.max_time, duration)
+            metrics.samples.append(duration)
+            metrics.rows_returned += max(rows_returned, 0)
+            metrics.rows_affected += max(rows_affected, 0)
+            if error is not None:
+                metrics.errors += 1
+
+        if duration >= self.slow_threshold:
+            slow_query_logger.warning(json.dumps({
+                'event': 'slow_query',
+                'key': key,
+                'duration_ms': round(duration * 1000, 3),
+                'rows_returned': rows_returned,
+                'rows_affected': rows_affected,
+                'error': type(error).__name__ if error is not None else None,
+                'query': normalize_query(query)[:1000],
+                'params': redact_params(params)
+            }, ensure_ascii=False))
+
+    def snapshot(self) -> List[Dict]:
+        with self._lock:
+            result = [metrics.snapshot() for metrics in self._metrics.values()]
+        return sorted(result, key=lambda item: item['total_ms'], reverse=True)
+
+    def reset(self):
+        with self._lock:
+            self._metrics.clear()
@@ -0,0 +1,101 @@
+import math
+from typing import Dict, List, Optional, Tuple
+from app.database.redis_provider import RedisProvider
+
+# Хеш со счётчиками отказов по всем воркерам
+REJECTED_KEY = 'ratelimit:rejected'
+
+# Token bucket на несколько ключей сразу: токен списывается только если он есть во всех корзинах.
+# KEYS - корзины и последним хеш счётчиков отказов, ARGV - пары (ёмкость, пополнение в секунду)
+# и метки корзин для счётчика отказов.
+# Возвращает {1, 0} или {0, миллисекунды до появления токена, номер отказавшей корзины}.
+_TOKEN_BUCKET_LUA = """
+local time = redis.call('TIME')
+local now = tonumber(time[1]) + tonumber(time[2]) / 1000000
+local count = #KEYS - 1
+local tokens = {}
+for i = 1, count do
+    local burst = tonumber(ARGV[2 * i - 1])
+    local rate = tonumber(ARGV[2 * i])
+    local state = redis.call('HMGET', KEYS[i], 'tokens', 'ts')
+    local value = tonumber(state[1])
+    local ts = tonumber(state[2])
+    if value == nil then
+        value = burst
+    else
+        value = math.min(burst, value + math.max(0, now - ts) * rate)
+    end
+    if value < 1 then
+        redis.call('HINCRBY', KEYS[#KEYS], ARGV[2 * count + i], 1)
+        return {0, math.ceil((1 - value) / rate * 1000), i}
+    end
+    tokens[i] = value
+end
+for i = 1, count do
+    local burst = tonumber(ARGV[2 * i - 1])
+    local rate = tonumber(ARGV[2 * i])
+    redis.call('HSET', KEYS[i], 'tokens', tokens[i] - 1, 'ts', now)
+    -- Полная корзина ничем не отличается от отсутствующей
+    redis.call('EXPIRE', KEYS[i], math.ceil(burst / rate) + 1)
+end
+return {1, 0}
+"""
+
+
+class Bucket:
+    def __init__(self, name: str, burst: int, refill_rate: float):
+        """refill_rate - токенов в секунду"""
+        self.name = name
+        self.burst = burst
+        self.refill_rate = refill_rate
+
+
+class RateLimiter:
+    """Ограничение частоты попыток по нескольким признакам (IP, логин) одним атомарным вызовом Lua"""
+
+    def __init__(self, buckets: Dict[str, Bucket], prefix: str = 'ratelimit'):
+        self.buckets = buckets
+        self.prefix = prefix
+        self._script = None
+
+    def _get_script(self):
+        if self._script is None:
+            self._script = RedisProvider.register_script(_TOKEN_BUCKET_LUA)
+        return self._script
+
+    def hit(self, values: Dict[str, Optional[str]]) -> Tuple[bool, float]:
+        """values: имя корзины -> значение ключа (None пропускается).
+
+        Возвращает (разрешено, через сколько секунд повторить).
+        """
+        keys: List[str] = []
+        args: List = []
+        labels: List[str] = []
+        for name, value in values.items():
+            if value is None:
+                continue
+            bucket = self.buckets[name]
+            keys.append(f"{self.prefix}:{bucket.name}:{value}")
+            args.extend([bucket.burst, bucket.refill_rate])
+            labels.append(bucket.name)
+        if not keys:
+            return True, 0.0
+        # Все ключи, которые трогает скрипт, передаются в KEYS - этого требуют Redis Cluster и прокси
+        result = self._get_script()(keys=keys + [REJECTED_KEY], args=args + labels)
+        if result[0] == 1:
+            return True, 0.0
+        return False, result[1] / 1000
+
+    def stats(self) -> Dict:
+        rejected = RedisProvider.get_client().hgetall(REJECTED_KEY)
+        return {
+            'buckets': {
+                name: {'burst': bucket.burst, 'refill_rate': bucket.refill_rate}
+                for name, bucket in self.buckets.items()
+            },
+            'rejected': {name: int(value) for name, value in rejected.items()}
+        }
+
+
+def retry_after_header(seconds: float) -> str:
+    return str(max(1, math.ceil(seconds)))
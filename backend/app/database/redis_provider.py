@@ -1,19 +1,62 @@
 import redis
+from redis.backoff import ExponentialBackoff
+from redis.retry import Retry
 from typing import Optional
 
 class RedisProvider:
     _instance: Optional[redis.Redis] = None
+    _pool: Optional[redis.ConnectionPool] = None
 
     @classmethod
-    def initialize(cls, host: str, port: int):
-        cls._instance = redis.Redis(
+    def initialize(
+        cls,
+        host: str,
+        port: int,
+        max_connections: int = 50,
+        pool_timeout: float = 2.0,
+        socket_timeout: float = 1.0,
+        socket_connect_timeout: float = 1.0,
+        health_check_interval: int = 30,
+        retries: int = 2
+    ):
+        # Пул ограничен: при зависании Redis воркер ждёт свободное соединение не дольше pool_timeout,
+        # а каждая команда - не дольше socket_timeout с парой повторов
+        cls._pool = redis.BlockingConnectionPool(
             host=host,
             port=port,
-            decode_responses=True
+            decode_responses=True,
+            max_connections=max_connections,
+            timeout=pool_timeout,
+            socket_timeout=socket_timeout,
+            socket_connect_timeout=socket_connect_timeout,
+            health_check_interval=health_check_interval,
+            retry_on_timeout=True,
+            retry=Retry(ExponentialBackoff(cap=0.5, base=0.05), retries)
         )
+        cls._instance = redis.Redis(connection_pool=cls._pool)
     
     @classmethod
     def get_client(cls) -> redis.Redis:
         if cls._instance is None:
             raise RuntimeError("Redis client not initialized")
-        return cls._instance 
\ No newline at end of file
+        return cls._instance
+
+    @classmethod
+    def register_script(cls, script: str) -> redis.commands.core.Script:
+        """Lua скрипт, вызываемый по EVALSHA с автоматической загрузкой при NOSCRIPT"""
+        return cls.get_client().register_script(script)
+
+    @classmethod
+    def pipeline(cls, transaction: bool = False) -> redis.client.Pipeline:
+        """Пакет команд за один round trip. transaction=True оборачивает их в MULTI/EXEC"""
+        return cls.get_client().pipeline(transaction=transaction)
+
+    @classmethod
+    def get_pool_stats(cls) -> dict:
+        if cls._pool is None:
+            return {}
+        return {
+            'max_connections': cls._pool.max_connections,
+            'created': len(cls._pool._connections),
+            'available': cls._pool.pool.qsize()
+        }
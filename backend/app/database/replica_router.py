@@ -0,0 +1,106 @@
+import mysql.connector
+import threading
+import time
+from typing import Dict, List, Optional
+from app.database.connection_pool import ConnectionPool, PoolTimeoutError
+
+# Ошибки, после которых реплика считается недоступной и запрос повторяется на primary
+REPLICA_ERRORS = (
+    PoolTimeoutError,
+    mysql.connector.errors.InterfaceError,
+    mysql.connector.errors.OperationalError
+)
+
+
+class Replica:
+    def __init__(self, name: str, pool: ConnectionPool):
+        self.name = name
+        self.pool = pool
+        self.down_until = 0.0
+        self.lag: Optional[float] = None
+        self.last_check = 0.0
+        self.failures = 0
+        self._check_lock = threading.Lock()
+
+
+class ReplicaRouter:
+    """Выбор реплики для чтения: по кругу среди доступных и не отстающих"""
+
+    def __init__(
+        self,
+        replicas: List[Replica],
+        max_lag: float = 5.0,
+        check_interval: float = 5.0,
+        down_cooldown: float = 10.0
+    ):
+        self.replicas = replicas
+        self.max_lag = max_lag
+        self.check_interval = check_interval
+        self.down_cooldown = down_cooldown
+        self._next = 0
+        self._lock = threading.Lock()
+
+    def _check_lag(self, replica: Replica, now: float):
+        # Проверку делает один поток, остальные пользуются прошлым значением
+        if not replica._check_lock.acquire(blocking=False):
+            return
+        try:
+            replica.last_check = now
+            with replica.pool.connection() as connection:
+                cursor = connection.cursor(dictionary=True)
+                try:
+                    cursor.execute("SHOW REPLICA STATUS")
+                    status = cursor.fetchall()
+                finally:
+                    cursor.close()
+            lag = status[0].get('Seconds_Behind_Source') if status else None
+            if status and lag is None:
+                # NULL означает, что репликация остановлена: данные на реплике не обновляются
+                self.mark_down(replica)
+            replica.lag = float(lag) if lag is not None else None
+        except mysql.connector.errors.ProgrammingError:
+            # Нет прав REPLICATION CLIENT: отставание неизвестно, но сервер отвечает
+            replica.lag = None
+        except REPLICA_ERRORS:
+            self.mark_down(replica)
+        finally:
+            replica._check_lock.release()
+
+    def _is_available(self, replica: Replica, now: float) -> bool:
+        if replica.down_until > now:
+            return False
+        if now - replica.last_check >= self.check_interval:
+            self._check_lag(replica, now)
+        if replica.down_until > now:
+            return False
+        return replica.lag is None or replica.lag <= self.max_lag
+
+    def choose(self) -> Optional[Replica]:
+        if not self.replicas:
+            return None
+        now = time.monotonic()
+        with self._lock:
+            start = self._next
+            self._next = (self._next + 1) % len(self.replicas)
+        for offset in range(len(self.replicas)):
+            replica = self.replicas[(start + offset) % len(self.replicas)]
+            if self._is_available(replica, now):
+                return replica
+        return None
+
+    def mark_down(self, replica: Replica):
+        replica.failures += 1
+        replica.down_until = time.monotonic() + self.down_cooldown
+
+    def stats(self) -> List[Dict]:
+        now = time.monotonic()
+        return [
+            {
+                'name': replica.name,
+                'available': replica.down_until <= now,
+                'lag': replica.lag,
+                'failures': replica.failures,
+                'pool': replica.pool.stats()
+            }
+            for replica in self.replicas
+        ]
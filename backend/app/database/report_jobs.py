@@ -0,0 +1,174 @@
+import hashlib
+import json
+import time
+import uuid
+from typing import Dict, Optional, Tuple
+from app.database.redis_provider import RedisProvider
+
+# Очередь id задач: новые добавляются слева, воркеры забирают справа
+QUEUE_KEY = 'reportjobs:queue'
+# Блокирующее ожидание задачи должно быть короче socket_timeout клиента Redis
+CLAIM_TIMEOUT = 0.5
+
+JOB_QUEUED = 'queued'
+JOB_RUNNING = 'running'
+JOB_DONE = 'done'
+JOB_FAILED = 'failed'
+
+# Ставит задачу в очередь, если такая же (тот же пользователь, тип и параметры) ещё не выполняется.
+# Возвращает {id задачи, 1 - создана / 0 - найдена существующая}
+_ENQUEUE_LUA = """
+local existing = redis.call('GET', KEYS[1])
+if existing then
+    local status = redis.call('HGET', 'reportjob:' .. existing, 'status')
+    if status == 'queued' or status == 'running' then
+        return {existing, 0}
+    end
+end
+redis.call('HSET', KEYS[3],
+    'status', 'queued', 'progress', 0, 'user_id', ARGV[2], 'report_type_id', ARGV[3],
+    'parameters', ARGV[4], 'created_at', ARGV[5], 'dedup_key', KEYS[1])
+redis.call('EXPIRE', KEYS[3], ARGV[6])
+redis.call('SET', KEYS[1], ARGV[1], 'EX', ARGV[6])
+redis.call('LPUSH', KEYS[2], ARGV[1])
+return {ARGV[1], 1}
+"""
+
+# Переводит задачу в running и возвращает её поля. Хеш, истёкший пока задача ждала в очереди,
+# не создаётся заново: id просто убирается из списка processing воркера, возвращается пустой список
+_CLAIM_LUA = """
+if redis.call('HEXISTS', KEYS[1], 'report_type_id') == 0 then
+    redis.call('DEL', KEYS[1])
+    redis.call('LREM', KEYS[2], 1, ARGV[1])
+    return {}
+end
+redis.call('HSET', KEYS[1], 'status', 'running', 'started_at', ARGV[2], 'worker', ARGV[3])
+redis.call('EXPIRE', KEYS[1], ARGV[4])
+return redis.call('HGETALL', KEYS[1])
+"""
+
+# Обновляет поля задачи, только если её хеш ещё существует
+_UPDATE_LUA = """
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    return 0
+end
+redis.call('HSET', KEYS[1], unpack(ARGV, 2))
+redis.call('EXPIRE', KEYS[1], ARGV[1])
+return 1
+"""
+
+
+def _job_key(job_id: str) -> str:
+    return f"reportjob:{job_id}"
+
+
+def _processing_key(worker: str) -> str:
+    return f"reportjobs:processing:{worker}"
+
+
+class ReportJobQueue:
+    """Очередь генерации отчётов в Redis.
+
+    Задача - хеш reportjob:{id} со статусом, прогрессом и результатом. Воркер перекладывает id
+    из общей очереди в свой список processing (BLMOVE), поэтому задачи упавшего воркера
+    не теряются: при перезапуске он возвращает их в очередь.
+    """
+
+    def __init__(self, job_ttl: int = 86400):
+        self.job_ttl = job_ttl
+        self._enqueue_script = None
+        self._claim_script = None
+        self._update_script = None
+
+    def enqueue(self, user_id, report_type_id, parameters: Dict) -> Tuple[str, bool]:
+        """(id задачи, создана ли новая) - одинаковый запрос, пока он выполняется, вернёт ту же задачу"""
+        if self._enqueue_script is None:
+            self._enqueue_script = RedisProvider.register_script(_ENQUEUE_LUA)
+        parameters_json = json.dumps(parameters, sort_keys=True, separators=(',', ':'))
+        digest = hashlib.sha1(f"{user_id}:{report_type_id}:{parameters_json}".encode('utf-8')).hexdigest()
+        job_id = uuid.uuid4().hex
+        result = self._enqueue_script(
+            keys=[f"reportjobs:dedup:{digest}", QUEUE_KEY, _job_key(job_id)],
+            args=[job_id, user_id, report_type_id, parameters_json, time.time(), self.job_ttl]
+        )
+        return result[0], result[1] == 1
+
+    def get(self, job_id: str) -> Optional[Dict]:
+        job = RedisProvider.get_client().hgetall(_job_key(job_id))
+        if not job:
+            return None
+        job['id'] = job_id
+        return job
+
+    def claim(self, worker: str) -> Optional[Dict]:
+        """Забирает следующую задачу или None, если очередь пуста"""
+        client = RedisProvider.get_client()
+        job_id = client.blmove(QUEUE_KEY, _processing_key(worker), CLAIM_TIMEOUT, 'RIGHT', 'LEFT')
+        if job_id is None:
+            return None
+        if self._claim_script is None:
+            self._claim_script = RedisProvider.register_script(_CLAIM_LUA)
+        values = self._claim_script(
+            keys=[_job_key(job_id), _processing_key(worker)],
+            args=[job_id, time.time(), worker, self.job_ttl]
+        )
+        if not values:
+            # Хеш истёк, пока задача ждала в очереди
+            return None
+        job = dict(zip(values[::2], values[1::2]))
+        job['id'] = job_id
+        return job
+
+    def progress(self, job_id: str, percent: int):
+        self._update(job_id, {'progress': percent})
+
+    def _update(self, job_id: str, fields: Dict) -> bool:
+        """False, если хеш задачи уже истёк - тогда он не создаётся заново"""
+        if self._update_script is None:
+            self._update_script = RedisProvider.register_script(_UPDATE_LUA)
+        args = [self.job_ttl]
+        for name, value in fields.items():
+            args += [name, value]
+        return self._update_script(keys=[_job_key(job_id)], args=args) == 1
+
+    def complete(self, worker: str, job: Dict, result: str, report_id: Optional[int]):
+        """result - готовый JSON ответа"""
+        self._finish(worker, job['id'], job.get('dedup_key'), {
+            'status': JOB_DONE,
+            'progress': 100,
+            'result': result,
+            'report_id': report_id or '',
+            'finished_at': time.time()
+        })
+
+    def fail(self, worker: str, job: Dict, error: str):
+        self._finish(worker, job['id'], job.get('dedup_key'), {
+            'status': JOB_FAILED,
+            'error': error,
+            'finished_at': time.time()
+        })
+
+    def _finish(self, worker: str, job_id: str, dedup_key: Optional[str], fields: Dict):
+        pipe = RedisProvider.pipeline(transaction=True)
+        pipe.hset(_job_key(job_id), mapping=fields)
+        pipe.expire(_job_key(job_id), self.job_ttl)
+        # Законченная задача больше не мешает поставить такую же заново
+        if dedup_key:
+            pipe.delete(dedup_key)
+        pipe.lrem(_processing_key(worker), 1, job_id)
+        pipe.execute()
+
+    def requeue_orphaned(self, worker: str) -> int:
+        """Возвращает в очередь задачи, которые воркер с этим именем взял, но не закончил"""
+        client = RedisProvider.get_client()
+        count = 0
+        # Справа в очереди - следующие к выдаче: начинаем с последней взятой, чтобы сохранить порядок
+        while client.lmove(_processing_key(worker), QUEUE_KEY, 'LEFT', 'RIGHT') is not None:
+            count += 1
+        return count
+
+    def stats(self) -> Dict:
+        return {
+            'queued': RedisProvider.get_client().llen(QUEUE_KEY),
+            'job_ttl': self.job_ttl
+        }
@@ -0,0 +1,191 @@
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+from typing import Callable, Dict, Iterable, Optional, Tuple
+import redis
+from flask import current_app, request
+from app.database.redis_provider import RedisProvider
+from app.utils.conditional import content_etag
+
+# Хеш версий тегов: тег -> число, растущее при каждой инвалидации
+TAGS_KEY = 'cache:tags'
+# Тег, входящий в каждую запись: его инвалидация сбрасывает кеш целиком
+ALL_TAGS = '*'
+
+
+class ResponseCache:
+    """Кеш готовых JSON ответов: Redis, общий для воркеров, и LRU в памяти воркера.
+
+    Ключ записи включает версии её тегов, поэтому инвалидация - это просто HINCRBY версии тега:
+    старые записи больше никто не прочитает, и они истекают по TTL. Версии тегов воркер
+    перечитывает не чаще local_ttl, так что изменение с другого воркера становится видно
+    с задержкой не больше этого интервала. Без Redis ответы просто считаются заново.
+    """
+
+    def __init__(self, ttl: int = 300, local_ttl: float = 5.0, max_local_entries: int = 1000):
+        self.ttl = ttl
+        self.local_ttl = local_ttl
+        self.max_local_entries = max_local_entries
+        self._local: 'OrderedDict[str, tuple]' = OrderedDict()
+        self._lock = threading.Lock()
+        self._versions: Dict[str, str] = {}
+        self._versions_at = 0.0
+        # Версии прочитаны из Redis при последнем обновлении; иначе они могут отставать без предела
+        self._versions_ok = False
+        # name -> [из памяти, из Redis, промахи]
+        self._counters: Dict[str, list] = {}
+
+    def _count(self, name: str, index: int):
+        with self._lock:
+            self._counters.setdefault(name, [0, 0, 0])[index] += 1
+
+    def _refresh_versions(self):
+        if time.monotonic() - self._versions_at < self.local_ttl:
+            return
+        try:
+            self._versions = RedisProvider.get_client().hgetall(TAGS_KEY)
+            self._versions_ok = True
+        except redis.RedisError as e:
+            print(f"Response cache tags read failed: {str(e)}")
+            self._versions_ok = False
+        self._versions_at = time.monotonic()
+
+    def _key(self, name: str, key: str, tags: Iterable[str]) -> str:
+        self._refresh_versions()
+        stamp = '.'.join(self._versions.get(tag, '0') for tag in (ALL_TAGS, *tags))
+        return f"cache:{name}:{stamp}:{key}"
+
+    def validator(self, name: str, key: str, tags: Iterable[str]) -> Optional[str]:
+        """ETag по версиям тегов: меняется при любой инвалидации, без выполнения запросов.
+        None, если версии не удалось прочитать - тогда ETag считается по телу ответа"""
+        cache_key = self._key(name, key, tags)
+        if not self._versions_ok:
+            return None
+        return content_etag(cache_key.encode('utf-8'))
+
+    def get(self, name: str, key: str, tags: Iterable[str]) -> Tuple[str, Optional[str]]:
+        """(ключ записи, значение или None) - ключ передаётся в put после вычисления ответа"""
+        cache_key = self._key(name, key, tags)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._local.get(cache_key)
+            if entry is not None and entry[0] >= now:
+                self._local.move_to_end(cache_key)
+                self._counters.setdefault(name, [0, 0, 0])[0] += 1
+                return cache_key, entry[1]
+        try:
+            value = RedisProvider.get_client().get(cache_key)
+        except redis.RedisError as e:
+            print(f"Response cache read failed: {str(e)}")
+            value = None
+        if value is None:
+            self._count(name, 2)
+            return cache_key, None
+        self._count(name, 1)
+        self._put_local(cache_key, value)
+        return cache_key, value
+
+    def put(self, cache_key: str, value: str):
+        self._put_local(cache_key, value)
+        try:
+            RedisProvider.get_client().set(cache_key, value, ex=self.ttl)
+        except redis.RedisError as e:
+            print(f"Response cache store failed: {str(e)}")
+
+    def _put_local(self, cache_key: str, value: str):
+        with self._lock:
+            self._local[cache_key] = (time.monotonic() + self.local_ttl, value)
+            self._local.move_to_end(cache_key)
+            while len(self._local) > self.max_local_entries:
+                self._local.popitem(last=False)
+
+    def invalidate(self, *tags: str):
+        """Сбрасывает записи с любым из тегов; на этом воркере - сразу, на остальных - за local_ttl"""
+        if not tags:
+            return
+        try:
+            pipe = RedisProvider.pipeline(transaction=True)
+            for tag in tags:
+                pipe.hincrby(TAGS_KEY, tag, 1)
+            versions = pipe.execute()
+        except redis.RedisError as e:
+            # Данные уже изменены - не роняем запрос; остальные воркеры увидят изменение через TTL
+            print(f"Response cache invalidation failed: {str(e)}")
+            with self._lock:
+                self._local.clear()
+            return
+        self._versions.update({tag: str(version) for tag, version in zip(tags, versions)})
+
+    def invalidate_all(self):
+        self.invalidate(ALL_TAGS)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            counters = {name: list(values) for name, values in self._counters.items()}
+            size = len(self._local)
+        return {
+            'ttl': self.ttl,
+            'local_ttl': self.local_ttl,
+            'local_size': size,
+            'max_local_entries': self.max_local_entries,
+            'endpoints': {
+                name: {'local_hits': local_hits, 'redis_hits': redis_hits, 'misses': misses}
+                for name, (local_hits, redis_hits, misses) in counters.items()
+            }
+        }
+
+
+def cached_response(*tags: str):
+    """Кеширует успешный JSON ответ эндпоинта по пути и строке запроса.
+
+    Вместе с телом хранится его ETag: на If-None-Match из кеша отвечаем 304, не собирая ответ.
+    Ставится под login_required/role_required, чтобы проверка доступа выполнялась всегда.
+    """
+    def decorator(f):
+        @wraps(f)
+        def wrapper(*args, **kwargs):
+            cache: ResponseCache = current_app.config['response_cache']
+            cache_key, value = cache.get(request.endpoint, request.full_path, tags)
+            if value is not None:
+                etag, content_type, body = value.split('\n', 2)
+                if request.if_none_match.contains(etag):
+                    response = current_app.response_class(status=304)
+                else:
+                    response = current_app.response_class(body, content_type=content_type)
+                response.set_etag(etag)
+                return response
+            response = current_app.make_response(f(*args, **kwargs))
+            if response.status_code == 200 and response.is_json:
+                etag = content_etag(response.get_data())
+                response.set_etag(etag)
+                cache.put(cache_key, f"{etag}\n{response.content_type}\n{response.get_data(as_text=True)}")
+            return response
+        return wrapper
+    return decorator
+
+
+def versioned_response(*tags: str, vary: Optional[Callable[[], str]] = None):
+    """ETag ответа по версиям тегов и пользователю: на If-None-Match отвечаем 304, не выполняя запросы.
+
+    Для персональных ответов, которые не стоит хранить в кеше. Каждое изменение данных ответа
+    должно инвалидировать один из тегов. vary - то, от чего ответ зависит помимо данных
+    (например, текущая минута для признака "приём прошёл"). Ставится под login_required.
+    """
+    def decorator(f):
+        @wraps(f)
+        def wrapper(*args, **kwargs):
+            key = f"{request.user_id}:{request.full_path}"
+            if vary is not None:
+                key = f"{key}:{vary()}"
+            etag = current_app.config['response_cache'].validator(request.endpoint, key, tags)
+            if etag is not None and request.if_none_match.contains(etag):
+                response = current_app.response_class(status=304)
+                response.set_etag(etag)
+                return response
+            response = current_app.make_response(f(*args, **kwargs))
+            if etag is not None and response.status_code == 200:
+                response.set_etag(etag)
+            return response
+        return wrapper
+    return decorator
@@ -0,0 +1,132 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional
+from app.database.redis_provider import RedisProvider
+
+# Канал, по которому воркеры сообщают друг другу об отозванных сессиях
+INVALIDATION_CHANNEL = 'session:invalidate'
+# Сообщение, сбрасывающее кеш целиком
+INVALIDATE_ALL = '*'
+
+
+class SessionCache:
+    """Кеш расшифрованных сессий в памяти воркера: LRU по числу записей и короткий TTL.
+
+    Отзыв сессии рассылается через Redis pub/sub, поэтому logout действует на всех воркерах сразу.
+    Пока подписка не активна, кеш не используется и каждый запрос идёт в Redis.
+    """
+
+    def __init__(self, max_entries: int = 10000, ttl: float = 5.0):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: 'OrderedDict[str, tuple]' = OrderedDict()
+        self._lock = threading.Lock()
+        self._listening = False
+        self._listener_pid: Optional[int] = None
+        # Растёт при каждом отзыве: запись, прочитанная из Redis до отзыва, в кеш не попадёт
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+
+    def _ensure_listener(self):
+        # Поток подписки запускаем в каждом процессе отдельно: после fork он не наследуется
+        if self._listener_pid == os.getpid():
+            return
+        with self._lock:
+            if self._listener_pid == os.getpid():
+                return
+            self._listener_pid = os.getpid()
+            self._listening = False
+            self._entries.clear()
+        threading.Thread(target=self._listen, name='session-invalidation', daemon=True).start()
+
+    def _listen(self):
+        while True:
+            pubsub = None
+            try:
+                pubsub = RedisProvider.get_client().pubsub(ignore_subscribe_messages=False)
+                pubsub.subscribe(INVALIDATION_CHANNEL)
+                while True:
+                    # Опрос с таймаутом: при socket_timeout клиента блокирующий listen() падал бы на простое
+                    message = pubsub.get_message(timeout=1.0)
+                    if message is None:
+                        continue
+                    if message['type'] == 'subscribe':
+                        self._listening = True
+                    elif message['type'] == 'message':
+                        self._drop(message['data'])
+            except Exception as e:
+                print(f"Session invalidation listener failed: {str(e)}")
+            finally:
+                # Пока подписки нет, отзывы могли потеряться - не доверяем ничему в кеше
+                self._listening = False
+                self.clear()
+                if pubsub is not None:
+                    try:
+                        pubsub.close()
+                    except Exception:
+                        pass
+            time.sleep(1)
+
+    def _drop(self, session_id: str):
+        if session_id == INVALIDATE_ALL:
+            self.clear()
+            return
+        with self._lock:
+            self.generation += 1
+            self._entries.pop(session_id, None)
+
+    def get(self, session_id: str) -> Optional[Dict]:
+        self._ensure_listener()
+        if not self._listening:
+            return None
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(session_id)
+            if entry is None or entry[0] < now:
+                if entry is not None:
+                    del self._entries[session_id]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(session_id)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, session_id: str, session: Dict, generation: int):
+        """generation - значение self.generation, снятое до чтения сессии из Redis"""
+        if not self._listening:
+            return
+        with self._lock:
+            if generation != self.generation:
+                return
+            self._entries[session_id] = (time.monotonic() + self.ttl, session)
+            self._entries.move_to_end(session_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, session_id: str, pipe=None):
+        """Убирает сессию из кеша этого воркера и рассылает отзыв остальным.
+
+        Если передан pipe, PUBLISH добавляется в него и уходит вместе с остальными командами.
+        """
+        self._drop(session_id)
+        (pipe or RedisProvider.get_client()).publish(INVALIDATION_CHANNEL, session_id)
+
+    def clear(self):
+        with self._lock:
+            self.generation += 1
+            self._entries.clear()
+
+    def stats(self) -> Dict:
+        with self._lock:
+            size = len(self._entries)
+        return {
+            'size': size,
+            'max_entries': self.max_entries,
+            'ttl': self.ttl,
+            'listening': self._listening,
+            'hits': self.hits,
+            'misses': self.misses
+        }
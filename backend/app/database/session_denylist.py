@@ -0,0 +1,90 @@
+import threading
+import time
+from typing import Dict, Optional, Set
+from app.database.redis_provider import RedisProvider
+
+# Отозванные токены: jti с временем истечения в качестве score
+DENYLIST_KEY = 'session:denylist'
+# Массовый отзыв: user_id с моментом, раньше которого выданные токены недействительны
+USER_CUTOFFS_KEY = 'session:denylist:users'
+
+
+class SessionDenylist:
+    """Список отозванных подписанных токенов: хранится в Redis, каждый воркер держит копию в памяти.
+
+    Копия перечитывается не чаще refresh_interval, поэтому logout на другом воркере начинает
+    действовать с задержкой не больше этого интервала. Если Redis недоступен, работаем со старой копией.
+    """
+
+    def __init__(self, session_ttl: float, refresh_interval: float = 2.0):
+        self.session_ttl = session_ttl
+        self.refresh_interval = refresh_interval
+        self._revoked: Set[str] = set()
+        self._user_cutoffs: Dict[str, float] = {}
+        self._refreshed_at = 0.0
+        self._refresh_lock = threading.Lock()
+        self.refresh_errors = 0
+
+    def revoke(self, jti: str, expires_at: float):
+        now = time.time()
+        if expires_at <= now:
+            return
+        self._revoked.add(jti)
+        pipe = RedisProvider.pipeline(transaction=True)
+        pipe.zadd(DENYLIST_KEY, {jti: expires_at})
+        # Истёкшие токены и так не пройдут проверку подписи - держать их незачем
+        pipe.zremrangebyscore(DENYLIST_KEY, '-inf', now)
+        pipe.execute()
+
+    def revoke_user(self, user_id: int, before: Optional[float] = None):
+        """Отзывает все токены пользователя, выданные до момента before"""
+        now = time.time()
+        before = now if before is None else before
+        self._user_cutoffs[str(user_id)] = before
+        pipe = RedisProvider.pipeline(transaction=True)
+        pipe.zadd(USER_CUTOFFS_KEY, {str(user_id): before})
+        # Токены, выданные раньше now - session_ttl, уже истекли
+        pipe.zremrangebyscore(USER_CUTOFFS_KEY, '-inf', now - self.session_ttl)
+        pipe.execute()
+
+    def is_revoked(self, session: Dict) -> bool:
+        if time.monotonic() - self._refreshed_at >= self.refresh_interval:
+            self._refresh()
+        if session['jti'] in self._revoked:
+            return True
+        cutoff = self._user_cutoffs.get(str(session['user_id']))
+        if cutoff is None:
+            return False
+        if session.get('iat') is None:
+            # Старый токен без iat: время выдачи известно только с точностью до секунды
+            return session['exp'] - self.session_ttl <= cutoff
+        # Строго: токен, полученный повторным входом сразу после отзыва, действителен
+        return session['iat'] < cutoff
+
+    def _refresh(self):
+        # Перечитывает один поток, остальные пока смотрят в текущую копию
+        if not self._refresh_lock.acquire(blocking=False):
+            return
+        try:
+            now = time.time()
+            pipe = RedisProvider.pipeline()
+            pipe.zrangebyscore(DENYLIST_KEY, now, '+inf')
+            pipe.zrangebyscore(USER_CUTOFFS_KEY, now - self.session_ttl, '+inf', withscores=True)
+            revoked, user_cutoffs = pipe.execute()
+            self._revoked = set(revoked)
+            self._user_cutoffs = dict(user_cutoffs)
+        except Exception as e:
+            self.refresh_errors += 1
+            print(f"Session denylist refresh failed: {str(e)}")
+        finally:
+            self._refreshed_at = time.monotonic()
+            self._refresh_lock.release()
+
+    def stats(self) -> Dict:
+        return {
+            'size': len(self._revoked),
+            'revoked_users': len(self._user_cutoffs),
+            'refresh_interval': self.refresh_interval,
+            'refreshed_ago': round(time.monotonic() - self._refreshed_at, 3) if self._refreshed_at else None,
+            'refresh_errors': self.refresh_errors
+        }
@@ -0,0 +1,112 @@
+import redis
+import time
+from typing import Dict, List, Set, Tuple
+from app.database.redis_provider import RedisProvider
+from app.database.slot_index import format_minutes, to_minutes
+
+# Удержание слота: SET NX с TTL на hold:{doctor}:{date}:{HH:MM}, значение - user_id.
+# Рядом ведутся индекс удержаний дня (ZSET "время|user_id" -> истечение), чтобы скрывать
+# их в списке свободных слотов, и запись текущего удержания пользователя - у него оно одно.
+_HOLD_LUA = """
+local ok = redis.call('SET', KEYS[1], ARGV[1], 'NX', 'EX', ARGV[2])
+if not ok then
+    if redis.call('GET', KEYS[1]) ~= ARGV[1] then
+        return 0
+    end
+    redis.call('EXPIRE', KEYS[1], ARGV[2])
+end
+local previous = redis.call('GET', KEYS[3])
+if previous and previous ~= ARGV[5] then
+    local key, index, member = string.match(previous, '^(.-)\\n(.-)\\n(.*)$')
+    if key then
+        if redis.call('GET', key) == ARGV[1] then
+            redis.call('DEL', key)
+        end
+        redis.call('ZREM', index, member)
+    end
+end
+local now = tonumber(ARGV[4])
+redis.call('ZADD', KEYS[2], now + tonumber(ARGV[2]), ARGV[3])
+redis.call('ZREMRANGEBYSCORE', KEYS[2], '-inf', now)
+redis.call('EXPIRE', KEYS[2], ARGV[2])
+redis.call('SET', KEYS[3], ARGV[5], 'EX', ARGV[2])
+return 1
+"""
+
+# Снимает удержание, если оно свободно или принадлежит пользователю; 0 - слот держит другой
+_RELEASE_LUA = """
+local owner = redis.call('GET', KEYS[1])
+if owner and owner ~= ARGV[1] then
+    return 0
+end
+if owner then
+    redis.call('DEL', KEYS[1])
+    redis.call('ZREM', KEYS[2], ARGV[2])
+    if redis.call('GET', KEYS[3]) == ARGV[3] then
+        redis.call('DEL', KEYS[3])
+    end
+end
+return 1
+"""
+
+
+class SlotHolds:
+    """Короткие удержания слотов на время оформления записи. Живут только в Redis и истекают сами."""
+
+    def __init__(self, ttl: int = 300):
+        self.ttl = ttl
+        self._hold_script = None
+        self._release_script = None
+
+    def _slot(self, doctor_id, date, slot_time) -> tuple:
+        slot_time = format_minutes(to_minutes(slot_time))
+        hold_key = f"hold:{int(doctor_id)}:{date}:{slot_time}"
+        return hold_key, f"holds:{int(doctor_id)}:{date}", slot_time
+
+    def _keys(self, doctor_id, date, slot_time, user_id) -> tuple:
+        hold_key, index_key, slot_time = self._slot(doctor_id, date, slot_time)
+        member = f"{slot_time}|{user_id}"
+        user_key = f"hold:user:{user_id}"
+        # Запись удержания пользователя: по ней следующее удержание снимает предыдущее
+        record = f"{hold_key}\n{index_key}\n{member}"
+        return [hold_key, index_key, user_key], member, record
+
+    def hold(self, doctor_id, date, slot_time, user_id) -> bool:
+        """Удерживает слот за пользователем; False, если его уже держит другой"""
+        if self._hold_script is None:
+            self._hold_script = RedisProvider.register_script(_HOLD_LUA)
+        keys, member, record = self._keys(doctor_id, date, slot_time, user_id)
+        return self._hold_script(keys=keys, args=[user_id, self.ttl, member, time.time(), record]) == 1
+
+    def release(self, doctor_id, date, slot_time, user_id) -> bool:
+        """Снимает своё удержание (или подтверждает, что слот никто не держит); False - слот держит другой"""
+        if self._release_script is None:
+            self._release_script = RedisProvider.register_script(_RELEASE_LUA)
+        keys, member, record = self._keys(doctor_id, date, slot_time, user_id)
+        return self._release_script(keys=keys, args=[user_id, member, record]) == 1
+
+    def held_by_others(self, doctor_id, dates: List, user_id) -> Dict:
+        """{дата: множество HH:MM}, удерживаемых другими пользователями; при ошибке Redis - пусто"""
+        held = self.held_by_others_many([(doctor_id, date) for date in dates], user_id)
+        return {date: held[(doctor_id, date)] for date in dates}
+
+    def held_by_others_many(self, slots: List[Tuple], user_id) -> Dict:
+        """То же для пар (врач, дата) разных врачей - одним пакетом команд"""
+        now = time.time()
+        try:
+            pipe = RedisProvider.pipeline()
+            for doctor_id, date in slots:
+                pipe.zrangebyscore(f"holds:{int(doctor_id)}:{date}", now, '+inf')
+            members = pipe.execute()
+        except redis.RedisError as e:
+            print(f"Slot holds read failed: {str(e)}")
+            return {slot: set() for slot in slots}
+        held: Dict = {}
+        for slot, day_members in zip(slots, members):
+            times: Set[str] = set()
+            for member in day_members:
+                slot_time, _, owner = member.partition('|')
+                if owner != str(user_id):
+                    times.add(slot_time)
+            held[slot] = times
+        return held
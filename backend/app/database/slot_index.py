@@ -0,0 +1,204 @@
+import redis
+from datetime import timedelta
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+from app.database.redis_provider import RedisProvider
+
+# Длина слота приёма в минутах
+SLOT_MINUTES = 30
+
+# Раскладка битовой строки slots:{doctor}:{date}:
+#   u16 @0  - начало приёма в минутах от полуночи
+#   u8  @16 - число слотов
+#   u8  @24 - признак заполненности (1), чтобы отличить запись от пустого ключа
+#   бит 32 + i - слот i свободен
+_START = ('u16', 0)
+_COUNT = ('u8', 16)
+_READY = ('u8', 24)
+_BITS_OFFSET = 32
+# Сутки по 30 минут - 48 слотов, помещаются в одно чтение BITFIELD
+_MAX_SLOTS = 63
+
+# Записывает заполненную строку, только если с начала перестроения никто не менял слоты врача
+_STORE_LUA = """
+if (redis.call('GET', KEYS[2]) or '') ~= ARGV[1] then
+    return 0
+end
+redis.call('DEL', KEYS[1])
+local args = {'SET', 'u16', 0, ARGV[2], 'SET', 'u8', 16, ARGV[3], 'SET', 'u8', 24, 1}
+if tonumber(ARGV[3]) > 0 then
+    table.insert(args, 'SET')
+    table.insert(args, 'u' .. ARGV[3])
+    table.insert(args, 32)
+    table.insert(args, ARGV[4])
+end
+redis.call('BITFIELD', KEYS[1], unpack(args))
+redis.call('EXPIRE', KEYS[1], ARGV[5])
+redis.call('SADD', KEYS[3], KEYS[1])
+return 1
+"""
+
+# Помечает слот свободным/занятым, если запись уже построена, и сдвигает поколение врача
+_MARK_LUA = """
+redis.call('INCR', KEYS[2])
+local header = redis.call('BITFIELD', KEYS[1], 'GET', 'u16', 0, 'GET', 'u8', 16, 'GET', 'u8', 24)
+if header[3] ~= 1 then
+    return 0
+end
+local offset = tonumber(ARGV[1]) - header[1]
+if offset < 0 or offset % tonumber(ARGV[2]) ~= 0 then
+    return 0
+end
+local slot = offset / tonumber(ARGV[2])
+if slot >= header[2] then
+    return 0
+end
+redis.call('SETBIT', KEYS[1], 32 + slot, ARGV[3])
+return 1
+"""
+
+
+def to_minutes(value) -> int:
+    """Минуты от полуночи для timedelta из MySQL или строки 'HH:MM[:SS]'"""
+    if isinstance(value, timedelta):
+        return int(value.total_seconds()) // 60
+    hours, minutes = str(value).split(':')[:2]
+    return int(hours) * 60 + int(minutes)
+
+
+def format_minutes(minutes: int) -> str:
+    return f"{minutes // 60:02d}:{minutes % 60:02d}"
+
+
+class DayAvailability:
+    """Свободные слоты врача на день: начало приёма, число слотов и битовая маска свободных"""
+
+    def __init__(self, start: int, count: int, free_mask: int):
+        self.start = start
+        self.count = count
+        self.free_mask = free_mask
+
+    @classmethod
+    def build(cls, start_time, end_time, busy_times: Iterable) -> 'DayAvailability':
+        start = to_minutes(start_time)
+        end = to_minutes(end_time)
+        count = min(max(0, -(-(end - start) // SLOT_MINUTES)), _MAX_SLOTS)
+        # Бит 0 маски - последний слот: так маска совпадает с чтением BITFIELD u{count}
+        free_mask = (1 << count) - 1
+        for busy in busy_times:
+            offset = to_minutes(busy) - start
+            if offset >= 0 and offset % SLOT_MINUTES == 0 and offset // SLOT_MINUTES < count:
+                free_mask &= ~(1 << (count - 1 - offset // SLOT_MINUTES))
+        return cls(start, count, free_mask)
+
+    def is_free(self, slot: int) -> bool:
+        return bool(self.free_mask >> (self.count - 1 - slot) & 1)
+
+    def free_minutes(self) -> Iterator[int]:
+        """Начала свободных слотов в минутах от полуночи, по возрастанию"""
+        for slot in range(self.count):
+            if self.is_free(slot):
+                yield self.start + slot * SLOT_MINUTES
+
+    def free_slots(self) -> List[str]:
+        return [format_minutes(minutes) for minutes in self.free_minutes()]
+
+
+class SlotAvailabilityIndex:
+    """Индекс свободных слотов в Redis: битовая строка на врача и дату.
+
+    Строится лениво при первом запросе дня и дальше обновляется точечно при записи и отмене.
+    Изменения расписания сбрасывают записи врача целиком. Ошибки Redis не ломают запрос:
+    индекс просто считается непостроенным, а отметка слота пропускается - её исправит TTL.
+    """
+
+    def __init__(self, ttl: int = 86400):
+        self.ttl = ttl
+        self._store_script = None
+        self._mark_script = None
+
+    def _key(self, doctor_id, date) -> str:
+        return f"slots:{int(doctor_id)}:{date}"
+
+    def _generation_key(self, doctor_id) -> str:
+        return f"slots:{int(doctor_id)}:gen"
+
+    def _dates_key(self, doctor_id) -> str:
+        return f"slots:{int(doctor_id)}:dates"
+
+    def get(self, doctor_id, date) -> Tuple[Optional[DayAvailability], str]:
+        """(день или None, поколение врача) - поколение передаётся в store после перестроения"""
+        days, generation = self.get_many(doctor_id, [date])
+        return days[date], generation
+
+    def get_many(self, doctor_id, dates: List) -> Tuple[Dict, Optional[str]]:
+        """Несколько дней врача за один round trip: {дата: день или None}, поколение"""
+        try:
+            pipe = RedisProvider.pipeline()
+            for date in dates:
+                pipe.bitfield(self._key(doctor_id, date)) \
+                    .get(*_START).get(*_COUNT).get(*_READY).get(f"u{_MAX_SLOTS}", _BITS_OFFSET).execute()
+            pipe.get(self._generation_key(doctor_id))
+            *fields, generation = pipe.execute()
+        except redis.RedisError as e:
+            print(f"Slot index read failed: {str(e)}")
+            return dict.fromkeys(dates), None
+        days = {}
+        for date, (start, count, ready, bits) in zip(dates, fields):
+            # Читаем маску максимальной ширины, лишние младшие биты отбрасываем
+            days[date] = DayAvailability(start, count, bits >> (_MAX_SLOTS - count)) if ready == 1 else None
+        return days, generation or ''
+
+    def store(self, doctor_id, date, day: DayAvailability, generation: Optional[str]):
+        self.store_many(doctor_id, {date: day}, generation)
+
+    def store_many(self, doctor_id, days: Dict, generation: Optional[str]):
+        if generation is None or not days:
+            return
+        if self._store_script is None:
+            self._store_script = RedisProvider.register_script(_STORE_LUA)
+        try:
+            pipe = RedisProvider.pipeline()
+            for date, day in days.items():
+                self._store_script(
+                    keys=[self._key(doctor_id, date), self._generation_key(doctor_id), self._dates_key(doctor_id)],
+                    args=[generation, day.start, day.count, day.free_mask, self.ttl],
+                    client=pipe
+                )
+            pipe.execute()
+        except redis.RedisError as e:
+            print(f"Slot index store failed: {str(e)}")
+
+    def mark(self, doctor_id, date, time, free: bool):
+        """Точечное обновление после записи (free=False) или отмены (free=True)"""
+        if self._mark_script is None:
+            self._mark_script = RedisProvider.register_script(_MARK_LUA)
+        try:
+            self._mark_script(
+                keys=[self._key(doctor_id, date), self._generation_key(doctor_id)],
+                args=[to_minutes(time), SLOT_MINUTES, 1 if free else 0]
+            )
+        except redis.RedisError as e:
+            print(f"Slot index update failed: {str(e)}")
+
+    def invalidate_doctor(self, doctor_id):
+        """Сбрасывает все дни врача, например после изменения его расписания"""
+        client = RedisProvider.get_client()
+        keys = client.smembers(self._dates_key(doctor_id))
+        pipe = RedisProvider.pipeline(transaction=True)
+        if keys:
+            pipe.delete(*keys)
+        pipe.delete(self._dates_key(doctor_id))
+        pipe.incr(self._generation_key(doctor_id))
+        pipe.execute()
+
+    def invalidate_all(self):
+        """Сбрасывает индекс целиком, когда неизвестно, чьё расписание поменялось"""
+        client = RedisProvider.get_client()
+        batch = []
+        for key in client.scan_iter(match='slots:*', count=1000):
+            batch.append(key)
+            if len(batch) >= 1000:
+                client.delete(*batch)
+                batch = []
+        if batch:
+            client.delete(*batch)
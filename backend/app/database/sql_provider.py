@@ -1,139 +1,484 @@
-import mysql.connector
-from typing import Optional, Dict, List, Union
-import os
-import pathlib
-
-class SQLProvider:
-    def __init__(self, host: str, database: str, user: str, password: str):
-        self.connection_params = {
-            'host': host,
-            'database': database,
-            'user': user,
-            'password': password,
-            'charset': 'utf8mb4',
-            'use_unicode': True,
-            'collation': 'utf8mb4_unicode_ci',
-            'autocommit': True
-        }
-        
-        self.sql_path = pathlib.Path(__file__).parent / 'sql_queries'
-
-    def get_connection(self):
-        return mysql.connector.connect(**self.connection_params)
-
-    def execute_query(self, query: str, params: Optional[tuple] = None, return_last_id: bool = False) -> Union[List[Dict], int]:
-        connection = None
-        cursor = None
-        try:
-            connection = mysql.connector.connect(**self.connection_params)
-            cursor = connection.cursor(dictionary=True)
-            
-            cursor.execute(query, params)
-            
-            # Всегда проверяем наличие результатов
-            if cursor.with_rows:
-                result = cursor.fetchall()
-            else:
-                result = []
-
-            # Для не-SELECT запросов
-            if not query.strip().upper().startswith('SELECT'):
-                if return_last_id:
-                    result = cursor.lastrowid
-                else:
-                    result = cursor.rowcount
-                connection.commit()
-            
-            return result
-            
-        except Exception as e:
-            if connection:
-                connection.rollback()
-            raise e
-            
-        finally:
-            if cursor:
-                cursor.close()
-            if connection:
-                connection.close()
-
-    def execute_transaction(self, queries: List[tuple[str, Optional[tuple]]]) -> List[List[Dict]]:
-        """Выполняет несколько запросов в одной транзакции"""
-        connection = mysql.connector.connect(**self.connection_params)
-        cursor = None
-        try:
-            cursor = connection.cursor(dictionary=True)
-            results = []
-            user_id = None
-            doctor_id = None
-            
-            for query, params in queries:
-                print(f"Executing query: {query}")
-                print(f"With params: {params}")
-                
-                # Если это запрос на создание врача и у нас есть user_id
-                if isinstance(params, dict) and 'user_id' in params and params['user_id'] is None and user_id:
-                    params = params.copy()
-                    params['user_id'] = user_id
-                    print(f"Setting user_id to {user_id}")
-                
-                # Если это запрос на создание расписания и у нас есть doctor_id
-                if isinstance(params, dict) and 'doctor_id' in params and params['doctor_id'] is None and doctor_id:
-                    params = params.copy()
-                    params['doctor_id'] = doctor_id
-                    print(f"Setting doctor_id to {doctor_id}")
-                
-                cursor.execute(query, params)
-                
-                if query.strip().upper().startswith('SELECT'):
-                    result = cursor.fetchall()
-                    if not result and 'LAST_INSERT_ID()' in query:
-                        # Если запрос LAST_INSERT_ID() не вернул результатов,
-                        # получаем ID напрямую
-                        result = [{'id': cursor.lastrowid}]
-                    results.append(result)
-                    print(f"Query result: {result}")
-                    
-                    # Если это запрос LAST_INSERT_ID
-                    if 'LAST_INSERT_ID()' in query and result:
-                        last_id = result[0].get('id')
-                        if last_id:
-                            # Определяем, для какой таблицы это ID
-                            if user_id is None:
-                                user_id = last_id
-                                print(f"Got user_id: {user_id}")
-                            else:
-                                doctor_id = last_id
-                                print(f"Got doctor_id: {doctor_id}")
-                else:
-                    results.append([{'affected_rows': cursor.rowcount}])
-                    # Для INSERT запросов также сохраняем lastrowid
-                    if query.strip().upper().startswith('INSERT'):
-                        last_id = cursor.lastrowid
-                        if last_id:
-                            if user_id is None:
-                                user_id = last_id
-                                print(f"Got user_id from INSERT: {user_id}")
-                            elif doctor_id is None:
-                                doctor_id = last_id
-                                print(f"Got doctor_id from INSERT: {doctor_id}")
-            
-            connection.commit()
-            print("Transaction committed successfully")
-            return results
-            
-        except Exception as e:
-            if connection:
-                connection.rollback()
-            print(f"Transaction failed: {str(e)}")
-            raise e
-            
-        finally:
-            if cursor:
-                cursor.close()
-            if connection:
-                connection.close()
-
-    def get_query(self, filename: str) -> str:
-        with open(self.sql_path / filename, 'r', encoding='utf-8') as file:
-            return file.read()
\ No newline at end of file
+import mysql.connector
+from flask import g, has_app_context, has_request_context, request
+from typing import Optional, Dict, Iterable, Iterator, List, Sequence, Union
+from itertools import islice
+import os
+import pathlib
+import re
+import time
+from app.database.compact_result import CompactResult, RESULT_COLUMNS, RESULT_DICTS, RESULT_ROWS
+from app.database.connection_pool import ConnectionPool
+from app.database.governor import QueryGovernor, QueryLimits
+from app.database.query_registry import QueryRegistry
+from app.database.query_stats import QueryStats, inline_key
+from app.database.replica_router import REPLICA_ERRORS, Replica, ReplicaRouter
+
+# Имена таблиц и столбцов подставляются в текст запроса, поэтому пропускаем только простые идентификаторы
+_IDENTIFIER_RE = re.compile(r'^[A-Za-z0-9_]+$')
+
+class SQLProvider:
+    def __init__(
+        self,
+        host: str,
+        database: str,
+        user: str,
+        password: str,
+        pool_min_size: int = 1,
+        pool_max_size: int = 10,
+        pool_timeout: float = 5.0,
+        pool_max_idle_time: float = 300.0,
+        pool_max_lifetime: float = 3600.0,
+        prepared_queries: Iterable[str] = (),
+        bulk_batch_size: int = 500,
+        slow_query_threshold: float = 0.5,
+        replica_hosts: Iterable[str] = (),
+        replica_max_lag: float = 5.0,
+        governor: Optional[QueryGovernor] = None
+    ):
+        self.connection_params = {
+            'host': host,
+            'database': database,
+            'user': user,
+            'password': password,
+            'charset': 'utf8mb4',
+            'use_unicode': True,
+            'collation': 'utf8mb4_unicode_ci',
+            'autocommit': True
+        }
+        
+        self.sql_path = pathlib.Path(__file__).parent / 'sql_queries'
+        self.queries = QueryRegistry(self.sql_path)
+        self.queries.load()
+        # Запросы, которые выполняются как подготовленные на сервере (только с позиционными %s)
+        self.prepared_queries = set(prepared_queries)
+        self.bulk_batch_size = bulk_batch_size
+        self.stats = QueryStats(slow_threshold=slow_query_threshold)
+        self._inline_keys: Dict[str, str] = {}
+        self.governor = governor or QueryGovernor()
+
+        self.pool = ConnectionPool(
+            self.connection_params,
+            min_size=pool_min_size,
+            max_size=pool_max_size,
+            timeout=pool_timeout,
+            max_idle_time=pool_max_idle_time,
+            max_lifetime=pool_max_lifetime
+        )
+        # Соединения открываются в фоне: недоступная при старте БД не мешает запуску приложения
+        self.pool.fill_async()
+
+        # Реплики для чтения: host или host:port, учётные данные те же, что у primary
+        replicas = []
+        for replica_host in replica_hosts:
+            host_name, _, port = replica_host.partition(':')
+            params = dict(self.connection_params, host=host_name)
+            if port:
+                params['port'] = int(port)
+            replicas.append(Replica(replica_host, ConnectionPool(
+                params,
+                min_size=0,
+                max_size=pool_max_size,
+                timeout=pool_timeout,
+                max_idle_time=pool_max_idle_time,
+                max_lifetime=pool_max_lifetime
+            )))
+        self.router = ReplicaRouter(replicas, max_lag=replica_max_lag)
+
+    def get_connection(self):
+        """Соединение из пула, возвращается в пул при выходе из with"""
+        return self.pool.connection()
+
+    def get_pool_stats(self) -> Dict:
+        stats = self.pool.stats()
+        stats['replicas'] = self.router.stats()
+        return stats
+
+    def get_query_stats(self) -> List[Dict]:
+        return self.stats.snapshot()
+
+    def _query_key(self, query: str) -> str:
+        """Имя .sql файла для запросов из реестра, хэш нормализованного текста для остальных"""
+        name = self.queries.name_of(query)
+        if name is not None:
+            return name
+        key = self._inline_keys.get(query)
+        if key is None:
+            key = inline_key(query)
+            # Произвольные запросы из /api/admin/execute не должны раздувать кеш ключей
+            if len(self._inline_keys) < 1000:
+                self._inline_keys[query] = key
+        return key
+
+    def _record(self, query: str, params, started: float, rows_returned: int = 0, rows_affected: int = 0, error=None):
+        self.stats.record(
+            self._query_key(query),
+            query,
+            params,
+            time.perf_counter() - started,
+            rows_returned=rows_returned,
+            rows_affected=rows_affected,
+            error=error
+        )
+
+    def _is_read(self, query: str, read_only: Optional[bool]) -> bool:
+        if read_only is not None:
+            return read_only
+        upper = query.lstrip().upper()
+        return (
+            upper.startswith('SELECT')
+            and 'FOR UPDATE' not in upper
+            and 'LAST_INSERT_ID' not in upper
+        )
+
+    def _mark_write(self):
+        # После записи чтения в рамках того же запроса идут на primary (read-your-writes)
+        if has_app_context():
+            g.db_wrote = True
+
+    def _choose_replica(self) -> Optional[Replica]:
+        if has_app_context() and g.get('db_wrote'):
+            return None
+        return self.router.choose()
+
+    def _limits(self, limits: Optional[QueryLimits]) -> QueryLimits:
+        blueprint = request.blueprint if has_request_context() else None
+        return self.governor.resolve(limits, blueprint)
+
+    def get_governor_stats(self) -> Dict:
+        return self.governor.stats()
+
+    def execute_query(
+        self,
+        query: str,
+        params: Optional[tuple] = None,
+        return_last_id: bool = False,
+        read_only: Optional[bool] = None,
+        result_format: str = RESULT_DICTS,
+        limits: Optional[QueryLimits] = None
+    ) -> Union[List[Dict], CompactResult, int]:
+        """Выполняет запрос. Чтения (SELECT или read_only=True) уходят на реплику, если она есть.
+
+        read_only=False оставляет чтение на primary - для проверок, которым нужна самая свежая запись.
+        result_format='rows' или 'columns' возвращает CompactResult вместо списка словарей.
+        limits переопределяет ограничения governor'а, заданные для текущего blueprint.
+        """
+        limits = self._limits(limits)
+        if self._is_read(query, read_only):
+            replica = self._choose_replica()
+            if replica is not None:
+                try:
+                    with replica.pool.connection() as connection:
+                        return self._execute_query(replica.pool, connection, query, params, return_last_id, result_format, limits)
+                except REPLICA_ERRORS:
+                    # Реплика недоступна - выключаем её на время и повторяем запрос на primary
+                    self.router.mark_down(replica)
+        else:
+            self._mark_write()
+
+        with self.get_connection() as connection:
+            return self._execute_query(self.pool, connection, query, params, return_last_id, result_format, limits)
+
+    def _get_prepared_cursor(self, pool: ConnectionPool, connection, query: str, params):
+        """Курсор с подготовленным на сервере запросом, закешированный на соединении"""
+        if params is not None and not isinstance(params, (tuple, list)):
+            return None
+        name = self.queries.name_of(query)
+        if name is None or name not in self.prepared_queries:
+            return None
+
+        statements = pool.statement_cache(connection)
+        cursor = statements.get(name)
+        if cursor is None:
+            cursor = connection.cursor(prepared=True, dictionary=True)
+            statements[name] = cursor
+        return cursor
+
+    def _execute_query(
+        self,
+        pool: ConnectionPool,
+        connection,
+        query: str,
+        params: Optional[tuple],
+        return_last_id: bool,
+        result_format: str = RESULT_DICTS,
+        limits: Optional[QueryLimits] = None
+    ) -> Union[List[Dict], CompactResult, int]:
+        cursor = None
+        prepared = None
+        watch = None
+        limits = limits or self.governor.default
+        started = time.perf_counter()
+        try:
+            if result_format == RESULT_DICTS:
+                prepared = self._get_prepared_cursor(pool, connection, query, params)
+                cursor = prepared or connection.cursor(dictionary=True)
+            else:
+                # Кортежи вместо словарей: имена столбцов хранятся один раз
+                cursor = connection.cursor()
+            
+            watch = self.governor.watch(pool.connection_params, connection, limits)
+            cursor.execute(self.governor.add_hint(query, limits), params)
+            
+            # Всегда проверяем наличие результатов
+            if cursor.with_rows:
+                result = self.governor.fetch(cursor, limits, pool.connection_params, connection)
+                if result_format != RESULT_DICTS:
+                    result = CompactResult(cursor.column_names, result, columnar=result_format == RESULT_COLUMNS)
+            else:
+                result = []
+            rows_returned = len(result)
+            rows_affected = 0
+
+            # Для не-SELECT запросов
+            if not query.strip().upper().startswith('SELECT'):
+                rows_affected = cursor.rowcount
+                if return_last_id:
+                    result = cursor.lastrowid
+                else:
+                    result = cursor.rowcount
+                connection.commit()
+            
+            self._record(query, params, started, rows_returned, rows_affected)
+            return result
+            
+        except Exception as e:
+            error = self.governor.translate(e, watch)
+            self._record(query, params, started, error=error)
+            if getattr(error, 'discard_connection', False):
+                # В соединении остался недочитанный результат, пул закроет его целиком
+                raise error
+            connection.rollback()
+            if prepared is not None:
+                # Сбрасываем подготовленный запрос, при следующем вызове он будет подготовлен заново
+                pool.statement_cache(connection).pop(self.queries.name_of(query), None)
+                prepared.close()
+            if error is e:
+                raise
+            raise error from e
+            
+        finally:
+            self.governor.unwatch(watch)
+            if cursor and cursor is not prepared:
+                try:
+                    cursor.close()
+                except Exception:
+                    pass
+
+    def _acquire_for_read(self):
+        replica = self._choose_replica()
+        if replica is not None:
+            try:
+                return replica.pool, replica.pool.acquire()
+            except REPLICA_ERRORS:
+                self.router.mark_down(replica)
+        return self.pool, self.pool.acquire()
+
+    def stream_query(
+        self,
+        query: str,
+        params: Optional[tuple] = None,
+        chunk_size: int = 1000,
+        limits: Optional[QueryLimits] = None
+    ) -> Iterator[Dict]:
+        """Построчно отдаёт результат SELECT через небуферизованный курсор.
+
+        Строки читаются с сервера порциями по chunk_size, поэтому память не растёт с размером таблицы.
+        Соединение занято, пока генератор не исчерпан или не закрыт. Читает с реплики, если она доступна.
+        """
+        rows = self._stream(query, params, chunk_size, True, self._limits(limits))
+        next(rows)
+        return rows
+
+    def stream_compact(
+        self,
+        query: str,
+        params: Optional[tuple] = None,
+        chunk_size: int = 1000,
+        limits: Optional[QueryLimits] = None
+    ) -> CompactResult:
+        """Как stream_query, но строки - кортежи, а имена столбцов доступны сразу в result.columns"""
+        rows = self._stream(query, params, chunk_size, False, self._limits(limits))
+        columns = next(rows)
+        return CompactResult(columns, rows)
+
+    def _stream(self, query: str, params: Optional[tuple], chunk_size: int, dictionary: bool, limits: QueryLimits) -> Iterator:
+        """Первым элементом отдаёт имена столбцов, дальше - строки результата.
+
+        Запрос выполняется уже при первом next(), поэтому ошибки SQL видны до начала ответа.
+        """
+        pool, connection = self._acquire_for_read()
+        cursor = None
+        finished = False
+        error = None
+        rows_returned = 0
+        started = time.perf_counter()
+        try:
+            cursor = connection.cursor(dictionary=dictionary, buffered=False)
+            # Для потока ставим только подсказку MAX_EXECUTION_TIME, KILL по таймеру не используется
+            cursor.execute(self.governor.add_hint(query, limits), params)
+            yield cursor.column_names
+            while True:
+                rows = cursor.fetchmany(chunk_size)
+                if not rows:
+                    break
+                rows_returned += len(rows)
+                if limits.max_rows and rows_returned > limits.max_rows:
+                    self.governor.row_limit_exceeded(limits, pool.connection_params, connection)
+                yield from rows
+            finished = True
+        except Exception as e:
+            error = self.governor.translate(e, None)
+            if error is e:
+                raise
+            raise error from e
+        finally:
+            # Время включает отправку строк клиенту: поток держит соединение всё это время
+            self._record(query, params, started, rows_returned, error=error)
+            if cursor and finished:
+                cursor.close()
+            # Недочитанный результат остался в протоколе, такое соединение проще закрыть, чем вычитывать
+            pool.release(connection, discard=not finished)
+
+    def bulk_insert(
+        self,
+        table: str,
+        columns: Sequence[str],
+        rows: Iterable[Sequence],
+        batch_size: Optional[int] = None
+    ) -> Dict:
+        """Вставляет строки многострочными INSERT по batch_size строк в одной транзакции.
+
+        rows может быть генератором (например, из stream_query) - он читается порциями.
+        Возвращает общее число затронутых строк и число строк по каждому пакету.
+        """
+        for identifier in (table, *columns):
+            if not _IDENTIFIER_RE.match(identifier):
+                raise ValueError(f"Недопустимое имя: {identifier}")
+        if not columns:
+            raise ValueError("Не указаны столбцы для вставки")
+
+        batch_size = batch_size or self.bulk_batch_size
+        column_list = ', '.join(f"`{column}`" for column in columns)
+        row_placeholder = '(' + ', '.join(['%s'] * len(columns)) + ')'
+        prefix = f"INSERT INTO `{table}` ({column_list}) VALUES "
+
+        batch_counts = []
+        rows = iter(rows)
+        self._mark_write()
+        with self.get_connection() as connection:
+            cursor = None
+            try:
+                connection.start_transaction()
+                cursor = connection.cursor()
+                while True:
+                    batch = list(islice(rows, batch_size))
+                    if not batch:
+                        break
+                    params = []
+                    for row in batch:
+                        if len(row) != len(columns):
+                            raise ValueError("Количество значений не совпадает с количеством столбцов")
+                        params.extend(row)
+                    started = time.perf_counter()
+                    cursor.execute(prefix + ', '.join([row_placeholder] * len(batch)), params)
+                    batch_counts.append(cursor.rowcount)
+                    # Все пакеты одной таблицы учитываются под одним ключом, независимо от числа строк
+                    self._record(prefix + row_placeholder, params, started, rows_affected=cursor.rowcount)
+                connection.commit()
+            except Exception as e:
+                connection.rollback()
+                raise e
+            finally:
+                if cursor:
+                    cursor.close()
+
+        return {
+            'affected_rows': sum(batch_counts),
+            'batch_counts': batch_counts
+        }
+
+    def execute_transaction(self, queries: List[tuple[str, Optional[tuple]]]) -> List[List[Dict]]:
+        """Выполняет несколько запросов в одной транзакции"""
+        self._mark_write()
+        with self.get_connection() as connection:
+            return self._execute_transaction(connection, queries)
+
+    def _execute_transaction(self, connection, queries: List[tuple[str, Optional[tuple]]]) -> List[List[Dict]]:
+        cursor = None
+        try:
+            # Соединения в пуле работают в autocommit, поэтому транзакцию открываем явно
+            connection.start_transaction()
+            cursor = connection.cursor(dictionary=True)
+            results = []
+            user_id = None
+            doctor_id = None
+            
+            for query, params in queries:
+                # Если это запрос на создание врача и у нас есть user_id
+                if isinstance(params, dict) and 'user_id' in params and params['user_id'] is None and user_id:
+                    params = params.copy()
+                    params['user_id'] = user_id
+                    print(f"Setting user_id to {user_id}")
+                
+                # Если это запрос на создание расписания и у нас есть doctor_id
+                if isinstance(params, dict) and 'doctor_id' in params and params['doctor_id'] is None and doctor_id:
+                    params = params.copy()
+                    params['doctor_id'] = doctor_id
+                    print(f"Setting doctor_id to {doctor_id}")
+                
+                started = time.perf_counter()
+                try:
+                    cursor.execute(query, params)
+                except Exception as e:
+                    self._record(query, params, started, error=e)
+                    raise
+                
+                if query.strip().upper().startswith('SELECT'):
+                    result = cursor.fetchall()
+                    self._record(query, params, started, rows_returned=len(result))
+                    if not result and 'LAST_INSERT_ID()' in query:
+                        # Если запрос LAST_INSERT_ID() не вернул результатов,
+                        # получаем ID напрямую
+                        result = [{'id': cursor.lastrowid}]
+                    results.append(result)
+                    
+                    # Если это запрос LAST_INSERT_ID
+                    if 'LAST_INSERT_ID()' in query and result:
+                        last_id = result[0].get('id')
+                        if last_id:
+                            # Определяем, для какой таблицы это ID
+                            if user_id is None:
+                                user_id = last_id
+                                print(f"Got user_id: {user_id}")
+                            else:
+                                doctor_id = last_id
+                                print(f"Got doctor_id: {doctor_id}")
+                else:
+                    self._record(query, params, started, rows_affected=cursor.rowcount)
+                    results.append([{'affected_rows': cursor.rowcount}])
+                    # Для INSERT запросов также сохраняем lastrowid
+                    if query.strip().upper().startswith('INSERT'):
+                        last_id = cursor.lastrowid
+                        if last_id:
+                            if user_id is None:
+                                user_id = last_id
+                                print(f"Got user_id from INSERT: {user_id}")
+                            elif doctor_id is None:
+                                doctor_id = last_id
+                                print(f"Got doctor_id from INSERT: {doctor_id}")
+            
+            connection.commit()
+            print("Transaction committed successfully")
+            return results
+            
+        except Exception as e:
+            connection.rollback()
+            print(f"Transaction failed: {str(e)}")
+            raise e
+            
+        finally:
+            if cursor:
+                cursor.close()
+
+    def get_query(self, filename: str) -> str:
+        return self.queries.get(filename)
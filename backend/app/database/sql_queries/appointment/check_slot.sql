@@ -1,5 +0,0 @@
-SELECT id_tit
-FROM timetable
-WHERE doctor_id_doc = %s 
-AND admission = %s
-AND time = %s; 
\ No newline at end of file
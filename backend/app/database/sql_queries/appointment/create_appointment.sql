@@ -1,2 +1,7 @@
 INSERT INTO timetable (cabinet_id_cab, doctor_id_doc, patient_id_patient, admission, time, appearance)
-VALUES (%s, %s, %s, %s, %s, 'Личное');
\ No newline at end of file
+SELECT c.id_cab, d.id_doc, %s, %s, %s, 'Личное'
+FROM doctor d
+JOIN cabinet c ON c.department_id_dep = d.department_id_dep
+WHERE d.id_doc = %s
+ORDER BY c.id_cab
+LIMIT 1;
\ No newline at end of file
@@ -1,8 +0,0 @@
-SELECT id_cab 
-FROM cabinet 
-WHERE department_id_dep = (
-    SELECT department_id_dep 
-    FROM doctor 
-    WHERE id_doc = %s
-) 
-LIMIT 1; 
\ No newline at end of file
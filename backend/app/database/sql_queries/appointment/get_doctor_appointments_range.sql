@@ -0,0 +1,4 @@
+SELECT admission, time as appointment_time
+FROM timetable
+WHERE doctor_id_doc = %s 
+AND admission BETWEEN %s AND %s;
\ No newline at end of file
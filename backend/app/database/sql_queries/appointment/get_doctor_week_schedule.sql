@@ -0,0 +1,3 @@
+SELECT ds.day_of_week, ds.start_time, ds.end_time
+FROM doctor_schedule ds
+WHERE ds.doctor_id = %s;
\ No newline at end of file
@@ -1,3 +0,0 @@
-SELECT id_patient
-FROM patient
-WHERE user_id = %s; 
\ No newline at end of file
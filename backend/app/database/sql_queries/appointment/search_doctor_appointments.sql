@@ -0,0 +1,7 @@
+SELECT t.doctor_id_doc, t.admission, t.time
+FROM doctor d
+JOIN timetable t ON t.doctor_id_doc = d.id_doc
+    AND t.admission BETWEEN %(date_from)s AND %(date_to)s
+WHERE (%(department_id)s IS NULL OR d.department_id_dep = %(department_id)s)
+AND (%(specialization)s IS NULL OR d.specialization = %(specialization)s)
+AND (d.dismissal IS NULL OR d.dismissal > CURDATE());
\ No newline at end of file
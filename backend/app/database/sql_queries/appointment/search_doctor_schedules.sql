@@ -0,0 +1,7 @@
+SELECT d.id_doc, d.full_name, d.specialization, ds.day_of_week, ds.start_time, ds.end_time
+FROM doctor d
+JOIN doctor_schedule ds ON ds.doctor_id = d.id_doc
+WHERE (%(department_id)s IS NULL OR d.department_id_dep = %(department_id)s)
+AND (%(specialization)s IS NULL OR d.specialization = %(specialization)s)
+AND (d.dismissal IS NULL OR d.dismissal > CURDATE())
+ORDER BY d.id_doc, ds.day_of_week, ds.start_time;
\ No newline at end of file
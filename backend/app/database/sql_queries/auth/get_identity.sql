@@ -0,0 +1,5 @@
+SELECT p.id_patient as patient_id, d.id_doc as doctor_id, d.department_id_dep as department_id
+FROM user u
+LEFT JOIN patient p ON p.user_id = u.id_user
+LEFT JOIN doctor d ON d.user_id = u.id_user
+WHERE u.id_user = %s;
\ No newline at end of file
@@ -1,4 +1,7 @@
-SELECT u.id_user, u.password_hash, u.role_id, r.name as role_name
+SELECT u.id_user, u.password_hash, u.role_id, r.name as role_name,
+    p.id_patient as patient_id, d.id_doc as doctor_id, d.department_id_dep as department_id
 FROM user u
 JOIN role r ON u.role_id = r.id_role
-WHERE u.login = %s; 
\ No newline at end of file
+LEFT JOIN patient p ON p.user_id = u.id_user
+LEFT JOIN doctor d ON d.user_id = u.id_user
+WHERE u.login = %s;
\ No newline at end of file
@@ -0,0 +1,3 @@
+UPDATE `user`
+SET password_hash = %s
+WHERE id_user = %s;
\ No newline at end of file
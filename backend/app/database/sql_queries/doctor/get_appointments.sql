@@ -0,0 +1,29 @@
+SELECT 
+    t.id_tit as id,
+    t.admission as date,
+    t.time,
+    t.appearance,
+    p.passport_data,
+    CONCAT(
+        TIMESTAMPDIFF(YEAR, p.birth, CURDATE()),
+        ' лет'
+    ) as age,
+    t.patient_id_patient,
+    c.type as cabinet_type,
+    c.id_cab as cabinet_number,
+    v.id_vis as visit_id,
+    v.diagnosis,
+    v.complaints
+FROM timetable t
+JOIN patient p ON t.patient_id_patient = p.id_patient
+JOIN cabinet c ON t.cabinet_id_cab = c.id_cab
+LEFT JOIN visiting v ON v.timetable_id = t.id_tit
+WHERE t.doctor_id_doc = %(doctor_id)s
+AND (%(date_from)s IS NULL OR t.admission >= %(date_from)s)
+AND (%(date_to)s IS NULL OR t.admission <= %(date_to)s)
+AND (%(cursor_date)s IS NULL
+    OR t.admission < %(cursor_date)s
+    OR (t.admission = %(cursor_date)s AND (t.time < %(cursor_time)s
+        OR (t.time = %(cursor_time)s AND t.id_tit < %(cursor_id)s))))
+ORDER BY t.admission DESC, t.time DESC, t.id_tit DESC
+LIMIT %(limit)s;
\ No newline at end of file
@@ -0,0 +1,24 @@
+SELECT 
+    t.id_tit as appointment_id,
+    t.admission as date,
+    t.time,
+    d.full_name as doctor_name,
+    d.specialization,
+    c.type as cabinet_type,
+    c.id_cab as cabinet_number,
+    t.appearance,
+    v.diagnosis,
+    v.complaints
+FROM timetable t
+JOIN doctor d ON d.id_doc = t.doctor_id_doc
+JOIN cabinet c ON c.id_cab = t.cabinet_id_cab
+LEFT JOIN visiting v ON v.timetable_id = t.id_tit
+WHERE t.patient_id_patient = %(patient_id)s
+AND (%(date_from)s IS NULL OR t.admission >= %(date_from)s)
+AND (%(date_to)s IS NULL OR t.admission <= %(date_to)s)
+AND (%(cursor_date)s IS NULL
+    OR t.admission < %(cursor_date)s
+    OR (t.admission = %(cursor_date)s AND (t.time < %(cursor_time)s
+        OR (t.time = %(cursor_time)s AND t.id_tit < %(cursor_id)s))))
+ORDER BY t.admission DESC, t.time DESC, t.id_tit DESC
+LIMIT %(limit)s;
\ No newline at end of file
@@ -0,0 +1,19 @@
+SELECT 
+    v.id_vis,
+    v.diagnosis,
+    v.complaints,
+    v.date,
+    v.time,
+    d.full_name as doctor_name,
+    d.specialization
+FROM visiting v
+JOIN doctor d ON d.id_doc = v.doctor_id_doc
+WHERE v.patient_id_patient = %(patient_id)s
+AND (%(date_from)s IS NULL OR v.date >= %(date_from)s)
+AND (%(date_to)s IS NULL OR v.date <= %(date_to)s)
+AND (%(cursor_date)s IS NULL
+    OR v.date < %(cursor_date)s
+    OR (v.date = %(cursor_date)s AND (v.time < %(cursor_time)s
+        OR (v.time = %(cursor_time)s AND v.id_vis < %(cursor_id)s))))
+ORDER BY v.date DESC, v.time DESC, v.id_vis DESC
+LIMIT %(limit)s;
\ No newline at end of file
@@ -1,7 +1,3 @@
 DELETE FROM timetable 
 WHERE id_tit = %s 
-AND patient_id_patient = (
-    SELECT id_patient 
-    FROM patient 
-    WHERE user_id = %s
-); 
\ No newline at end of file
+AND patient_id_patient = %s;
\ No newline at end of file
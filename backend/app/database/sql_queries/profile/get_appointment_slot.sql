@@ -0,0 +1,4 @@
+SELECT doctor_id_doc, admission, time
+FROM timetable
+WHERE id_tit = %s
+AND patient_id_patient = %s;
\ No newline at end of file
@@ -5,10 +5,20 @@ SELECT
     t.appearance,
     d.full_name as doctor_name,
     c.type as cabinet_type,
-    c.id_cab as cabinet_number
+    c.id_cab as cabinet_number,
+    v.diagnosis,
+    v.complaints,
+    v.id_vis as visit_id
 FROM timetable t
 JOIN doctor d ON t.doctor_id_doc = d.id_doc
 JOIN cabinet c ON t.cabinet_id_cab = c.id_cab
-JOIN patient p ON t.patient_id_patient = p.id_patient
-WHERE p.user_id = %s
-ORDER BY t.admission DESC, t.time DESC; 
\ No newline at end of file
+LEFT JOIN visiting v ON v.timetable_id = t.id_tit
+WHERE t.patient_id_patient = %(patient_id)s
+AND (%(date_from)s IS NULL OR t.admission >= %(date_from)s)
+AND (%(date_to)s IS NULL OR t.admission <= %(date_to)s)
+AND (%(cursor_date)s IS NULL
+    OR t.admission < %(cursor_date)s
+    OR (t.admission = %(cursor_date)s AND (t.time < %(cursor_time)s
+        OR (t.time = %(cursor_time)s AND t.id_tit < %(cursor_id)s))))
+ORDER BY t.admission DESC, t.time DESC, t.id_tit DESC
+LIMIT %(limit)s;
\ No newline at end of file
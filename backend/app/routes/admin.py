@@ -1,220 +1,356 @@
-from flask import Blueprint, request, jsonify, current_app
-from .auth import login_required, role_required
-from datetime import datetime, date, time, timedelta
-import json
-
-admin_bp = Blueprint('admin', __name__, url_prefix='/api/admin')
-
-class CustomJSONEncoder(json.JSONEncoder):
-    def default(self, obj):
-        if isinstance(obj, (datetime, date)):
-            return obj.isoformat()
-        if isinstance(obj, time):
-            return obj.strftime('%H:%M:%S')
-        if isinstance(obj, timedelta):
-            return str(obj)
-        return super().default(obj)
-
-def init_app(app):
-    app.register_blueprint(admin_bp)
-
-@admin_bp.route('/profile', methods=['GET'])
-@login_required
-@role_required(['admin'])
-def get_admin_profile():
-    """Получить информацию о профиле администратора"""
-    query = """
-    SELECT 
-        u.id_user,
-        u.login
-    FROM user u
-    JOIN role r ON u.role_id = r.id_role
-    WHERE u.id_user = %s AND r.name = 'admin'
-    """
-    result = current_app.config['sql_provider'].execute_query(query, (request.user_id,))
-    
-    if not result:
-        return jsonify({'error': 'Администратор не найден'}), 404
-        
-    return jsonify(result[0])
-
-@admin_bp.route('/tables', methods=['GET'])
-@login_required
-@role_required(['admin'])
-def get_tables():
-    """Получить список всех таблиц в базе данных"""
-    query = """
-    SELECT TABLE_NAME 
-    FROM information_schema.TABLES 
-    WHERE TABLE_SCHEMA = DATABASE()
-    """
-    result = current_app.config['sql_provider'].execute_query(query)
-    return jsonify([row['TABLE_NAME'] for row in result])
-
-@admin_bp.route('/table/<table_name>', methods=['GET'])
-@login_required
-@role_required(['admin'])
-def get_table_data(table_name):
-    """Получить данные из указанной таблицы"""
-    try:
-        # Получаем информацию о столбцах
-        columns_query = """
-        SELECT 
-            COLUMN_NAME,
-            DATA_TYPE,
-            IS_NULLABLE,
-            COLUMN_KEY
-        FROM information_schema.COLUMNS
-        WHERE TABLE_SCHEMA = DATABASE()
-        AND TABLE_NAME = %s
-        """
-        columns = current_app.config['sql_provider'].execute_query(columns_query, (table_name,))
-        
-        # Получаем данные
-        data_query = f"SELECT * FROM {table_name}"
-        data = current_app.config['sql_provider'].execute_query(data_query)
-        
-        # Преобразуем специальные типы данных
-        processed_data = []
-        for row in data:
-            processed_row = {}
-            for key, value in row.items():
-                if isinstance(value, (datetime, date)):
-                    processed_row[key] = value.isoformat()
-                elif isinstance(value, time):
-                    processed_row[key] = value.strftime('%H:%M:%S')
-                elif isinstance(value, timedelta):
-                    processed_row[key] = str(value)
-                else:
-                    processed_row[key] = value
-            processed_data.append(processed_row)
-        
-        return jsonify({
-            'columns': columns,
-            'data': processed_data
-        })
-    except Exception as e:
-        return jsonify({'error': str(e)}), 500
-
-@admin_bp.route('/table/<table_name>/schema', methods=['GET'])
-@login_required
-@role_required(['admin'])
-def get_table_schema(table_name):
-    """Получить схему таблицы"""
-    try:
-        # Получаем информацию о столбцах
-        columns_query = """
-        SELECT 
-            COLUMN_NAME,
-            DATA_TYPE,
-            CHARACTER_MAXIMUM_LENGTH,
-            IS_NULLABLE,
-            COLUMN_KEY,
-            COLUMN_DEFAULT,
-            EXTRA
-        FROM information_schema.COLUMNS
-        WHERE TABLE_SCHEMA = DATABASE()
-        AND TABLE_NAME = %s
-        ORDER BY ORDINAL_POSITION
-        """
-        columns = current_app.config['sql_provider'].execute_query(columns_query, (table_name,))
-        
-        # Получаем информацию о внешних ключах
-        fk_query = """
-        SELECT
-            COLUMN_NAME,
-            REFERENCED_TABLE_NAME,
-            REFERENCED_COLUMN_NAME
-        FROM information_schema.KEY_COLUMN_USAGE
-        WHERE TABLE_SCHEMA = DATABASE()
-        AND TABLE_NAME = %s
-        AND REFERENCED_TABLE_NAME IS NOT NULL
-        """
-        foreign_keys = current_app.config['sql_provider'].execute_query(fk_query, (table_name,))
-        
-        return jsonify({
-            'columns': columns,
-            'foreign_keys': foreign_keys
-        })
-    except Exception as e:
-        return jsonify({'error': str(e)}), 500
-
-@admin_bp.route('/table/<table_name>/row', methods=['POST'])
-@login_required
-@role_required(['admin'])
-def add_row(table_name):
-    """Добавить новую запись в таблицу"""
-    try:
-        data = request.get_json()
-        
-        # Формируем SQL запрос
-        columns = ', '.join(data.keys())
-        values = ', '.join(['%s'] * len(data))
-        query = f"INSERT INTO {table_name} ({columns}) VALUES ({values})"
-        
-        # Выполняем запрос
-        current_app.config['sql_provider'].execute_query(
-            query, 
-            tuple(data.values()),
-            return_last_id=True
-        )
-        
-        return jsonify({'message': 'Запись успешно добавлена'})
-    except Exception as e:
-        return jsonify({'error': str(e)}), 500
-
-@admin_bp.route('/table/<table_name>/row/<int:row_id>', methods=['PUT'])
-@login_required
-@role_required(['admin'])
-def update_row(table_name, row_id):
-    """Обновить существующую запись в таблице"""
-    try:
-        data = request.get_json()
-        
-        # Формируем SQL запрос
-        set_clause = ', '.join([f"{key} = %s" for key in data.keys()])
-        query = f"UPDATE {table_name} SET {set_clause} WHERE id_{table_name} = %s"
-        
-        # Выполняем запрос
-        values = tuple(data.values()) + (row_id,)
-        current_app.config['sql_provider'].execute_query(query, values)
-        
-        return jsonify({'message': 'Запись успешно обновлена'})
-    except Exception as e:
-        return jsonify({'error': str(e)}), 500
-
-@admin_bp.route('/table/<table_name>/row/<int:row_id>', methods=['DELETE'])
-@login_required
-@role_required(['admin'])
-def delete_row(table_name, row_id):
-    """Удалить запись из таблицы"""
-    try:
-        query = f"DELETE FROM {table_name} WHERE id_{table_name} = %s"
-        current_app.config['sql_provider'].execute_query(query, (row_id,))
-        return jsonify({'message': 'Запись успешно удалена'})
-    except Exception as e:
-        return jsonify({'error': str(e)}), 500
-
-@admin_bp.route('/execute', methods=['POST'])
-@login_required
-@role_required(['admin'])
-def execute_query():
-    """Выполнить произвольный SQL запрос"""
-    try:
-        data = request.get_json()
-        query = data.get('query')
-        
-        if not query:
-            return jsonify({'error': 'Запрос не указан'}), 400
-            
-        # Проверяем, что запрос не содержит опасных операций
-        dangerous_keywords = ['DROP', 'TRUNCATE', 'DELETE FROM', 'ALTER']
-        if any(keyword in query.upper() for keyword in dangerous_keywords):
-            return jsonify({
-                'error': 'Запрос содержит потенциально опасные операции'
-            }), 400
-        
-        result = current_app.config['sql_provider'].execute_query(query)
-        return jsonify({'result': result})
-    except Exception as e:
+from flask import Blueprint, request, jsonify, current_app
+from redis import RedisError
+from typing import Iterable, Optional
+from .auth import list_user_sessions, login_required, revoke_user_sessions, role_required
+from app.database.governor import QueryLimitError
+from app.database.compact_result import RESULT_COLUMNS, RESULT_ROWS
+from app.database.redis_provider import RedisProvider
+from app.utils.json_stream import requested_layout, stream_json_response
+
+# Изменение этих полей пользователя делает его текущие сессии недействительными
+SESSION_SENSITIVE_USER_FIELDS = {'login', 'password_hash', 'role_id'}
+# Таблицы, из которых строится индекс свободных слотов: таблица -> столбец с id врача
+SLOT_INDEX_TABLES = {'doctor_schedule': 'doctor_id', 'timetable': 'doctor_id_doc'}
+
+def invalidate_table_caches(table_name: Optional[str] = None, doctor_ids: Optional[Iterable] = None):
+    """Сбрасывает кеши, построенные по таблице; без table_name - все кеши.
+
+    doctor_ids - врачи затронутых строк: индекс слотов сбрасывается только у них. Без них
+    (UPDATE мог сменить врача, /execute - что угодно) индекс сбрасывается целиком.
+    """
+    if table_name is None or table_name in SLOT_INDEX_TABLES:
+        slot_index = current_app.config['slot_index']
+        try:
+            if table_name is not None and doctor_ids is not None:
+                for doctor_id in set(doctor_ids):
+                    slot_index.invalidate_doctor(doctor_id)
+            else:
+                slot_index.invalidate_all()
+        except RedisError as e:
+            # Данные в БД уже изменены - ошибка Redis не должна превращать успешную правку в 500
+            print(f"Slot index invalidation failed: {str(e)}")
+    # Теги кеша ответов совпадают с именами таблиц
+    if table_name is None:
+        current_app.config['response_cache'].invalidate_all()
+    else:
+        current_app.config['response_cache'].invalidate(table_name)
+
+admin_bp = Blueprint('admin', __name__, url_prefix='/api/admin')
+
+def init_app(app):
+    app.register_blueprint(admin_bp)
+
+@admin_bp.route('/profile', methods=['GET'])
+@login_required
+@role_required(['admin'])
+def get_admin_profile():
+    """Получить информацию о профиле администратора"""
+    query = """
+    SELECT 
+        u.id_user,
+        u.login
+    FROM user u
+    JOIN role r ON u.role_id = r.id_role
+    WHERE u.id_user = %s AND r.name = 'admin'
+    """
+    result = current_app.config['sql_provider'].execute_query(query, (request.user_id,))
+    
+    if not result:
+        return jsonify({'error': 'Администратор не найден'}), 404
+        
+    return jsonify(result[0])
+
+@admin_bp.route('/tables', methods=['GET'])
+@login_required
+@role_required(['admin'])
+def get_tables():
+    """Получить список всех таблиц в базе данных"""
+    query = """
+    SELECT TABLE_NAME 
+    FROM information_schema.TABLES 
+    WHERE TABLE_SCHEMA = DATABASE()
+    """
+    result = current_app.config['sql_provider'].execute_query(query)
+    return jsonify([row['TABLE_NAME'] for row in result])
+
+@admin_bp.route('/table/<table_name>', methods=['GET'])
+@login_required
+@role_required(['admin'])
+def get_table_data(table_name):
+    """Получить данные из указанной таблицы"""
+    try:
+        # Получаем информацию о столбцах
+        columns_query = """
+        SELECT 
+            COLUMN_NAME,
+            DATA_TYPE,
+            IS_NULLABLE,
+            COLUMN_KEY
+        FROM information_schema.COLUMNS
+        WHERE TABLE_SCHEMA = DATABASE()
+        AND TABLE_NAME = %s
+        """
+        columns = current_app.config['sql_provider'].execute_query(columns_query, (table_name,))
+        
+        # Данные отдаём потоком, специальные типы преобразует CustomJSONEncoder
+        data_query = f"SELECT * FROM {table_name}"
+        layout = requested_layout()
+        if layout == RESULT_ROWS:
+            data = current_app.config['sql_provider'].stream_compact(data_query)
+        elif layout == RESULT_COLUMNS:
+            data = current_app.config['sql_provider'].execute_query(data_query, result_format=RESULT_COLUMNS)
+        else:
+            data = current_app.config['sql_provider'].stream_query(data_query)
+        
+        return stream_json_response(data, fields={'columns': columns}, array_key='data')
+    except QueryLimitError:
+        raise
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@admin_bp.route('/table/<table_name>/schema', methods=['GET'])
+@login_required
+@role_required(['admin'])
+def get_table_schema(table_name):
+    """Получить схему таблицы"""
+    try:
+        # Получаем информацию о столбцах
+        columns_query = """
+        SELECT 
+            COLUMN_NAME,
+            DATA_TYPE,
+            CHARACTER_MAXIMUM_LENGTH,
+            IS_NULLABLE,
+            COLUMN_KEY,
+            COLUMN_DEFAULT,
+            EXTRA
+        FROM information_schema.COLUMNS
+        WHERE TABLE_SCHEMA = DATABASE()
+        AND TABLE_NAME = %s
+        ORDER BY ORDINAL_POSITION
+        """
+        columns = current_app.config['sql_provider'].execute_query(columns_query, (table_name,))
+        
+        # Получаем информацию о внешних ключах
+        fk_query = """
+        SELECT
+            COLUMN_NAME,
+            REFERENCED_TABLE_NAME,
+            REFERENCED_COLUMN_NAME
+        FROM information_schema.KEY_COLUMN_USAGE
+        WHERE TABLE_SCHEMA = DATABASE()
+        AND TABLE_NAME = %s
+        AND REFERENCED_TABLE_NAME IS NOT NULL
+        """
+        foreign_keys = current_app.config['sql_provider'].execute_query(fk_query, (table_name,))
+        
+        return jsonify({
+            'columns': columns,
+            'foreign_keys': foreign_keys
+        })
+    except QueryLimitError:
+        raise
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@admin_bp.route('/table/<table_name>/row', methods=['POST'])
+@login_required
+@role_required(['admin'])
+def add_row(table_name):
+    """Добавить новую запись (или список записей) в таблицу"""
+    try:
+        data = request.get_json()
+        rows = data if isinstance(data, list) else [data]
+        
+        if not rows or not rows[0]:
+            return jsonify({'error': 'Нет данных для добавления'}), 400
+        
+        columns = list(rows[0].keys())
+        if any(set(row.keys()) != set(columns) for row in rows):
+            return jsonify({'error': 'Все записи должны содержать одинаковые поля'}), 400
+        
+        result = current_app.config['sql_provider'].bulk_insert(
+            table_name,
+            columns,
+            (tuple(row[column] for column in columns) for row in rows)
+        )
+        doctor_column = SLOT_INDEX_TABLES.get(table_name)
+        invalidate_table_caches(
+            table_name,
+            [row[doctor_column] for row in rows] if doctor_column in columns else None
+        )
+        
+        return jsonify({
+            'message': 'Запись успешно добавлена',
+            'affected_rows': result['affected_rows']
+        })
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except QueryLimitError:
+        raise
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@admin_bp.route('/table/<table_name>/row/<int:row_id>', methods=['PUT'])
+@login_required
+@role_required(['admin'])
+def update_row(table_name, row_id):
+    """Обновить существующую запись в таблице"""
+    try:
+        data = request.get_json()
+        
+        # Формируем SQL запрос
+        set_clause = ', '.join([f"{key} = %s" for key in data.keys()])
+        query = f"UPDATE {table_name} SET {set_clause} WHERE id_{table_name} = %s"
+        
+        # Выполняем запрос
+        values = tuple(data.values()) + (row_id,)
+        current_app.config['sql_provider'].execute_query(query, values)
+        
+        if table_name == 'user' and SESSION_SENSITIVE_USER_FIELDS & data.keys():
+            revoke_user_sessions(row_id)
+        invalidate_table_caches(table_name)
+        
+        return jsonify({'message': 'Запись успешно обновлена'})
+    except QueryLimitError:
+        raise
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@admin_bp.route('/table/<table_name>/row/<int:row_id>', methods=['DELETE'])
+@login_required
+@role_required(['admin'])
+def delete_row(table_name, row_id):
+    """Удалить запись из таблицы"""
+    try:
+        doctor_ids = None
+        doctor_column = SLOT_INDEX_TABLES.get(table_name)
+        if doctor_column:
+            # Врач удаляемой строки нужен, чтобы сбросить индекс слотов только у него
+            doctor_query = f"SELECT {doctor_column} FROM {table_name} WHERE id_{table_name} = %s"
+            doctor_ids = [
+                row[doctor_column]
+                for row in current_app.config['sql_provider'].execute_query(doctor_query, (row_id,), read_only=False)
+            ]
+        query = f"DELETE FROM {table_name} WHERE id_{table_name} = %s"
+        current_app.config['sql_provider'].execute_query(query, (row_id,))
+        if table_name == 'user':
+            revoke_user_sessions(row_id)
+        invalidate_table_caches(table_name, doctor_ids)
+        return jsonify({'message': 'Запись успешно удалена'})
+    except QueryLimitError:
+        raise
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@admin_bp.route('/users/<int:user_id>/sessions', methods=['GET'])
+@login_required
+@role_required(['admin'])
+def get_user_sessions(user_id):
+    """Активные сессии пользователя"""
+    return jsonify(list_user_sessions(user_id))
+
+@admin_bp.route('/users/<int:user_id>/sessions', methods=['DELETE'])
+@login_required
+@role_required(['admin'])
+def delete_user_sessions(user_id):
+    """Отозвать все сессии пользователя"""
+    revoked = revoke_user_sessions(user_id)
+    return jsonify({'message': 'Сессии пользователя отозваны', 'revoked': revoked})
+
+@admin_bp.route('/stats/pool', methods=['GET'])
+@login_required
+@role_required(['admin'])
+def get_pool_stats():
+    """Статистика пула соединений с БД"""
+    return jsonify(current_app.config['sql_provider'].get_pool_stats())
+
+@admin_bp.route('/stats/queries', methods=['GET'])
+@login_required
+@role_required(['admin'])
+def get_query_stats():
+    """Статистика выполнения запросов: число вызовов, строки, p50/p95/p99"""
+    return jsonify(current_app.config['sql_provider'].get_query_stats())
+
+@admin_bp.route('/stats/queries', methods=['DELETE'])
+@login_required
+@role_required(['admin'])
+def reset_query_stats():
+    """Сбросить накопленную статистику запросов"""
+    current_app.config['sql_provider'].stats.reset()
+    return jsonify({'message': 'Статистика сброшена'})
+
+@admin_bp.route('/stats/governor', methods=['GET'])
+@login_required
+@role_required(['admin'])
+def get_governor_stats():
+    """Счётчики прерванных запросов: таймауты, превышения лимита строк, KILL QUERY"""
+    return jsonify(current_app.config['sql_provider'].get_governor_stats())
+
+@admin_bp.route('/stats/sessions', methods=['GET'])
+@login_required
+@role_required(['admin'])
+def get_session_cache_stats():
+    """Статистика кеша сессий и пула соединений Redis текущего воркера"""
+    stats = current_app.config['session_cache'].stats()
+    stats['redis_pool'] = RedisProvider.get_pool_stats()
+    stats['mode'] = current_app.config['SESSION_MODE']
+    stats['denylist'] = current_app.config['session_denylist'].stats()
+    return jsonify(stats)
+
+@admin_bp.route('/stats/passwords', methods=['GET'])
+@login_required
+@role_required(['admin'])
+def get_password_hasher_stats():
+    """Очередь и время хеширования паролей текущего воркера"""
+    return jsonify(current_app.config['password_hasher'].stats())
+
+@admin_bp.route('/stats/cache', methods=['GET'])
+@login_required
+@role_required(['admin'])
+def get_response_cache_stats():
+    """Попадания и промахи кеша ответов по эндпоинтам на этом воркере"""
+    return jsonify(current_app.config['response_cache'].stats())
+
+@admin_bp.route('/stats/report_jobs', methods=['GET'])
+@login_required
+@role_required(['admin'])
+def get_report_jobs_stats():
+    """Длина очереди генерации отчётов"""
+    return jsonify(current_app.config['report_jobs'].stats())
+
+@admin_bp.route('/stats/rate_limit', methods=['GET'])
+@login_required
+@role_required(['admin'])
+def get_rate_limit_stats():
+    """Настройки ограничителя попыток входа и число отказов по всем воркерам"""
+    return jsonify(current_app.config['rate_limiter'].stats())
+
+@admin_bp.route('/execute', methods=['POST'])
+@login_required
+@role_required(['admin'])
+def execute_query():
+    """Выполнить произвольный SQL запрос"""
+    try:
+        data = request.get_json()
+        query = data.get('query')
+        
+        if not query:
+            return jsonify({'error': 'Запрос не указан'}), 400
+            
+        # Проверяем, что запрос не содержит опасных операций
+        dangerous_keywords = ['DROP', 'TRUNCATE', 'DELETE FROM', 'ALTER']
+        if any(keyword in query.upper() for keyword in dangerous_keywords):
+            return jsonify({
+                'error': 'Запрос содержит потенциально опасные операции'
+            }), 400
+        
+        result = current_app.config['sql_provider'].execute_query(query)
+        # Произвольный запрос мог изменить что угодно
+        if not query.lstrip().upper().startswith('SELECT'):
+            invalidate_table_caches()
+        return jsonify({'result': result})
+    except QueryLimitError:
+        raise
+    except Exception as e:
         return jsonify({'error': str(e)}), 500 
\ No newline at end of file
@@ -1,62 +1,171 @@
 from flask import Blueprint, jsonify, request, current_app
+from mysql.connector import IntegrityError, errorcode
+from redis import RedisError
 from .auth import login_required
+from .doctor import MSK
 from datetime import datetime, timedelta
+from itertools import islice
+import heapq
+from app.database.governor import QueryLimits
+from app.database.slot_index import DayAvailability, SLOT_MINUTES, format_minutes, to_minutes
 
 appointment_bp = Blueprint('appointment', __name__)
 
+# Максимальная длина диапазона дат в одном запросе
+MAX_RANGE_DAYS = 92
+# Поиск ближайших слотов: окно по умолчанию и предел числа результатов
+EARLIEST_DEFAULT_DAYS = 30
+EARLIEST_MAX_LIMIT = 50
+# Записи отделения за всё окно читаются одним запросом - лимит строк выше, чем у остального blueprint
+EARLIEST_QUERY_LIMITS = QueryLimits(timeout=3, max_rows=200000)
+
 @appointment_bp.route('/api/appointment/available-slots', methods=['GET'])
 @login_required
 def get_available_slots():
     doctor_id = request.args.get('doctor_id')
     date = request.args.get('date')
     
+    # Диапазон: ?from=YYYY-MM-DD&to=YYYY-MM-DD или ?month=YYYY-MM
+    if doctor_id and not date and (request.args.get('month') or request.args.get('from')):
+        return get_available_slots_range(doctor_id)
+    
     if not doctor_id or not date:
         return jsonify({'error': 'Не указан врач или дата'}), 400
     
+    try:
+        doctor_id = int(doctor_id)
+        day = datetime.strptime(date, '%Y-%m-%d').date()
+    except ValueError:
+        return jsonify({'error': 'Некорректный врач или дата'}), 400
+    
+    availability = get_day_availability(doctor_id, day)
+    
+    # Дни без приёма хранятся в индексе как день без слотов
+    if availability.count == 0:
+        return jsonify({'error': 'В этот день врач не принимает'}), 404
+    
+    # Слоты, которые сейчас оформляют другие пациенты, не показываем
+    held = current_app.config['slot_holds'].held_by_others(doctor_id, [day], request.user_id)[day]
+    
+    return jsonify({
+        'date': date,
+        'doctor_id': str(doctor_id),
+        'available_slots': [slot for slot in availability.free_slots() if slot not in held]
+    })
+
+def parse_date_range(args):
+    """Первый и последний день диапазона из ?month= или ?from=&to="""
+    month = args.get('month')
+    if month:
+        first = datetime.strptime(month, '%Y-%m').date()
+        last = (first.replace(day=28) + timedelta(days=4)).replace(day=1) - timedelta(days=1)
+        return first, last
+    first = datetime.strptime(args['from'], '%Y-%m-%d').date()
+    last = datetime.strptime(args.get('to') or args['from'], '%Y-%m-%d').date()
+    return first, last
+
+def get_available_slots_range(doctor_id):
+    """Свободные слоты на каждый день диапазона одним ответом"""
+    try:
+        doctor_id = int(doctor_id)
+        first, last = parse_date_range(request.args)
+    except (KeyError, ValueError):
+        return jsonify({'error': 'Некорректный врач или диапазон дат'}), 400
+    
+    if last < first or (last - first).days >= MAX_RANGE_DAYS:
+        return jsonify({'error': f'Диапазон должен быть от 1 до {MAX_RANGE_DAYS} дней'}), 400
+    
+    days = [first + timedelta(days=offset) for offset in range((last - first).days + 1)]
+    slot_index = current_app.config['slot_index']
+    availability, generation = slot_index.get_many(doctor_id, days)
+    missing = [day for day in days if availability[day] is None]
+    if missing:
+        built = build_range_availability(doctor_id, missing)
+        slot_index.store_many(doctor_id, built, generation)
+        availability.update(built)
+    
+    working_days = [day for day in days if availability[day].count]
+    held = current_app.config['slot_holds'].held_by_others(doctor_id, working_days, request.user_id)
+    
+    # Дни без приёма не попадают в ответ; capacity - число слотов по расписанию
+    return jsonify({
+        'doctor_id': str(doctor_id),
+        'from': first.isoformat(),
+        'to': last.isoformat(),
+        'slot_minutes': SLOT_MINUTES,
+        'days': {
+            day.isoformat(): {
+                'capacity': availability[day].count,
+                'available_slots': [slot for slot in availability[day].free_slots() if slot not in held[day]]
+            }
+            for day in working_days
+        }
+    })
+
+def build_range_availability(doctor_id: int, days) -> dict:
+    """Свободные слоты для набора дней: одно чтение расписания и один проход по timetable"""
+    schedule_query = current_app.config['sql_provider'].get_query('appointment/get_doctor_week_schedule.sql')
+    schedule = {}
+    for row in current_app.config['sql_provider'].execute_query(schedule_query, (doctor_id,)):
+        schedule.setdefault(row['day_of_week'], row)
+    
+    busy = {}
+    working_days = [day for day in days if day.weekday() + 1 in schedule]
+    if working_days:
+        appointments_query = current_app.config['sql_provider'].get_query('appointment/get_doctor_appointments_range.sql')
+        appointments = current_app.config['sql_provider'].execute_query(
+            appointments_query,
+            (doctor_id, min(working_days), max(working_days))
+        )
+        for row in appointments:
+            busy.setdefault(row['admission'], []).append(row['appointment_time'])
+    
+    result = {}
+    for day in days:
+        day_schedule = schedule.get(day.weekday() + 1)
+        if day_schedule is None:
+            result[day] = DayAvailability(0, 0, 0)
+        else:
+            result[day] = DayAvailability.build(
+                day_schedule['start_time'],
+                day_schedule['end_time'],
+                busy.get(day, ())
+            )
+    return result
+
+def get_day_availability(doctor_id: int, day) -> DayAvailability:
+    """Сначала индекс свободных слотов, в MySQL идём только если день ещё не построен"""
+    slot_index = current_app.config['slot_index']
+    availability, generation = slot_index.get(doctor_id, day)
+    if availability is None:
+        availability = build_day_availability(doctor_id, day)
+        slot_index.store(doctor_id, day, availability, generation)
+    return availability
+
+def build_day_availability(doctor_id: int, day) -> DayAvailability:
+    """Свободные слоты дня по расписанию и уже созданным записям"""
     # Получаем расписание врача на этот день недели
     schedule_query = current_app.config['sql_provider'].get_query('appointment/get_doctor_schedule.sql')
     schedule = current_app.config['sql_provider'].execute_query(
         schedule_query, 
-        (doctor_id, datetime.strptime(date, '%Y-%m-%d').weekday() + 1)
+        (doctor_id, day.weekday() + 1)
     )
     
     if not schedule:
-        return jsonify({'error': 'В этот день врач не принимает'}), 404
+        return DayAvailability(0, 0, 0)
     
     # Получаем уже занятые слоты
     appointments_query = current_app.config['sql_provider'].get_query('appointment/get_doctor_appointments.sql')
     appointments = current_app.config['sql_provider'].execute_query(
         appointments_query,
-        (doctor_id, date)
+        (doctor_id, day)
     )
     
-    # Конвертируем занятые слоты в строки времени
-    busy_times = set()
-    for app in appointments:
-        seconds = int(app['appointment_time'].total_seconds())
-        time_str = f"{seconds // 3600:02d}:{(seconds % 3600) // 60:02d}"
-        busy_times.add(time_str)
-    
-    # Формируем доступные временные слоты
-    start_seconds = int(schedule[0]['start_time'].total_seconds())
-    end_seconds = int(schedule[0]['end_time'].total_seconds())
-    
-    start_time = datetime.strptime(f"{start_seconds // 3600:02d}:{(start_seconds % 3600) // 60:02d}", '%H:%M')
-    end_time = datetime.strptime(f"{end_seconds // 3600:02d}:{(end_seconds % 3600) // 60:02d}", '%H:%M')
-    slot = start_time
-    
-    available_slots = []
-    while slot < end_time:
-        slot_str = slot.strftime('%H:%M')
-        if slot_str not in busy_times:
-            available_slots.append(slot_str)
-        slot += timedelta(minutes=30)  # 30-минутные слоты
-    
-    return jsonify({
-        'date': date,
-        'doctor_id': doctor_id,
-        'available_slots': available_slots
-    })
+    return DayAvailability.build(
+        schedule[0]['start_time'],
+        schedule[0]['end_time'],
+        (row['appointment_time'] for row in appointments)
+    )
 
 @appointment_bp.route('/api/appointment/create', methods=['POST'])
 @login_required
@@ -65,53 +174,213 @@ def create_appointment():
     
     if not all(key in data for key in ['doctor_id', 'date', 'time']):
         return jsonify({'error': 'Не все данные указаны'}), 400
+    # Разбираем слот один раз: после записи в БД ошибка разбора уже не должна превращаться в 500
+    try:
+        doctor_id, day, slot_time = parse_slot(data)
+    except (TypeError, ValueError):
+        return jsonify({'error': 'Некорректные врач, дата или время'}), 400
     
-    # Проверяем, свободно ли время
-    check_query = current_app.config['sql_provider'].get_query('appointment/check_slot.sql')
-    existing = current_app.config['sql_provider'].execute_query(
-        check_query,
-        (data['doctor_id'], data['date'], data['time'])
-    )
-    
-    if existing:
-        return jsonify({'error': 'Это время уже занято'}), 409
-    
-    # Получаем ID пациента по user_id
-    patient_query = current_app.config['sql_provider'].get_query('appointment/get_patient_id.sql')
-    patient = current_app.config['sql_provider'].execute_query(
-        patient_query,
-        (request.user_id,)
-    )
-    
-    if not patient:
+    # ID пациента определён при входе и лежит в сессии
+    if request.patient_id is None:
         return jsonify({'error': 'Пациент не найден'}), 404
-
-    # Получаем ID кабинета
-    cabinet_query = current_app.config['sql_provider'].get_query('appointment/get_cabinet_id.sql')
-    cabinet = current_app.config['sql_provider'].execute_query(
-        cabinet_query,
-        (data['doctor_id'],)
-    )
-
-    if not cabinet:
-        return jsonify({'error': 'Кабинет не найден'}), 404
     
-    # Создаем запись
+    # Своё удержание слота снимаем, чужое - отказ без обращения к БД
+    try:
+        released = current_app.config['slot_holds'].release(doctor_id, day, slot_time, request.user_id)
+    except RedisError as e:
+        # Без Redis запись всё равно корректна: двойную запись не пропустит уникальный ключ
+        print(f"Slot hold release failed: {str(e)}")
+        released = True
+    if not released:
+        return jsonify({'error': 'Это время сейчас оформляет другой пациент'}), 409
+    
+    # Одна вставка: кабинет выбирается в INSERT ... SELECT, занятость слота проверяет
+    # уникальный ключ (doctor_id_doc, admission, time), поэтому две одновременные записи не пройдут обе
     insert_query = current_app.config['sql_provider'].get_query('appointment/create_appointment.sql')
     try:
-        current_app.config['sql_provider'].execute_query(
+        inserted = current_app.config['sql_provider'].execute_query(
             insert_query,
             (
-                cabinet[0]['id_cab'],
-                data['doctor_id'],
-                patient[0]['id_patient'],
-                data['date'],
-                data['time']
+                request.patient_id,
+                day,
+                slot_time,
+                doctor_id
             )
         )
-        return jsonify({'message': 'Запись создана успешно'}), 201
+    except IntegrityError as e:
+        if e.errno == errorcode.ER_DUP_ENTRY:
+            return jsonify({'error': 'Это время уже занято'}), 409
+        return jsonify({'error': str(e)}), 500
     except Exception as e:
         return jsonify({'error': str(e)}), 500
+    
+    # SELECT ничего не нашёл: нет такого врача или у его отделения нет кабинета
+    if not inserted:
+        return jsonify({'error': 'Кабинет не найден'}), 404
+    
+    # Запись уже сохранена - ошибка Redis не должна превращать её в 500
+    try:
+        current_app.config['slot_index'].mark(doctor_id, day, slot_time, free=False)
+        current_app.config['response_cache'].invalidate('timetable')
+    except RedisError as e:
+        print(f"Cache update after booking failed: {str(e)}")
+    return jsonify({'message': 'Запись создана успешно'}), 201
+
+@appointment_bp.route('/api/appointment/earliest', methods=['GET'])
+@login_required
+def find_earliest_slots():
+    """N ближайших свободных слотов среди всех врачей отделения или специализации.
+
+    ?department_id= или ?specialization=, окно ?from=&to= (по умолчанию 30 дней с сегодня), ?limit=
+    """
+    department_id = request.args.get('department_id', type=int)
+    specialization = request.args.get('specialization')
+    if department_id is None and not specialization:
+        return jsonify({'error': 'Не указано отделение или специализация'}), 400
+    
+    limit = max(1, min(request.args.get('limit', 10, type=int), EARLIEST_MAX_LIMIT))
+    now = datetime.now(MSK).replace(tzinfo=None)
+    try:
+        first = datetime.strptime(request.args['from'], '%Y-%m-%d').date() if request.args.get('from') else now.date()
+        last = datetime.strptime(request.args['to'], '%Y-%m-%d').date() if request.args.get('to') \
+            else first + timedelta(days=EARLIEST_DEFAULT_DAYS - 1)
+    except ValueError:
+        return jsonify({'error': 'Некорректный диапазон дат'}), 400
+    first = max(first, now.date())
+    if last < first or (last - first).days >= MAX_RANGE_DAYS:
+        return jsonify({'error': f'Диапазон должен быть от 1 до {MAX_RANGE_DAYS} дней'}), 400
+    
+    params = {
+        'department_id': department_id,
+        'specialization': specialization or None,
+        'date_from': first,
+        'date_to': last
+    }
+    
+    # Расписания всех подходящих врачей одним запросом
+    schedule_query = current_app.config['sql_provider'].get_query('appointment/search_doctor_schedules.sql')
+    doctors = {}
+    for row in current_app.config['sql_provider'].execute_query(schedule_query, params):
+        doctor = doctors.setdefault(row['id_doc'], {
+            'full_name': row['full_name'],
+            'specialization': row['specialization'],
+            'schedule': {}
+        })
+        doctor['schedule'].setdefault(row['day_of_week'], row)
+    
+    slots = []
+    if doctors:
+        # Занятые слоты этих врачей за всё окно - один проход по (doctor_id_doc, admission)
+        appointments_query = current_app.config['sql_provider'].get_query('appointment/search_doctor_appointments.sql')
+        busy = {}
+        for row in current_app.config['sql_provider'].execute_query(
+            appointments_query, params, limits=EARLIEST_QUERY_LIMITS
+        ):
+            busy.setdefault((row['doctor_id_doc'], row['admission']), []).append(row['time'])
+        
+        days = [first + timedelta(days=offset) for offset in range((last - first).days + 1)]
+        # k-way merge упорядоченных потоков слотов каждого врача: дальше первых N слотов не считаем
+        merged = heapq.merge(*(
+            doctor_free_slots(doctor_id, doctor['schedule'], days, busy, now)
+            for doctor_id, doctor in doctors.items()
+        ))
+        slots = take_unheld_slots(merged, limit)
+    
+    return jsonify({
+        'from': first.isoformat(),
+        'to': last.isoformat(),
+        'slots': [
+            {
+                'doctor_id': doctor_id,
+                'full_name': doctors[doctor_id]['full_name'],
+                'specialization': doctors[doctor_id]['specialization'],
+                'date': day.isoformat(),
+                'time': format_minutes(minutes)
+            }
+            for _, doctor_id, day, minutes in slots
+        ]
+    })
+
+def doctor_free_slots(doctor_id, schedule, days, busy, now):
+    """Свободные слоты одного врача по возрастанию времени: (начало, врач, дата, минуты)"""
+    for day in days:
+        day_schedule = schedule.get(day.weekday() + 1)
+        if day_schedule is None:
+            continue
+        availability = DayAvailability.build(
+            day_schedule['start_time'],
+            day_schedule['end_time'],
+            busy.get((doctor_id, day), ())
+        )
+        midnight = datetime.combine(day, datetime.min.time())
+        for minutes in availability.free_minutes():
+            start = midnight + timedelta(minutes=minutes)
+            if start > now:
+                yield start, doctor_id, day, minutes
+
+def take_unheld_slots(merged, limit):
+    """Первые limit слотов, не удерживаемых другими пациентами; удержания проверяются пачками"""
+    slot_holds = current_app.config['slot_holds']
+    result = []
+    while len(result) < limit:
+        batch = list(islice(merged, (limit - len(result)) * 2))
+        if not batch:
+            break
+        held = slot_holds.held_by_others_many(
+            list({(doctor_id, day) for _, doctor_id, day, _ in batch}),
+            request.user_id
+        )
+        for slot in batch:
+            if format_minutes(slot[3]) not in held[(slot[1], slot[2])]:
+                result.append(slot)
+                if len(result) == limit:
+                    break
+    return result
+
+def parse_slot(data):
+    """Врач, дата и время слота из тела запроса"""
+    doctor_id = int(data['doctor_id'])
+    day = datetime.strptime(data['date'], '%Y-%m-%d').date()
+    slot_time = format_minutes(to_minutes(data['time']))
+    return doctor_id, day, slot_time
+
+@appointment_bp.route('/api/appointment/hold', methods=['POST'])
+@login_required
+def hold_slot():
+    """Удерживает выбранное время за пациентом, пока он подтверждает запись"""
+    data = request.get_json() or {}
+    try:
+        doctor_id, day, slot_time = parse_slot(data)
+    except (KeyError, TypeError, ValueError):
+        return jsonify({'error': 'Не все данные указаны'}), 400
+    
+    if slot_time not in get_day_availability(doctor_id, day).free_slots():
+        return jsonify({'error': 'Это время уже занято'}), 409
+    
+    slot_holds = current_app.config['slot_holds']
+    if not slot_holds.hold(doctor_id, day, slot_time, request.user_id):
+        return jsonify({'error': 'Это время сейчас оформляет другой пациент'}), 409
+    
+    return jsonify({
+        'doctor_id': doctor_id,
+        'date': day.isoformat(),
+        'time': slot_time,
+        'expires_in': slot_holds.ttl
+    }), 201
+
+@appointment_bp.route('/api/appointment/hold', methods=['DELETE'])
+@login_required
+def release_slot():
+    """Снимает удержание, если пациент выбрал другое время или ушёл со страницы"""
+    data = request.get_json(silent=True) or request.args
+    try:
+        doctor_id, day, slot_time = parse_slot(data)
+    except (KeyError, TypeError, ValueError):
+        return jsonify({'error': 'Не все данные указаны'}), 400
+    
+    if not current_app.config['slot_holds'].release(doctor_id, day, slot_time, request.user_id):
+        return jsonify({'error': 'Это время удерживает другой пациент'}), 403
+    return jsonify({'message': 'Удержание снято'})
 
 @appointment_bp.route('/check-slots', methods=['GET'])
 def check_slots():
@@ -122,31 +391,13 @@ def check_slots():
         return jsonify({'error': 'Не все параметры указаны'}), 400
         
     try:
-        # Получаем расписание врача на этот день недели
-        schedule_query = """
-            SELECT * FROM doctor_schedule 
-            WHERE doctor_id = %s AND day_of_week = WEEKDAY(%s) + 1
-        """
-        schedule = current_app.config['sql_provider'].execute_query(schedule_query, (doctor_id, date))
+        doctor_id = int(doctor_id)
+        day = datetime.strptime(date, '%Y-%m-%d').date()
         
-        if not schedule:
-            return jsonify({'has_slots': False})
-            
-        # Получаем занятые слоты
-        booked_slots_query = """
-            SELECT time FROM timetable 
-            WHERE doctor_id_doc = %s AND admission = %s
-        """
-        booked_slots = current_app.config['sql_provider'].execute_query(
-            booked_slots_query, 
-            (doctor_id, date)
-        )
+        # Вместимость дня берётся из расписания врача, а не из фиксированного числа слотов
+        availability = get_day_availability(doctor_id, day)
         
-        # Если все слоты заняты
-        if len(booked_slots) >= 8:  # Предполагаем максимум 8 слотов в день
-            return jsonify({'has_slots': False})
-            
-        return jsonify({'has_slots': True})
+        return jsonify({'has_slots': availability.free_mask != 0})
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
\ No newline at end of file
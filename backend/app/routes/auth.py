@@ -1,24 +1,84 @@
 from flask import Blueprint, request, jsonify, current_app
-import bcrypt
 import uuid
 from datetime import timedelta
 import json
+import redis
 from app.database.redis_provider import RedisProvider
+from app.database.rate_limiter import retry_after_header
 
 auth_bp = Blueprint('auth', __name__)
 
-def create_session(user_id: int, role: str) -> str:
+# Срок жизни сессии, продлевается при каждом обращении
+SESSION_TTL = timedelta(hours=24)
+
+# Режимы сессий: запись в Redis или подписанный токен в cookie
+SESSION_MODE_REDIS = 'redis'
+SESSION_MODE_TOKEN = 'token'
+
+def check_rate_limit(**values):
+    """Ответ 429, если исчерпана любая из корзин; вызывается до обращений к БД и bcrypt"""
+    allowed, retry_after = current_app.config['rate_limiter'].hit(values)
+    if allowed:
+        return None
+    response = jsonify({'error': 'Слишком много попыток, повторите позже'})
+    response.status_code = 429
+    response.headers['Retry-After'] = retry_after_header(retry_after)
+    return response
+
+def session_key(session_id: str) -> str:
+    return f"session:{session_id}"
+
+def user_sessions_key(user_id: int) -> str:
+    """Множество id сессий пользователя - для отзыва всех сессий без SCAN"""
+    return f"user_sessions:{user_id}"
+
+# Предметная идентичность пользователя: вычисляется один раз при входе и хранится в сессии
+IDENTITY_FIELDS = ('patient_id', 'doctor_id', 'department_id')
+
+# Сессия хранится хешем с короткими именами полей; пустые поля не записываются
+_SESSION_HASH_FIELDS = {
+    'user_id': 'u',
+    'role': 'r',
+    'patient_id': 'p',
+    'doctor_id': 'd',
+    'department_id': 'dep'
+}
+
+def encode_session(session: dict) -> dict:
+    return {
+        short: session[field]
+        for field, short in _SESSION_HASH_FIELDS.items()
+        if session.get(field) is not None
+    }
+
+def decode_session(data: dict) -> dict:
+    session = {}
+    for field, short in _SESSION_HASH_FIELDS.items():
+        value = data.get(short)
+        session[field] = value if value is None or field == 'role' else int(value)
+    return session
+
+def store_session(pipe, session_id: str, session: dict, ttl):
+    """Добавляет в pipe запись сессии и её регистрацию в индексе пользователя"""
+    pipe.hset(session_key(session_id), mapping=encode_session(session))
+    pipe.expire(session_key(session_id), ttl)
+    # У индекса нет TTL: срок сессий скользящий, истёкшие id вычищаются при следующем входе
+    pipe.sadd(user_sessions_key(session['user_id']), session_id)
+
+def create_session(user_id: int, role: str, identity: dict = None) -> str:
     session_id = str(uuid.uuid4())
     session_data = {
         'user_id': user_id,
         'role': role
     }
-    redis_client = RedisProvider.get_client()
-    redis_client.setex(
-        f"session:{session_id}",
-        timedelta(hours=24),
-        json.dumps(session_data)
-    )
+    for field in IDENTITY_FIELDS:
+        session_data[field] = (identity or {}).get(field)
+    if current_app.config['SESSION_MODE'] == SESSION_MODE_TOKEN:
+        return current_app.config['session_signer'].issue(session_data)
+    list_user_sessions(user_id)
+    pipe = RedisProvider.pipeline(transaction=True)
+    store_session(pipe, session_id, session_data, SESSION_TTL)
+    pipe.execute()
     return session_id
 
 @auth_bp.route('/init', methods=['POST'])
@@ -57,15 +117,14 @@ def init_test_users():
         if not result:
             print(f"Creating user: {user['login']}")
             # Хэшируем пароль
-            salt = bcrypt.gensalt()
-            password_hash = bcrypt.hashpw(user['password'].encode('utf-8'), salt)
+            password_hash = current_app.config['password_hasher'].hash(user['password'])
             
             # Формируем запросы для транзакции
             transaction_queries = [
                 # Создаем пользователя
                 (
                     "INSERT INTO `user` (login, password_hash, role_id) VALUES (%s, %s, %s)",
-                    (user['login'], password_hash.decode('utf-8'), user['role_id'])
+                    (user['login'], password_hash, user['role_id'])
                 ),
                 # Получаем ID пользователя
                 (
@@ -118,6 +177,8 @@ def init_test_users():
             created_users.append(user['login'])
     
     if created_users:
+        # Среди тестовых пользователей есть врачи с расписанием
+        current_app.config['response_cache'].invalidate('doctor', 'doctor_schedule')
         return jsonify({
             'message': 'Тестовые пользователи созданы успешно',
             'created_users': created_users
@@ -134,22 +195,25 @@ def register():
     if not all(key in data for key in ['login', 'password']):
         return jsonify({'error': 'Не все поля заполнены'}), 400
     
+    limited = check_rate_limit(register_ip=request.remote_addr)
+    if limited:
+        return limited
+    
     # Проверяем существование пользователя
     check_query = current_app.config['sql_provider'].get_query('auth/check_user.sql')
-    result = current_app.config['sql_provider'].execute_query(check_query, (data['login'],))
+    result = current_app.config['sql_provider'].execute_query(check_query, (data['login'],), read_only=False)
     
     if result:
         return jsonify({'error': 'Пользователь с таким логином уже существует'}), 409
     
     # Хэшируем пароль
-    salt = bcrypt.gensalt()
-    password_hash = bcrypt.hashpw(data['password'].encode('utf-8'), salt)
+    password_hash = current_app.config['password_hasher'].hash(data['password'])
     
     # Выполняем все операции в одной транзакции
     queries = [
         (
             "INSERT INTO `user` (login, password_hash, role_id) VALUES (%s, %s, %s)",
-            (data['login'], password_hash.decode('utf-8'), 2)
+            (data['login'], password_hash, 2)
         ),
         (
             "SELECT LAST_INSERT_ID() as id",
@@ -175,6 +239,10 @@ def login():
     if not all(key in data for key in ['login', 'password']):
         return jsonify({'error': 'Не все поля заполнены'}), 400
     
+    limited = check_rate_limit(login_ip=request.remote_addr, login_user=data['login'])
+    if limited:
+        return limited
+    
     # Добавим отладочный вывод
     print(f"Login attempt for user: {data['login']}")
     
@@ -192,11 +260,23 @@ def login():
     print(f"Input password: {data['password']}")
     
     # Проверяем пароль
-    if not bcrypt.checkpw(data['password'].encode('utf-8'), user['password_hash'].encode('utf-8')):
+    password_hasher = current_app.config['password_hasher']
+    if not password_hasher.verify(data['password'], user['password_hash']):
         return jsonify({'error': 'Неверный логин или пароль'}), 401
     
+    # Стоимость bcrypt поменялась в настройках - перехешируем, пока пароль известен
+    if password_hasher.needs_rehash(user['password_hash']):
+        try:
+            rehash_query = current_app.config['sql_provider'].get_query('auth/update_password_hash.sql')
+            current_app.config['sql_provider'].execute_query(
+                rehash_query,
+                (password_hasher.hash(data['password']), user['id_user'])
+            )
+        except Exception as e:
+            print(f"Password rehash failed: {str(e)}")
+    
     # Создаем сессию
-    session_id = create_session(user['id_user'], user['role_name'])
+    session_id = create_session(user['id_user'], user['role_name'], user)
     
     response = jsonify({
         'message': 'Авторизация успешна',
@@ -213,22 +293,137 @@ def login():
         httponly=True,
         secure=True,
         samesite='Strict',
-        max_age=86400
+        max_age=int(SESSION_TTL.total_seconds())
     )
     
     return response
 
+def revoke_session(session_id: str):
+    """Удаляет сессию из Redis и из кешей всех воркеров: DEL и PUBLISH одним пакетом"""
+    if current_app.config['SESSION_MODE'] == SESSION_MODE_TOKEN:
+        session = current_app.config['session_signer'].verify(session_id)
+        if session:
+            current_app.config['session_denylist'].revoke(session['jti'], session['exp'])
+        return
+    session = current_app.config['session_cache'].get(session_id)
+    user_id = session['user_id'] if session else session_owner(session_id)
+    pipe = RedisProvider.pipeline(transaction=True)
+    pipe.delete(session_key(session_id))
+    if user_id is not None:
+        pipe.srem(user_sessions_key(user_id), session_id)
+    current_app.config['session_cache'].invalidate(session_id, pipe)
+    pipe.execute()
+
+def session_owner(session_id: str):
+    """user_id сессии из Redis - и для хеша, и для JSON строки старого формата"""
+    client = RedisProvider.get_client()
+    try:
+        return client.hget(session_key(session_id), 'u')
+    except redis.ResponseError:
+        # WRONGTYPE: сессия создана до перехода на хеши
+        session_data = client.get(session_key(session_id))
+    try:
+        return json.loads(session_data).get('user_id') if session_data else None
+    except (ValueError, AttributeError):
+        return None
+
+def list_user_sessions(user_id: int) -> list:
+    """Живые сессии пользователя; протухшие id заодно вычищаются из индекса"""
+    client = RedisProvider.get_client()
+    session_ids = sorted(client.smembers(user_sessions_key(user_id)))
+    if not session_ids:
+        return []
+    pipe = RedisProvider.pipeline()
+    for session_id in session_ids:
+        pipe.ttl(session_key(session_id))
+    ttls = pipe.execute()
+    stale = [session_id for session_id, ttl in zip(session_ids, ttls) if ttl < 0]
+    if stale:
+        client.srem(user_sessions_key(user_id), *stale)
+    return [
+        {'session_id': session_id, 'expires_in': ttl}
+        for session_id, ttl in zip(session_ids, ttls)
+        if ttl >= 0
+    ]
+
+def revoke_user_sessions(user_id: int) -> int:
+    """Отзывает все сессии пользователя одним пакетом команд, например после смены пароля или роли"""
+    if current_app.config['SESSION_MODE'] == SESSION_MODE_TOKEN:
+        current_app.config['session_denylist'].revoke_user(user_id)
+        return 0
+    client = RedisProvider.get_client()
+    session_ids = client.smembers(user_sessions_key(user_id))
+    pipe = RedisProvider.pipeline(transaction=True)
+    for session_id in session_ids:
+        pipe.delete(session_key(session_id))
+        current_app.config['session_cache'].invalidate(session_id, pipe)
+    pipe.delete(user_sessions_key(user_id))
+    pipe.execute()
+    return len(session_ids)
+
 @auth_bp.route('/logout', methods=['POST'])
 def logout():
     session_id = request.cookies.get('session_id')
     if session_id:
-        redis_client = RedisProvider.get_client()
-        redis_client.delete(f"session:{session_id}")
+        revoke_session(session_id)
     
     response = jsonify({'message': 'Выход выполнен успешно'})
     response.delete_cookie('session_id')
     return response
 
+def upgrade_session(session_id: str):
+    """Переводит сессию старого формата (JSON строка) в хеш и регистрирует её в индексе пользователя.
+
+    Сессии без идентичности в payload дополняются одним запросом.
+    """
+    pipe = RedisProvider.pipeline()
+    pipe.get(session_key(session_id))
+    pipe.ttl(session_key(session_id))
+    session_data, ttl = pipe.execute()
+    if not session_data or ttl <= 0:
+        return None
+    session = json.loads(session_data)
+    if 'patient_id' not in session:
+        query = current_app.config['sql_provider'].get_query('auth/get_identity.sql')
+        result = current_app.config['sql_provider'].execute_query(query, (session['user_id'],))
+        identity = result[0] if result else {}
+        for field in IDENTITY_FIELDS:
+            session[field] = identity.get(field)
+    pipe = RedisProvider.pipeline(transaction=True)
+    pipe.delete(session_key(session_id))
+    store_session(pipe, session_id, session, ttl)
+    pipe.execute()
+    return session
+
+def load_session(session_id: str):
+    """Сессия по значению cookie или None, если она истекла или отозвана"""
+    if current_app.config['SESSION_MODE'] == SESSION_MODE_TOKEN:
+        # Подпись и срок проверяются на месте, отзыв - по локальной копии denylist
+        session = current_app.config['session_signer'].verify(session_id)
+        if session is None or current_app.config['session_denylist'].is_revoked(session):
+            return None
+        return session
+    
+    # Сначала смотрим в кеш воркера, в Redis идём только при промахе
+    session_cache = current_app.config['session_cache']
+    session = session_cache.get(session_id)
+    if session is None:
+        generation = session_cache.generation
+        # Чтение и продление срока за один round trip
+        pipe = RedisProvider.pipeline()
+        pipe.hgetall(session_key(session_id))
+        pipe.expire(session_key(session_id), SESSION_TTL)
+        session_data, _ = pipe.execute(raise_on_error=False)
+        if isinstance(session_data, redis.ResponseError):
+            # WRONGTYPE: сессия создана до перехода на хеши
+            session = upgrade_session(session_id)
+        elif session_data:
+            session = decode_session(session_data)
+        if session is None:
+            return None
+        session_cache.put(session_id, session, generation)
+    return session
+
 # Декоратор для проверки аутентификации
 def login_required(f):
     def wrapper(*args, **kwargs):
@@ -236,16 +431,16 @@ def login_required(f):
         if not session_id:
             return jsonify({'error': 'Требуется авторизация'}), 401
         
-        redis_client = RedisProvider.get_client()
-        session_data = redis_client.get(f"session:{session_id}")
-        if not session_data:
+        session = load_session(session_id)
+        if session is None:
             return jsonify({'error': 'Сессия истекла'}), 401
-        
-        session = json.loads(session_data)
         print(f"Session data: {session}")  # Добавляем отладку
         
         request.user_id = session['user_id']
         request.user_role = session['role']
+        request.patient_id = session['patient_id']
+        request.doctor_id = session['doctor_id']
+        request.department_id = session['department_id']
         
         print(f"Set request.user_id = {request.user_id}")  # Добавляем отладку
         print(f"Set request.user_role = {request.user_role}")  # Добавляем отладку
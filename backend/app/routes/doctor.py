@@ -1,6 +1,9 @@
 from flask import Blueprint, request, jsonify, current_app
 from .auth import login_required, role_required
 from datetime import datetime, timedelta, timezone
+from app.database.response_cache import versioned_response
+from app.database.slot_index import format_minutes, to_minutes
+from app.utils.pagination import Page
 
 doctor_bp = Blueprint('doctor', __name__)
 
@@ -10,84 +13,75 @@ MSK = timezone(timedelta(hours=3))
 @doctor_bp.route('/api/doctor/appointments', methods=['GET'])
 @login_required
 @role_required(['doctor'])
+# is_past зависит от текущего времени: приёмы начинаются в целые минуты, поэтому ETag меняется раз в минуту
+@versioned_response('timetable', 'visiting', 'patient', 'cabinet', vary=lambda: datetime.now(MSK).strftime('%Y-%m-%d %H:%M'))
 def get_doctor_appointments():
     print(f"User ID: {request.user_id}")
     
-    # Получаем id врача по user_id
-    doctor_query = """
-        SELECT id_doc 
-        FROM doctor 
-        WHERE user_id = %s
-    """
-    doctor_result = current_app.config['sql_provider'].execute_query(doctor_query, (request.user_id,))
-    
-    if not doctor_result:
+    # id врача определён при входе и лежит в сессии
+    doctor_id = request.doctor_id
+    if doctor_id is None:
         return jsonify({'error': 'Врач не найден'}), 404
     
-    doctor_id = doctor_result[0]['id_doc']
-    
-    # Получаем все записи к врачу
-    appointments_query = """
-        SELECT 
-            t.id_tit as id,
-            t.admission as date,
-            TIME_FORMAT(t.time, '%H:%i') as time_str,
-            t.time,
-            t.appearance,
-            p.passport_data,
-            CONCAT(
-                TIMESTAMPDIFF(YEAR, p.birth, CURDATE()),
-                ' лет'
-            ) as age,
-            t.patient_id_patient,
-            c.type as cabinet_type,
-            c.id_cab as cabinet_number,
-            v.id_vis as visit_id,
-            v.diagnosis,
-            v.complaints
-        FROM timetable t
-        JOIN patient p ON t.patient_id_patient = p.id_patient
-        JOIN cabinet c ON t.cabinet_id_cab = c.id_cab
-        LEFT JOIN visiting v ON v.timetable_id = t.id_tit
-        WHERE t.doctor_id_doc = %s
-        ORDER BY t.admission DESC, t.time DESC
-    """
+    try:
+        page = Page.from_request()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     
-    result = current_app.config['sql_provider'].execute_query(appointments_query, (doctor_id,))
+    # Записи к врачу: целиком или страница по ключу (admission, time, id_tit) с необязательным окном дат
+    appointments_query = current_app.config['sql_provider'].get_query('doctor/get_appointments.sql')
+    result = current_app.config['sql_provider'].execute_query(appointments_query, page.params(doctor_id=doctor_id))
+    result, next_cursor = page.split(result, 'date', 'time', 'id')
     
+    appointments = shape_doctor_appointments(result, datetime.now(MSK))
+    return jsonify(page.response(appointments, next_cursor))
+
+def shape_doctor_appointments(rows, now):
+    """Строки запроса в ответ API за один проход.
+
+    Текущее время берётся один раз, is_past - сравнение кортежей (дата, секунды от полуночи).
+    Даты, время и подписи кабинетов повторяются из строки в строку - форматируем каждое значение один раз.
+    """
+    today = now.date()
+    now_seconds = now.hour * 3600 + now.minute * 60 + now.second + now.microsecond / 1000000
+    dates = {}
+    times = {}
+    cabinets = {}
     appointments = []
-    for row in result:
-        # Получаем текущую дату и время в московском часовом поясе
-        now = datetime.now(MSK)
-        
-        # Преобразуем строку времени в объект time
-        time_str = row['time_str']
+    append = appointments.append
+    for row in rows:
+        day = row['date']
+        date_str = dates.get(day)
+        if date_str is None:
+            date_str = dates[day] = day.strftime('%Y-%m-%d')
         
-        # Создаем datetime для сравнения в московском часовом поясе
-        appointment_datetime = datetime.combine(
-            row['date'], 
-            datetime.strptime(time_str, '%H:%M').time()
-        ).replace(tzinfo=MSK)
+        time_value = times.get(row['time'])
+        if time_value is None:
+            minutes = to_minutes(row['time'])
+            time_value = times[row['time']] = (minutes * 60, format_minutes(minutes))
+        seconds, time_str = time_value
         
-        # Проверяем, прошло ли время приема
-        is_past = appointment_datetime < now
+        cabinet_key = (row['cabinet_number'], row['cabinet_type'])
+        cabinet = cabinets.get(cabinet_key)
+        if cabinet is None:
+            cabinet = cabinets[cabinet_key] = f"Кабинет №{cabinet_key[0]} ({cabinet_key[1]})"
         
-        appointments.append({
+        append({
             'id': row['id'],
-            'date': row['date'].strftime('%Y-%m-%d'),
+            'date': date_str,
             'time': time_str,
             'patient_id': row['patient_id_patient'],
             'passport_data': row['passport_data'],
             'age': row['age'],
-            'cabinet': f"Кабинет №{row['cabinet_number']} ({row['cabinet_type']})",
+            'cabinet': cabinet,
             'appearance': row['appearance'],
-            'is_past': is_past,
+            # Приём в прошлом, если его начало раньше текущего момента по Москве
+            'is_past': (day, seconds) < (today, now_seconds),
             'visit_id': row['visit_id'],
             'diagnosis': row['diagnosis'],
             'complaints': row['complaints']
         })
-    
-    return jsonify(appointments)
+    return appointments
 
 @doctor_bp.route('/api/doctor/add-diagnosis', methods=['POST'])
 @login_required
@@ -98,16 +92,18 @@ def add_diagnosis():
     if not all(key in data for key in ['appointment_id', 'diagnosis', 'complaints']):
         return jsonify({'error': 'Не все параметры указаны'}), 400
 
+    if request.doctor_id is None:
+        return jsonify({'error': 'Врач не найден'}), 404
+
     # Проверяем, существует ли запись и принадлежит ли она этому врачу
     check_query = """
-    SELECT t.*, d.id_doc
+    SELECT t.*
     FROM timetable t
-    JOIN doctor d ON d.id_doc = t.doctor_id_doc
-    WHERE t.id_tit = %s AND d.user_id = %s
+    WHERE t.id_tit = %s AND t.doctor_id_doc = %s
     """
     appointment = current_app.config['sql_provider'].execute_query(
         check_query, 
-        (data['appointment_id'], request.user_id)
+        (data['appointment_id'], request.doctor_id)
     )
 
     if not appointment:
@@ -157,6 +153,8 @@ def add_diagnosis():
                 data['appointment_id']
             )
         )
+        # Новый диагноз может пополнить справочник диагнозов в отчётах
+        current_app.config['response_cache'].invalidate('visiting')
         return jsonify({'message': 'Диагноз успешно добавлен'})
     except Exception as e:
         return jsonify({'error': str(e)}), 500
\ No newline at end of file
@@ -1,35 +1,22 @@
 from flask import Blueprint, request, jsonify, current_app
 from .auth import login_required, role_required
+from app.database.governor import QueryLimitError
+from app.database.response_cache import versioned_response
+from app.database.slot_index import format_minutes, to_minutes
+from app.utils.pagination import Page
 
 patient_bp = Blueprint('patient', __name__)
 
-def has_access_to_patient_data(user_id, patient_id):
+def has_access_to_patient_data(patient_id):
     """Проверяет, имеет ли пользователь доступ к данным пациента"""
-    # Получаем роль пользователя
-    role_query = """
-    SELECT role FROM user WHERE id_user = %s
-    """
-    user_role = current_app.config['sql_provider'].execute_query(role_query, (user_id,))
-    
-    if not user_role:
-        return False
-    
-    role = user_role[0]['role']
-    
+    # Роль и id пациента определены при входе и лежат в сессии
     # Менеджеры и врачи имеют доступ ко всем пациентам
-    if role in ['manager', 'doctor']:
+    if request.user_role in ['manager', 'doctor']:
         return True
     
     # Пациент имеет доступ только к своим данным
-    if role == 'patient':
-        patient_query = """
-        SELECT id_patient FROM patient WHERE user_id = %s AND id_patient = %s
-        """
-        result = current_app.config['sql_provider'].execute_query(
-            patient_query, 
-            (user_id, patient_id)
-        )
-        return bool(result)
+    if request.user_role == 'patient':
+        return request.patient_id == patient_id
     
     return False
 
@@ -37,21 +24,21 @@ def has_access_to_patient_data(user_id, patient_id):
 @login_required
 def get_patient_info(patient_id):
     """Получение информации о пациенте"""
-    if not has_access_to_patient_data(request.user_id, patient_id):
+    if not has_access_to_patient_data(patient_id):
         return jsonify({'error': 'Нет доступа к данным пациента'}), 403
 
     query = """
     SELECT 
         p.id_patient,
-        p.full_name,
         p.birth,
         p.passport_data,
-        p.insurance_policy,
-        p.phone,
-        p.email,
-        u.role
+        p.address,
+        p.reg_data,
+        u.login,
+        r.name as role
     FROM patient p
     JOIN user u ON u.id_user = p.user_id
+    JOIN role r ON r.id_role = u.role_id
     WHERE p.id_patient = %s
     """
     
@@ -60,66 +47,61 @@ def get_patient_info(patient_id):
         if not patient:
             return jsonify({'error': 'Пациент не найден'}), 404
         return jsonify(patient[0])
+    except QueryLimitError:
+        raise
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 @patient_bp.route('/api/patient/appointments/<int:patient_id>', methods=['GET'])
 @login_required
+@versioned_response('timetable', 'visiting', 'doctor', 'cabinet')
 def get_patient_appointments(patient_id):
     """Получение записей пациента на прием"""
-    if not has_access_to_patient_data(request.user_id, patient_id):
+    if not has_access_to_patient_data(patient_id):
         return jsonify({'error': 'Нет доступа к данным пациента'}), 403
 
-    query = """
-    SELECT 
-        t.id_tit as appointment_id,
-        t.admission as date,
-        TIME_FORMAT(t.time, '%H:%i') as time,
-        d.full_name as doctor_name,
-        d.specialization,
-        c.type as cabinet_type,
-        c.id_cab as cabinet_number,
-        t.appearance,
-        v.diagnosis,
-        v.complaints
-    FROM timetable t
-    JOIN doctor d ON d.id_doc = t.doctor_id_doc
-    JOIN cabinet c ON c.id_cab = t.cabinet_id_cab
-    LEFT JOIN visiting v ON v.timetable_id = t.id_tit
-    WHERE t.patient_id_patient = %s
-    ORDER BY t.admission DESC, t.time DESC
-    """
+    try:
+        page = Page.from_request()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    query = current_app.config['sql_provider'].get_query('patient/get_appointments.sql')
     
     try:
-        appointments = current_app.config['sql_provider'].execute_query(query, (patient_id,))
-        return jsonify(appointments)
+        appointments = current_app.config['sql_provider'].execute_query(query, page.params(patient_id=patient_id))
+        appointments, next_cursor = page.split(appointments, 'date', 'time', 'appointment_id')
+        return jsonify(page.response(
+            [dict(row, time=format_minutes(to_minutes(row['time']))) for row in appointments],
+            next_cursor
+        ))
+    except QueryLimitError:
+        raise
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 @patient_bp.route('/api/patient/diagnoses/<int:patient_id>', methods=['GET'])
 @login_required
+@versioned_response('visiting', 'doctor')
 def get_patient_diagnoses(patient_id):
     """Получение истории диагнозов пациента"""
-    if not has_access_to_patient_data(request.user_id, patient_id):
+    if not has_access_to_patient_data(patient_id):
         return jsonify({'error': 'Нет доступа к данным пациента'}), 403
 
-    query = """
-    SELECT 
-        v.id_vis,
-        v.diagnosis,
-        v.complaints,
-        v.date,
-        TIME_FORMAT(v.time, '%H:%i') as time,
-        d.full_name as doctor_name,
-        d.specialization
-    FROM visiting v
-    JOIN doctor d ON d.id_doc = v.doctor_id_doc
-    WHERE v.patient_id_patient = %s
-    ORDER BY v.date DESC, v.time DESC
-    """
+    try:
+        page = Page.from_request()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    query = current_app.config['sql_provider'].get_query('patient/get_diagnoses.sql')
     
     try:
-        diagnoses = current_app.config['sql_provider'].execute_query(query, (patient_id,))
-        return jsonify(diagnoses)
+        diagnoses = current_app.config['sql_provider'].execute_query(query, page.params(patient_id=patient_id))
+        diagnoses, next_cursor = page.split(diagnoses, 'date', 'time', 'id_vis')
+        return jsonify(page.response(
+            [dict(row, time=format_minutes(to_minutes(row['time']))) for row in diagnoses],
+            next_cursor
+        ))
+    except QueryLimitError:
+        raise
     except Exception as e:
         return jsonify({'error': str(e)}), 500 
\ No newline at end of file
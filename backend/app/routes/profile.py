@@ -1,5 +1,8 @@
 from flask import Blueprint, request, jsonify, current_app
 from .auth import login_required
+from app.database.response_cache import versioned_response
+from app.database.slot_index import format_minutes, to_minutes
+from app.utils.pagination import Page
 
 profile_bp = Blueprint('profile', __name__)
 
@@ -38,42 +41,34 @@ def update_patient_data():
             query, 
             (data['passport_data'], data['address'], data['birth'], request.user_id)
         )
+        # Паспорт и возраст пациента видны в списке приёмов врача
+        current_app.config['response_cache'].invalidate('patient')
         return jsonify({'message': 'Данные успешно обновлены'})
     except Exception as e:
         return jsonify({'error': str(e)}), 500 
 
 @profile_bp.route('/api/profile/appointments', methods=['GET'])
 @login_required
+@versioned_response('timetable', 'visiting', 'doctor', 'cabinet')
 def get_user_appointments():
-    query = """
-    SELECT 
-        t.id_tit as id,
-        t.admission as date,
-        TIME_FORMAT(t.time, '%H:%i') as time,
-        t.appearance,
-        d.full_name as doctor_name,
-        c.type as cabinet_type,
-        c.id_cab as cabinet_number,
-        v.diagnosis,
-        v.complaints,
-        v.id_vis as visit_id
-    FROM timetable t
-    JOIN doctor d ON t.doctor_id_doc = d.id_doc
-    JOIN cabinet c ON t.cabinet_id_cab = c.id_cab
-    JOIN patient p ON t.patient_id_patient = p.id_patient
-    LEFT JOIN visiting v ON v.timetable_id = t.id_tit
-    WHERE p.user_id = %s
-    ORDER BY t.admission DESC, t.time DESC
-    """
+    try:
+        page = Page.from_request()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     
-    result = current_app.config['sql_provider'].execute_query(query, (request.user_id,))
+    if request.patient_id is None:
+        return jsonify(page.response([], None))
+    
+    query = current_app.config['sql_provider'].get_query('profile/get_user_appointments.sql')
+    result = current_app.config['sql_provider'].execute_query(query, page.params(patient_id=request.patient_id))
+    result, next_cursor = page.split(result, 'date', 'time', 'id')
     
     appointments = []
     for row in result:
         appointments.append({
             'id': row['id'],
             'date': row['date'].strftime('%Y-%m-%d'),
-            'time': row['time'],
+            'time': format_minutes(to_minutes(row['time'])),
             'doctor_name': row['doctor_name'],
             'cabinet': f"Кабинет №{row['cabinet_number']} ({row['cabinet_type']})",
             'appearance': row['appearance'],
@@ -82,18 +77,34 @@ def get_user_appointments():
             'complaints': row['complaints']
         })
     
-    return jsonify(appointments)
+    return jsonify(page.response(appointments, next_cursor))
 
 @profile_bp.route('/api/profile/appointments/<int:appointment_id>', methods=['DELETE'])
 @login_required
 def delete_appointment(appointment_id):
     query = current_app.config['sql_provider'].get_query('profile/delete_appointment.sql')
+    # Слот записи нужен, чтобы после удаления отметить его свободным в индексе
+    slot_query = current_app.config['sql_provider'].get_query('profile/get_appointment_slot.sql')
     try:
+        slot = current_app.config['sql_provider'].execute_query(
+            slot_query,
+            (appointment_id, request.patient_id),
+            read_only=False
+        )
+        if not slot:
+            return jsonify({'error': 'Запись не найдена или нет прав для её удаления'}), 404
         affected_rows = current_app.config['sql_provider'].execute_query(
             query, 
-            (appointment_id, request.user_id,)
+            (appointment_id, request.patient_id,)
         )
         if affected_rows > 0:
+            current_app.config['slot_index'].mark(
+                slot[0]['doctor_id_doc'],
+                slot[0]['admission'],
+                slot[0]['time'],
+                free=True
+            )
+            current_app.config['response_cache'].invalidate('timetable')
             return jsonify({'message': 'Запись успешно удалена'})
         return jsonify({'error': 'Запись не найдена или нет прав для её удаления'}), 404
     except Exception as e:
@@ -1,10 +1,22 @@
 from flask import Blueprint, request, jsonify, current_app
 from .auth import login_required, role_required
+from app.database.governor import QueryLimitError
+from app.database.report_jobs import JOB_DONE, JOB_FAILED
+from app.database.compact_result import RESULT_COLUMNS, RESULT_ROWS
+from app.database.response_cache import cached_response, versioned_response
+from app.utils.json_stream import requested_layout, stream_json_response
 import json
 from datetime import datetime, timedelta
 
 reports_bp = Blueprint('reports', __name__)
 
+# SQL отчёта по id типа
+REPORT_QUERIES = {
+    1: 'reports/doctor_patients_month.sql',
+    2: 'reports/total_patients_month.sql',
+    3: 'reports/patients_by_diagnosis.sql'
+}
+
 class JSONEncoder(json.JSONEncoder):
     def default(self, obj):
         if isinstance(obj, datetime):
@@ -16,6 +28,7 @@ class JSONEncoder(json.JSONEncoder):
 @reports_bp.route('/api/reports/types', methods=['GET'])
 @login_required
 @role_required(['manager', 'admin'])
+@cached_response('report_type')
 def get_report_types():
     query = "SELECT * FROM report_type"
     result = current_app.config['sql_provider'].execute_query(query)
@@ -96,6 +109,7 @@ def get_available_months(doctor_id):
 @reports_bp.route('/api/reports/available-diagnoses', methods=['GET'])
 @login_required
 @role_required(['manager', 'admin'])
+@cached_response('visiting')
 def get_available_diagnoses():
     query = """
     SELECT DISTINCT diagnosis
@@ -110,99 +124,156 @@ def get_available_diagnoses():
 @login_required
 @role_required(['manager', 'admin'])
 def generate_report():
+    """Проверяет параметры и ставит отчёт в очередь; строит его отдельный процесс worker.py"""
     data = request.get_json()
     
     if not all(key in data for key in ['report_type_id', 'parameters']):
         return jsonify({'error': 'Не все параметры указаны'}), 400
     
-    # Получаем тип отчета
-    type_query = "SELECT * FROM report_type WHERE id_report_type = %s"
-    report_type = current_app.config['sql_provider'].execute_query(type_query, (data['report_type_id'],))
+    report_type = get_report_type(data['report_type_id'])
     
     if not report_type:
         return jsonify({'error': 'Тип отчета не найден'}), 404
     
-    report_type = report_type[0]
     required_params = json.loads(report_type['parameters'])['required']
     
     # Проверяем наличие всех необходимых параметров
     if not all(param in data['parameters'] for param in required_params):
         return jsonify({'error': 'Не все необходимые параметры указаны'}), 400
     
-    # Получаем SQL запрос для отчета
+    if report_type['id_report_type'] not in REPORT_QUERIES:
+        return jsonify({'error': 'Неподдерживаемый тип отчета'}), 400
+    
+    job_id, created = current_app.config['report_jobs'].enqueue(
+        request.user_id,
+        report_type['id_report_type'],
+        data['parameters']
+    )
+    job = current_app.config['report_jobs'].get(job_id)
+    return jsonify({
+        'job_id': job_id,
+        'status': job['status'] if job else None,
+        'deduplicated': not created
+    }), 202
+
+@reports_bp.route('/api/reports/jobs/<job_id>', methods=['GET'])
+@login_required
+@role_required(['manager', 'admin'])
+def get_report_job(job_id):
+    """Статус и прогресс задачи генерации отчёта"""
+    job = current_app.config['report_jobs'].get(job_id)
+    if job is None or job['user_id'] != str(request.user_id):
+        return jsonify({'error': 'Задача не найдена'}), 404
+    return jsonify(report_job_status(job))
+
+@reports_bp.route('/api/reports/jobs/<job_id>/result', methods=['GET'])
+@login_required
+@role_required(['manager', 'admin'])
+def get_report_job_result(job_id):
+    job = current_app.config['report_jobs'].get(job_id)
+    if job is None or job['user_id'] != str(request.user_id):
+        return jsonify({'error': 'Задача не найдена'}), 404
+    if job['status'] == JOB_FAILED:
+        return jsonify(dict(report_job_status(job), error=job.get('error') or 'Ошибка при генерации отчета')), 500
+    if job['status'] != JOB_DONE:
+        return jsonify(report_job_status(job)), 202
+    # Результат уже сериализован воркером - отдаём строку как есть
+    return current_app.response_class(job['result'], mimetype='application/json')
+
+def report_job_status(job):
+    return {
+        'job_id': job['id'],
+        'status': job['status'],
+        'progress': int(job.get('progress') or 0),
+        'report_id': int(job['report_id']) if job.get('report_id') else None,
+        'error': job.get('error'),
+        'created_at': float(job['created_at']) if job.get('created_at') else None,
+        'started_at': float(job['started_at']) if job.get('started_at') else None,
+        'finished_at': float(job['finished_at']) if job.get('finished_at') else None
+    }
+
+def get_report_type(report_type_id):
+    type_query = "SELECT * FROM report_type WHERE id_report_type = %s"
+    report_type = current_app.config['sql_provider'].execute_query(type_query, (report_type_id,))
+    return report_type[0] if report_type else None
+
+def build_report(report_type, parameters, user_id, limits=None, progress=None):
+    """Строит отчёт, сохраняет его и детали. Возвращает (id отчёта, ответ API).
+
+    Выполняется в воркере очереди; progress(процент) сообщает, на каком он этапе.
+    """
+    progress = progress or (lambda percent: None)
+    query = current_app.config['sql_provider'].get_query(REPORT_QUERIES[report_type['id_report_type']])
+    
+    # Выполняем запрос
+    result = current_app.config['sql_provider'].execute_query(query, parameters, limits=limits)
+    progress(40)
+    
+    # Форматируем результат для лучшего отображения
+    formatted_result = {
+        'summary': {},
+        'details': result
+    }
+    
     if report_type['id_report_type'] == 1:
-        query = current_app.config['sql_provider'].get_query('reports/doctor_patients_month.sql')
+        if result:
+            formatted_result['summary'] = {
+                'doctor_name': result[0]['doctor_name'],
+                'total_patients': result[0]['patient_count'],
+                'period': f"{datetime(2000, int(parameters['month']), 1).strftime('%B')} {parameters['year']}"
+            }
     elif report_type['id_report_type'] == 2:
-        query = current_app.config['sql_provider'].get_query('reports/total_patients_month.sql')
+        if result:
+            formatted_result['summary'] = {
+                'total_patients': result[0]['total_patients'],
+                'period': f"{datetime(2000, int(parameters['month']), 1).strftime('%B')} {parameters['year']}"
+            }
     elif report_type['id_report_type'] == 3:
-        query = current_app.config['sql_provider'].get_query('reports/patients_by_diagnosis.sql')
-    else:
-        return jsonify({'error': 'Неподдерживаемый тип отчета'}), 400
+        if result:
+            formatted_result['summary'] = {
+                'diagnosis': parameters['diagnosis'],
+                'total_patients': result[0]['patient_count'],
+                'doctors': result[0]['doctors'].split(', '),
+                'patients_list': result[0]['patients_list'].split('; ')
+            }
     
-    try:
-        # Выполняем запрос
-        result = current_app.config['sql_provider'].execute_query(query, data['parameters'])
-        
-        # Форматируем результат для лучшего отображения
-        formatted_result = {
-            'summary': {},
-            'details': result
-        }
-        
-        if report_type['id_report_type'] == 1:
-            if result:
-                formatted_result['summary'] = {
-                    'doctor_name': result[0]['doctor_name'],
-                    'total_patients': result[0]['patient_count'],
-                    'period': f"{datetime(2000, int(data['parameters']['month']), 1).strftime('%B')} {data['parameters']['year']}"
-                }
-        elif report_type['id_report_type'] == 2:
-            if result:
-                formatted_result['summary'] = {
-                    'total_patients': result[0]['total_patients'],
-                    'period': f"{datetime(2000, int(data['parameters']['month']), 1).strftime('%B')} {data['parameters']['year']}"
-                }
-        elif report_type['id_report_type'] == 3:
-            if result:
-                formatted_result['summary'] = {
-                    'diagnosis': data['parameters']['diagnosis'],
-                    'total_patients': result[0]['patient_count'],
-                    'doctors': result[0]['doctors'].split(', '),
-                    'patients_list': result[0]['patients_list'].split('; ')
-                }
-        
-        # Сохраняем отчет в базу
-        save_query = """
-        INSERT INTO report (report_type_id, created_by, parameters, result)
-        VALUES (%s, %s, %s, %s)
-        """
-        report_id = current_app.config['sql_provider'].execute_query(
-            save_query,
-            (
-                data['report_type_id'],
-                request.user_id,
-                json.dumps(data['parameters']),
-                json.dumps(formatted_result)
-            ),
-            return_last_id=True
-        )
-        
-        # Сохраняем детали отчета
-        if report_id:
-            save_report_details(report_id, data['report_type_id'], data['parameters'], result)
-        
-        return jsonify({
-            'report_type': report_type['name'],
-            'parameters': data['parameters'],
-            'result': formatted_result
-        })
-        
-    except Exception as e:
-        return jsonify({'error': str(e)}), 500
+    # Сохраняем отчет в базу
+    save_query = """
+    INSERT INTO report (report_type_id, created_by, parameters, result)
+    VALUES (%s, %s, %s, %s)
+    """
+    report_id = current_app.config['sql_provider'].execute_query(
+        save_query,
+        (
+            report_type['id_report_type'],
+            user_id,
+            json.dumps(parameters),
+            json.dumps(formatted_result)
+        ),
+        return_last_id=True
+    )
+    current_app.config['response_cache'].invalidate('report')
+    progress(60)
+    
+    # Сохраняем детали отчета; без них отчёт неполный - удаляем его, а ошибка завершит задачу неудачей
+    if report_id:
+        try:
+            save_report_details(report_id, report_type['id_report_type'], parameters, result, limits=limits)
+        except Exception:
+            delete_saved_report(report_id)
+            raise
+    
+    return report_id, {
+        'report_id': report_id,
+        'report_type': report_type['name'],
+        'parameters': parameters,
+        'result': formatted_result
+    }
 
 @reports_bp.route('/api/reports/history', methods=['GET'])
 @login_required
 @role_required(['manager', 'admin'])
+@versioned_response('report', 'report_type')
 def get_reports_history():
     query = """
     SELECT 
@@ -261,37 +332,22 @@ def get_report_details(report_id):
     WHERE rd.report_id = %s
     ORDER BY rd.visit_date DESC, visit_time DESC
     """
-    details = current_app.config['sql_provider'].execute_query(details_query, (report_id,))
-    
-    # Преобразуем даты в строки для JSON
-    for detail in details:
-        if 'visit_date' in detail and isinstance(detail['visit_date'], datetime):
-            detail['visit_date'] = detail['visit_date'].strftime('%Y-%m-%d')
-        if 'patient_birth' in detail and isinstance(detail['patient_birth'], datetime):
-            detail['patient_birth'] = detail['patient_birth'].strftime('%Y-%m-%d')
-    
-    response_data = {
-        'report': report[0],
-        'details': details
-    }
+    # Детали отдаём потоком: даты сериализует CustomJSONEncoder в формате ISO
+    layout = requested_layout()
+    if layout == RESULT_ROWS:
+        details = current_app.config['sql_provider'].stream_compact(details_query, (report_id,))
+    elif layout == RESULT_COLUMNS:
+        details = current_app.config['sql_provider'].execute_query(details_query, (report_id,), result_format=RESULT_COLUMNS)
+    else:
+        details = current_app.config['sql_provider'].stream_query(details_query, (report_id,))
     
-    return jsonify(response_data)
+    return stream_json_response(details, fields={'report': report[0]}, array_key='details')
 
-def save_report_details(report_id, report_type_id, parameters, result):
+def save_report_details(report_id, report_type_id, parameters, result, limits=None):
     """Сохраняет детали отчета в таблицу report_details"""
     if not result:
         return
         
-    details_query = """
-    INSERT INTO report_details (
-        report_id, 
-        patient_id, 
-        doctor_id, 
-        visit_date, 
-        diagnosis
-    ) VALUES (%s, %s, %s, %s, %s)
-    """
-    
     try:
         if report_type_id == 1:  # Отчет по врачу за месяц
             # Получаем список виз��тов за указанный месяц
@@ -306,22 +362,11 @@ def save_report_details(report_id, report_type_id, parameters, result):
             AND YEAR(v.date) = %s 
             AND MONTH(v.date) = %s
             """
-            visits = current_app.config['sql_provider'].execute_query(
+            visits = current_app.config['sql_provider'].stream_query(
                 visits_query,
-                (parameters['doctor_id'], parameters['year'], parameters['month'])
+                (parameters['doctor_id'], parameters['year'], parameters['month']),
+                limits=limits
             )
-            
-            for visit in visits:
-                current_app.config['sql_provider'].execute_query(
-                    details_query,
-                    (
-                        report_id,
-                        visit['patient_id_patient'],
-                        visit['doctor_id_doc'],
-                        visit['date'],
-                        visit['diagnosis']
-                    )
-                )
                     
         elif report_type_id == 2:  # Общий отчет за месяц
             # Получаем список всех визитов за указанный месяц
@@ -335,22 +380,11 @@ def save_report_details(report_id, report_type_id, parameters, result):
             WHERE YEAR(v.date) = %s 
             AND MONTH(v.date) = %s
             """
-            visits = current_app.config['sql_provider'].execute_query(
+            visits = current_app.config['sql_provider'].stream_query(
                 visits_query,
-                (parameters['year'], parameters['month'])
+                (parameters['year'], parameters['month']),
+                limits=limits
             )
-            
-            for visit in visits:
-                current_app.config['sql_provider'].execute_query(
-                    details_query,
-                    (
-                        report_id,
-                        visit['patient_id_patient'],
-                        visit['doctor_id_doc'],
-                        visit['date'],
-                        visit['diagnosis']
-                    )
-                )
                 
         elif report_type_id == 3:  # Отчет по диагнозу
             # Получаем список всех пациентов с указанным диагнозом
@@ -363,25 +397,42 @@ def save_report_details(report_id, report_type_id, parameters, result):
             FROM visiting v
             WHERE v.diagnosis LIKE CONCAT('%%', %s, '%%')
             """
-            visits = current_app.config['sql_provider'].execute_query(
+            visits = current_app.config['sql_provider'].stream_query(
                 diagnosis_query,
-                (parameters['diagnosis'],)
+                (parameters['diagnosis'],),
+                limits=limits
             )
-            
-            for visit in visits:
-                current_app.config['sql_provider'].execute_query(
-                    details_query,
-                    (
-                        report_id,
-                        visit['patient_id_patient'],
-                        visit['doctor_id_doc'],
-                        visit['date'],
-                        visit['diagnosis']
-                    )
+        else:
+            return
+        
+        # Визиты читаются потоком и вставляются пакетами в одной транзакции
+        current_app.config['sql_provider'].bulk_insert(
+            'report_details',
+            ['report_id', 'patient_id', 'doctor_id', 'visit_date', 'diagnosis'],
+            (
+                (
+                    report_id,
+                    visit['patient_id_patient'],
+                    visit['doctor_id_doc'],
+                    visit['date'],
+                    visit['diagnosis']
                 )
+                for visit in visits
+            )
+        )
     except Exception as e:
+        # Ошибка пробрасывается: вызывающий решает, считать ли отчёт построенным
         print(f"Error saving report details: {str(e)}")
-        # Можно добавить логирование ошибки
+        raise
+
+def delete_saved_report(report_id):
+    """Удаляет отчёт, детали которого сохранить не удалось"""
+    try:
+        current_app.config['sql_provider'].execute_query("DELETE FROM report_details WHERE report_id = %s", (report_id,))
+        current_app.config['sql_provider'].execute_query("DELETE FROM report WHERE id_report = %s", (report_id,))
+        current_app.config['response_cache'].invalidate('report')
+    except Exception as e:
+        print(f"Error deleting incomplete report {report_id}: {str(e)}")
 
 @reports_bp.route('/api/reports/<int:report_id>', methods=['DELETE'])
 @login_required
@@ -405,6 +456,7 @@ def delete_report(report_id):
         # Затем удаляем сам отчет
         delete_report_query = "DELETE FROM report WHERE id_report = %s"
         current_app.config['sql_provider'].execute_query(delete_report_query, (report_id,))
+        current_app.config['response_cache'].invalidate('report')
         
         return jsonify({'message': 'Отчет успешно удален'})
         
@@ -1,9 +1,11 @@
 from flask import Blueprint, jsonify, current_app
 from datetime import datetime, timedelta
+from app.database.response_cache import cached_response
 
 schedule_bp = Blueprint('schedule', __name__)
 
 @schedule_bp.route('/api/schedule/doctors', methods=['GET'])
+@cached_response('doctor', 'doctor_schedule')
 def get_doctors_schedule():
     query = current_app.config['sql_provider'].get_query('schedule/get_doctors_schedule.sql')
     result = current_app.config['sql_provider'].execute_query(query)
@@ -36,12 +38,14 @@ def get_doctors_schedule():
     return response 
 
 @schedule_bp.route('/api/schedule/departments', methods=['GET'])
+@cached_response('department')
 def get_departments():
     query = current_app.config['sql_provider'].get_query('schedule/get_departments.sql')
     result = current_app.config['sql_provider'].execute_query(query)
     return jsonify(result)
 
 @schedule_bp.route('/api/schedule/doctors/<int:department_id>', methods=['GET'])
+@cached_response('doctor', 'doctor_schedule')
 def get_doctors_by_department(department_id):
     query = current_app.config['sql_provider'].get_query('schedule/get_doctors_by_department.sql')
     result = current_app.config['sql_provider'].execute_query(query, (department_id,))
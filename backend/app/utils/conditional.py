@@ -0,0 +1,32 @@
+from typing import Dict
+from flask import request
+from werkzeug.http import generate_etag
+
+# Политика для blueprint'ов, не указанных в настройках
+DEFAULT_CACHE_CONTROL = 'no-store'
+
+
+def content_etag(body: bytes) -> str:
+    """Сильный ETag по содержимому ответа"""
+    return generate_etag(body)
+
+
+def init_conditional_requests(app, cache_control: Dict[str, str]):
+    """Cache-Control по blueprint'ам, ETag и ответ 304 на If-None-Match для GET запросов.
+
+    ETag считается по телу ответа, поэтому 304 экономит трафик; эндпоинты с кешем ответов
+    отдают 304 ещё до сериализации - см. cached_response, а персональные списки - ещё до
+    запросов к БД, по версиям таблиц - см. versioned_response. Потоковые ответы не хешируются.
+    """
+    @app.after_request
+    def apply_conditional_request(response):
+        if request.method not in ('GET', 'HEAD'):
+            return response
+        policy = cache_control.get(request.blueprint, DEFAULT_CACHE_CONTROL)
+        if 'Cache-Control' not in response.headers:
+            response.headers['Cache-Control'] = policy
+        if response.status_code != 200 or response.is_streamed or 'no-store' in policy:
+            return response
+        if response.get_etag()[0] is None:
+            response.set_etag(content_etag(response.get_data()))
+        return response.make_conditional(request)
@@ -0,0 +1,139 @@
+from flask import Response, request, stream_with_context
+from datetime import datetime, date, time, timedelta
+from decimal import Decimal
+from itertools import chain
+from typing import Dict, Iterable, Iterator, Optional, Union
+import json
+from app.database.compact_result import CompactResult, RESULT_COLUMNS, RESULT_DICTS, RESULT_ROWS
+
+# Сколько байт копим перед отправкой очередного фрагмента ответа
+CHUNK_BYTES = 64 * 1024
+
+class CustomJSONEncoder(json.JSONEncoder):
+    def default(self, obj):
+        if isinstance(obj, (datetime, date)):
+            return obj.isoformat()
+        if isinstance(obj, time):
+            return obj.strftime('%H:%M:%S')
+        if isinstance(obj, timedelta):
+            return str(obj)
+        if isinstance(obj, Decimal):
+            return float(obj)
+        if isinstance(obj, CompactResult):
+            return obj.to_dict()
+        return super().default(obj)
+
+_encoder = CustomJSONEncoder(ensure_ascii=False, separators=(',', ':'))
+
+def _prime(rows: Iterable) -> Iterator:
+    """Запускает генератор до первой строки, чтобы ошибка запроса вернулась обычным ответом, а не оборванным потоком"""
+    rows = iter(rows)
+    try:
+        first = next(rows)
+    except StopIteration:
+        return iter(())
+    return chain((first,), rows)
+
+def _buffered(parts: Iterable[str]) -> Iterator[bytes]:
+    """Склеивает части в фрагменты по CHUNK_BYTES байт UTF-8: кириллица занимает два байта на символ"""
+    buffer = []
+    size = 0
+    for part in parts:
+        data = part.encode('utf-8')
+        buffer.append(data)
+        size += len(data)
+        if size >= CHUNK_BYTES:
+            yield b''.join(buffer)
+            buffer = []
+            size = 0
+    if buffer:
+        yield b''.join(buffer)
+
+def _json_parts(rows: Iterator, fields: Optional[Dict], array_key: Optional[str]) -> Iterator[str]:
+    if array_key is not None:
+        yield '{'
+        for key, value in (fields or {}).items():
+            yield _encoder.encode(key) + ':' + _encoder.encode(value) + ','
+        yield _encoder.encode(array_key) + ':'
+
+    yield '['
+    separator = ''
+    for row in rows:
+        yield separator + _encoder.encode(row)
+        separator = ','
+    yield ']'
+
+    if array_key is not None:
+        yield '}'
+
+def _compact_parts(result: CompactResult, fields: Optional[Dict], array_key: Optional[str]) -> Iterator[str]:
+    """{"columns": [...], "rows": [[...], ...]} - строки пишутся по мере чтения"""
+    if array_key is not None:
+        yield '{'
+        for key, value in (fields or {}).items():
+            yield _encoder.encode(key) + ':' + _encoder.encode(value) + ','
+        yield _encoder.encode(array_key) + ':'
+
+    yield '{"columns":' + _encoder.encode(result.columns) + ',"rows":'
+    yield from _json_parts(result.rows, None, None)
+    yield '}'
+
+    if array_key is not None:
+        yield '}'
+
+def _ndjson_parts(rows: Iterator, fields: Optional[Dict] = None) -> Iterator[str]:
+    """fields, если есть, идут первой строкой - иначе клиент NDJSON их бы не получил"""
+    if fields:
+        yield _encoder.encode(fields) + '\n'
+    for row in rows:
+        yield _encoder.encode(row) + '\n'
+
+def requested_layout() -> str:
+    """Формат строк, который запросил клиент: ?layout=rows (кортежи) или ?layout=columns (по столбцам)"""
+    layout = request.args.get('layout')
+    if layout in (RESULT_ROWS, RESULT_COLUMNS):
+        return layout
+    return RESULT_DICTS
+
+def wants_ndjson() -> bool:
+    return (
+        request.args.get('format') == 'ndjson'
+        or 'application/x-ndjson' in request.headers.get('Accept', '')
+    )
+
+def stream_json_response(
+    rows: Union[Iterable, CompactResult],
+    fields: Optional[Dict] = None,
+    array_key: Optional[str] = None
+) -> Response:
+    """Потоковый JSON ответ: массив строк или объект {**fields, array_key: [...]}.
+
+    С ?format=ndjson (или Accept: application/x-ndjson) строки отдаются по одной на строку ответа,
+    а fields - объектом в первой строке. CompactResult пишется как {"columns": [...], "rows": [[...]]},
+    в NDJSON перед строками идёт массив имён столбцов.
+    """
+    if isinstance(rows, CompactResult) and rows.columnar:
+        # Колоночный вид уже собран целиком, потоковая запись ничего не даёт
+        body = dict(fields or {}, **{array_key: rows}) if array_key is not None else rows
+        return Response(_encoder.encode(body), content_type='application/json; charset=utf-8')
+
+    if isinstance(rows, CompactResult):
+        rows.rows = _prime(rows.rows)
+        if wants_ndjson():
+            parts = _ndjson_parts(chain((rows.columns,), rows.rows), fields)
+            return Response(stream_with_context(_buffered(parts)), mimetype='application/x-ndjson')
+        return Response(
+            stream_with_context(_buffered(_compact_parts(rows, fields, array_key))),
+            content_type='application/json; charset=utf-8'
+        )
+
+    rows = _prime(rows)
+    if wants_ndjson():
+        return Response(
+            stream_with_context(_buffered(_ndjson_parts(rows, fields))),
+            mimetype='application/x-ndjson'
+        )
+    return Response(
+        stream_with_context(_buffered(_json_parts(rows, fields, array_key))),
+        content_type='application/json; charset=utf-8'
+    )
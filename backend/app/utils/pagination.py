@@ -0,0 +1,88 @@
+import base64
+import json
+from datetime import date, datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+from flask import request
+
+# Размер страницы по умолчанию и максимальный
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+# LIMIT без постраничного вывода: MySQL не принимает LIMIT NULL, "все строки" - это максимум BIGINT UNSIGNED
+UNPAGED_LIMIT = 18446744073709551615
+
+
+def encode_cursor(day: date, time, row_id: int) -> str:
+    """Непрозрачный курсор на последнюю отданную строку: (дата, время, id)"""
+    if isinstance(time, timedelta):
+        seconds = int(time.total_seconds())
+        time = f"{seconds // 3600:02d}:{seconds % 3600 // 60:02d}:{seconds % 60:02d}"
+    payload = json.dumps([day.isoformat(), str(time), row_id], separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode('utf-8')).rstrip(b'=').decode('ascii')
+
+
+def decode_cursor(token: str) -> Tuple[date, str, int]:
+    try:
+        day, time, row_id = json.loads(base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)))
+        return datetime.strptime(day, '%Y-%m-%d').date(), datetime.strptime(time, '%H:%M:%S').strftime('%H:%M:%S'), int(row_id)
+    except (ValueError, TypeError):
+        raise ValueError('Некорректный курсор')
+
+
+class Page:
+    """Параметры страницы из ?limit=&cursor=&from=&to=.
+
+    Без limit и cursor список отдаётся целиком, как раньше; окно from/to действует всегда.
+    """
+
+    def __init__(self, limit: Optional[int], cursor: Optional[Tuple], date_from: Optional[date], date_to: Optional[date]):
+        self.limit = limit
+        self.cursor = cursor
+        self.date_from = date_from
+        self.date_to = date_to
+
+    @property
+    def paged(self) -> bool:
+        return self.limit is not None
+
+    @classmethod
+    def from_request(cls) -> 'Page':
+        """ValueError с текстом для клиента, если параметры некорректны"""
+        limit = request.args.get('limit', type=int)
+        cursor = request.args.get('cursor')
+        if cursor is not None and limit is None:
+            limit = DEFAULT_PAGE_SIZE
+        if limit is not None and not 1 <= limit <= MAX_PAGE_SIZE:
+            raise ValueError(f'limit должен быть от 1 до {MAX_PAGE_SIZE}')
+        try:
+            date_from = datetime.strptime(request.args['from'], '%Y-%m-%d').date() if request.args.get('from') else None
+            date_to = datetime.strptime(request.args['to'], '%Y-%m-%d').date() if request.args.get('to') else None
+        except ValueError:
+            raise ValueError('Некорректный диапазон дат')
+        return cls(limit, decode_cursor(cursor) if cursor else None, date_from, date_to)
+
+    def params(self, **params) -> Dict:
+        """Параметры для SQL с окном, курсором и LIMIT (на строку больше - чтобы узнать, есть ли следующая страница)"""
+        cursor_date, cursor_time, cursor_id = self.cursor or (None, None, None)
+        return dict(
+            params,
+            date_from=self.date_from,
+            date_to=self.date_to,
+            cursor_date=cursor_date,
+            cursor_time=cursor_time,
+            cursor_id=cursor_id,
+            limit=self.limit + 1 if self.paged else UNPAGED_LIMIT
+        )
+
+    def split(self, rows: List, date_key: str, time_key: str, id_key: str) -> Tuple[List, Optional[str]]:
+        """(строки страницы, курсор следующей страницы или None)"""
+        if not self.paged or len(rows) <= self.limit:
+            return rows, None
+        rows = rows[:self.limit]
+        last = rows[-1]
+        return rows, encode_cursor(last[date_key], last[time_key], last[id_key])
+
+    def response(self, items: List, next_cursor: Optional[str]):
+        """Без постраничного вывода - список как раньше, иначе {'items', 'next_cursor'}"""
+        if not self.paged:
+            return items
+        return {'items': items, 'next_cursor': next_cursor}
@@ -0,0 +1,120 @@
+import bcrypt
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from typing import Dict
+
+# $2b$12$... - стоимость хранится в самом хеше
+_COST_RE = re.compile(r'^\$2[abxy]?\$(\d{2})\$')
+
+
+class PasswordHasherBusyError(Exception):
+    """Очередь хеширования заполнена или хеш не посчитался вовремя"""
+    status_code = 503
+
+
+class _CallStats:
+    def __init__(self):
+        self.calls = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, duration: float):
+        self.calls += 1
+        self.total += duration
+        self.max = max(self.max, duration)
+
+    def to_dict(self) -> Dict:
+        return {
+            'calls': self.calls,
+            'avg_ms': round(self.total / self.calls * 1000, 2) if self.calls else 0.0,
+            'max_ms': round(self.max * 1000, 2)
+        }
+
+
+class PasswordHasher:
+    """bcrypt в отдельном ограниченном пуле потоков.
+
+    bcrypt отпускает GIL на время хеширования, поэтому потоков достаточно, чтобы
+    не занимать воркеры, обслуживающие остальные запросы. Сверх max_workers + max_queue
+    задачи не принимаются - вызывающий получает PasswordHasherBusyError сразу.
+    """
+
+    def __init__(self, rounds: int = 12, max_workers: int = 4, max_queue: int = 32, timeout: float = 5.0):
+        self.rounds = rounds
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='bcrypt')
+        self._slots = threading.BoundedSemaphore(max_workers + max_queue)
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._rejected = 0
+        self._timeouts = 0
+        self._stats = {'hash': _CallStats(), 'verify': _CallStats()}
+
+    def hash(self, password: str) -> str:
+        return self._run('hash', self._hash, password)
+
+    def verify(self, password: str, password_hash: str) -> bool:
+        return self._run('verify', self._verify, password, password_hash)
+
+    def needs_rehash(self, password_hash: str) -> bool:
+        match = _COST_RE.match(password_hash)
+        return match is None or int(match.group(1)) != self.rounds
+
+    def _hash(self, password: str) -> str:
+        return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt(self.rounds)).decode('utf-8')
+
+    def _verify(self, password: str, password_hash: str) -> bool:
+        return bcrypt.checkpw(password.encode('utf-8'), password_hash.encode('utf-8'))
+
+    def _run(self, name: str, func, *args):
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self._rejected += 1
+            raise PasswordHasherBusyError("Слишком много одновременных входов, повторите позже")
+        with self._lock:
+            self._in_flight += 1
+
+        def timed():
+            started = time.perf_counter()
+            try:
+                return func(*args)
+            finally:
+                duration = time.perf_counter() - started
+                with self._lock:
+                    self._stats[name].add(duration)
+
+        try:
+            future = self._executor.submit(timed)
+        except Exception:
+            self._release()
+            raise
+        # Слот освобождается, когда хеш досчитан, даже если ответ уже ушёл по таймауту
+        future.add_done_callback(lambda _: self._release())
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeoutError:
+            with self._lock:
+                self._timeouts += 1
+            raise PasswordHasherBusyError("Проверка пароля не уложилась в отведённое время")
+
+    def _release(self):
+        with self._lock:
+            self._in_flight -= 1
+        self._slots.release()
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                'rounds': self.rounds,
+                'max_workers': self.max_workers,
+                'max_queue': self.max_queue,
+                'in_flight': self._in_flight,
+                'rejected': self._rejected,
+                'timeouts': self._timeouts,
+                'hash': self._stats['hash'].to_dict(),
+                'verify': self._stats['verify'].to_dict()
+            }
@@ -0,0 +1,65 @@
+import base64
+import hashlib
+import hmac
+import json
+import secrets
+import time
+from datetime import timedelta
+from typing import Dict, Optional
+
+# Порядок полей в payload токена: список короче словаря с ключами.
+# iat - точное время выдачи (секунды с дробной частью), по нему сравнивается массовый отзыв
+_FIELDS = ('user_id', 'role', 'patient_id', 'doctor_id', 'department_id', 'exp', 'jti', 'iat')
+# Токены, выданные до появления iat, остаются действительными до своего срока
+_LEGACY_FIELDS = _FIELDS[:-1]
+# Длина подписи в байтах (HMAC-SHA256, усечённый до 128 бит)
+_SIGNATURE_BYTES = 16
+
+
+def _b64encode(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b'=').decode('ascii')
+
+
+def _b64decode(data: str) -> bytes:
+    return base64.urlsafe_b64decode(data + '=' * (-len(data) % 4))
+
+
+class SessionTokenSigner:
+    """Подписанные HMAC токены сессии: проверяются на месте, без обращения к Redis.
+
+    Формат: base64url(payload).base64url(подпись). Payload - JSON список значений _FIELDS.
+    """
+
+    def __init__(self, secret_key: str, ttl: timedelta):
+        self._key = hashlib.sha256(('session-token:' + secret_key).encode('utf-8')).digest()
+        self.ttl = ttl
+
+    def _sign(self, payload: str) -> str:
+        digest = hmac.new(self._key, payload.encode('ascii'), hashlib.sha256).digest()
+        return _b64encode(digest[:_SIGNATURE_BYTES])
+
+    def issue(self, session: Dict) -> str:
+        now = time.time()
+        session = dict(session, exp=int(now + self.ttl.total_seconds()), jti=secrets.token_urlsafe(9), iat=now)
+        payload = _b64encode(json.dumps([session.get(field) for field in _FIELDS], separators=(',', ':')).encode('utf-8'))
+        return f"{payload}.{self._sign(payload)}"
+
+    def verify(self, token: str) -> Optional[Dict]:
+        """Сессия из токена или None, если подпись не сходится или срок истёк"""
+        # Cookie приходит от клиента как есть: не-ASCII не может быть нашим токеном
+        if not token.isascii():
+            return None
+        payload, _, signature = token.partition('.')
+        if not signature or not hmac.compare_digest(signature, self._sign(payload)):
+            return None
+        try:
+            values = json.loads(_b64decode(payload))
+        except ValueError:
+            return None
+        if not isinstance(values, list) or len(values) not in (len(_FIELDS), len(_LEGACY_FIELDS)):
+            return None
+        session = dict(zip(_FIELDS, values))
+        session.setdefault('iat', None)
+        if session['exp'] < time.time():
+            return None
+        return session
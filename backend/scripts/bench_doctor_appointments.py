@@ -0,0 +1,84 @@
+"""Микробенчмарк подготовки ответа /api/doctor/appointments: прежний построчный цикл против shape_doctor_appointments.
+
+Запуск из каталога backend: python scripts/bench_doctor_appointments.py [число строк ...]
+"""
+import os
+import random
+import sys
+import timeit
+from datetime import date, datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.routes.doctor import MSK, shape_doctor_appointments
+
+
+def make_rows(count: int):
+    """Строки как из doctor/get_appointments.sql: ~16 приёмов в день, по убыванию даты и времени"""
+    random.seed(count)
+    start = date.today() + timedelta(days=30)
+    rows = []
+    for i in range(count):
+        cabinet = random.randint(1, 20)
+        rows.append({
+            'id': count - i,
+            'date': start - timedelta(days=i // 16),
+            'time': timedelta(hours=9, minutes=30 * (15 - i % 16)),
+            'appearance': None,
+            'passport_data': f"{random.randint(1000, 9999)} {random.randint(100000, 999999)}",
+            'age': f"{random.randint(18, 90)} лет",
+            'patient_id_patient': random.randint(1, 5000),
+            'cabinet_type': 'Терапевтический' if cabinet % 2 else 'Процедурный',
+            'cabinet_number': cabinet,
+            'visit_id': None,
+            'diagnosis': None,
+            'complaints': None
+        })
+    return rows
+
+
+def shape_per_row(rows):
+    """Прежняя реализация: datetime.now и strptime на каждую строку"""
+    appointments = []
+    for row in rows:
+        now = datetime.now(MSK)
+        seconds = int(row['time'].total_seconds())
+        time_str = f"{seconds // 3600:02d}:{seconds % 3600 // 60:02d}"
+        appointment_datetime = datetime.combine(
+            row['date'],
+            datetime.strptime(time_str, '%H:%M').time()
+        ).replace(tzinfo=MSK)
+        appointments.append({
+            'id': row['id'],
+            'date': row['date'].strftime('%Y-%m-%d'),
+            'time': time_str,
+            'patient_id': row['patient_id_patient'],
+            'passport_data': row['passport_data'],
+            'age': row['age'],
+            'cabinet': f"Кабинет №{row['cabinet_number']} ({row['cabinet_type']})",
+            'appearance': row['appearance'],
+            'is_past': appointment_datetime < now,
+            'visit_id': row['visit_id'],
+            'diagnosis': row['diagnosis'],
+            'complaints': row['complaints']
+        })
+    return appointments
+
+
+def best_of(func, repeat: int = 5) -> float:
+    return min(timeit.repeat(func, number=1, repeat=repeat))
+
+
+def main(sizes):
+    for count in sizes:
+        rows = make_rows(count)
+        now = datetime.now(MSK)
+        # Результаты должны совпадать, иначе сравнивать нечего
+        assert shape_per_row(rows) == shape_doctor_appointments(rows, now), 'результаты расходятся'
+        old = best_of(lambda: shape_per_row(rows))
+        new = best_of(lambda: shape_doctor_appointments(rows, datetime.now(MSK)))
+        print(f"{count:>7} строк: построчно {old * 1000:8.1f} мс, пакетно {new * 1000:8.1f} мс, ускорение x{old / new:.1f}")
+
+
+if __name__ == '__main__':
+    main([int(size) for size in sys.argv[1:]] or [10000, 100000])
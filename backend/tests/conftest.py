@@ -0,0 +1,93 @@
+import time
+import fakeredis
+import pytest
+from app import create_app
+from app.database.redis_provider import RedisProvider
+
+
+@pytest.fixture
+def redis_client(monkeypatch):
+    """Redis в памяти вместо настоящего сервера; Lua скрипты выполняет lupa"""
+    client = fakeredis.FakeRedis(decode_responses=True)
+    monkeypatch.setattr(RedisProvider, '_instance', client)
+    return client
+
+
+@pytest.fixture
+def wait_for():
+    """Ждёт, пока условие станет истинным: для фоновых потоков приложения"""
+    def wait(condition, timeout=2.0):
+        deadline = time.monotonic() + timeout
+        while not condition():
+            if time.monotonic() > deadline:
+                raise AssertionError('условие не выполнилось')
+            time.sleep(0.01)
+    return wait
+
+
+@pytest.fixture
+def app(monkeypatch):
+    app = create_app()
+    app.config['TESTING'] = True
+    # create_app подключает настоящий Redis - подменяем его после создания приложения
+    monkeypatch.setattr(RedisProvider, '_instance', fakeredis.FakeRedis(decode_responses=True))
+    return app
+
+
+@pytest.fixture
+def redis(app):
+    return RedisProvider.get_client()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+class FakeSQL:
+    """Подмена execute_query: ответы по подстроке текста запроса, все вызовы записываются"""
+
+    def __init__(self):
+        self.handlers = []
+        self.calls = []
+
+    def on(self, fragment: str, result):
+        """result - строки ответа или функция (query, params, **kwargs) -> ответ"""
+        self.handlers.insert(0, (fragment, result))
+
+    def execute_query(self, query, params=None, **kwargs):
+        self.calls.append((query, params, kwargs))
+        for fragment, result in self.handlers:
+            if fragment in query:
+                return result(query, params, **kwargs) if callable(result) else result
+        return []
+
+    def queries(self, fragment: str):
+        return [call for call in self.calls if fragment in call[0]]
+
+
+@pytest.fixture
+def sql(app, monkeypatch):
+    fake = FakeSQL()
+    monkeypatch.setattr(app.config['sql_provider'], 'execute_query', fake.execute_query)
+    return fake
+
+
+@pytest.fixture
+def whoami(app):
+    """Защищённый эндпоинт, возвращающий сессию запроса"""
+    from flask import jsonify, request
+    from app.routes.auth import login_required
+
+    @login_required
+    def view():
+        return jsonify({
+            'user_id': request.user_id,
+            'role': request.user_role,
+            'patient_id': request.patient_id,
+            'doctor_id': request.doctor_id,
+            'department_id': request.department_id
+        })
+
+    app.add_url_rule('/test/whoami', 'test_whoami', view)
+    return '/test/whoami'
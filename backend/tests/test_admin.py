@@ -0,0 +1,77 @@
+from datetime import date
+import pytest
+from redis import RedisError
+from app.database.response_cache import TAGS_KEY
+from app.database.slot_index import DayAvailability
+from app.routes.auth import create_session
+
+DAY = date(2030, 1, 15)
+
+
+@pytest.fixture
+def admin(app, client):
+    with app.app_context():
+        client.set_cookie('session_id', create_session(1, 'admin', {'patient_id': None, 'doctor_id': None, 'department_id': None}))
+
+
+def test_execute_write_drops_slot_index_and_response_cache(app, client, admin, sql, redis):
+    redis.set('slots:3:2030-01-15', 'x')
+    response = client.post('/api/admin/execute', json={'query': "UPDATE timetable SET appearance = 'Личное'"})
+    assert response.status_code == 200
+    assert not redis.exists('slots:3:2030-01-15')
+    assert redis.hget(TAGS_KEY, '*') == '1'
+
+
+def test_execute_select_keeps_caches(app, client, admin, sql, redis):
+    redis.set('slots:3:2030-01-15', 'x')
+    assert client.post('/api/admin/execute', json={'query': 'SELECT 1'}).status_code == 200
+    assert redis.exists('slots:3:2030-01-15')
+    assert not redis.hexists(TAGS_KEY, '*')
+
+
+def test_redis_failure_after_commit_is_not_an_error(app, client, admin, sql, redis, monkeypatch):
+    def unavailable():
+        raise RedisError('Connection refused')
+
+    monkeypatch.setattr(app.config['slot_index'], 'invalidate_all', unavailable)
+    response = client.put('/api/admin/table/timetable/row/12', json={'appearance': 'Личное'})
+    assert response.status_code == 200
+    assert sql.queries('UPDATE timetable SET appearance = %s WHERE id_timetable = %s')
+    # Кеш ответов всё равно сброшен
+    assert redis.hget(TAGS_KEY, 'timetable') == '1'
+
+
+def build_days(app, *doctor_ids):
+    index = app.config['slot_index']
+    for doctor_id in doctor_ids:
+        _, generation = index.get(doctor_id, DAY)
+        index.store(doctor_id, DAY, DayAvailability.build('09:00', '10:00', []), generation)
+
+
+def built(app, doctor_id):
+    return app.config['slot_index'].get(doctor_id, DAY)[0] is not None
+
+
+def test_insert_drops_slot_index_of_inserted_doctors_only(app, client, admin, sql, redis, monkeypatch):
+    monkeypatch.setattr(app.config['sql_provider'], 'bulk_insert', lambda *args, **kwargs: {'affected_rows': 1})
+    build_days(app, 3, 4)
+    response = client.post('/api/admin/table/doctor_schedule/row', json={
+        'doctor_id': 3, 'day_of_week': 2, 'start_time': '09:00', 'end_time': '13:00', 'cabinet': '12'
+    })
+    assert response.status_code == 200
+    assert not built(app, 3)
+    assert built(app, 4)
+
+
+def test_delete_drops_slot_index_of_deleted_row_doctor(app, client, admin, sql, redis):
+    sql.on('SELECT doctor_id_doc FROM timetable', [{'doctor_id_doc': 4}])
+    build_days(app, 3, 4)
+    assert client.delete('/api/admin/table/timetable/row/12').status_code == 200
+    assert built(app, 3)
+    assert not built(app, 4)
+
+
+def test_update_drops_whole_slot_index(app, client, admin, sql, redis):
+    build_days(app, 3, 4)
+    assert client.put('/api/admin/table/timetable/row/12', json={'doctor_id_doc': 4}).status_code == 200
+    assert not built(app, 3) and not built(app, 4)
@@ -0,0 +1,61 @@
+from datetime import date
+import pytest
+from redis import RedisError
+from mysql.connector import IntegrityError, errorcode
+from app.routes.auth import create_session
+
+SLOT = {'doctor_id': 3, 'date': '2030-01-15', 'time': '10:30'}
+
+
+@pytest.fixture
+def patient(app, client):
+    with app.app_context():
+        client.set_cookie('session_id', create_session(7, 'patient', {'patient_id': 5, 'doctor_id': None, 'department_id': None}))
+
+
+def test_booking_inserts_once_and_marks_slot(app, client, patient, sql):
+    sql.on('INSERT INTO timetable', 1)
+    response = client.post('/api/appointment/create', json=SLOT)
+    assert response.status_code == 201
+    (query, params, _), = sql.queries('INSERT INTO timetable')
+    # Пациент берётся из сессии, а не из тела запроса
+    assert params == (5, date(2030, 1, 15), '10:30', 3)
+
+
+def test_double_booking_returns_409(app, client, patient, sql):
+    def duplicate(query, params, **kwargs):
+        raise IntegrityError(msg='Duplicate entry', errno=errorcode.ER_DUP_ENTRY)
+
+    sql.on('INSERT INTO timetable', duplicate)
+    response = client.post('/api/appointment/create', json=SLOT)
+    assert response.status_code == 409
+    assert response.get_json() == {'error': 'Это время уже занято'}
+
+
+def test_unknown_doctor_returns_404(app, client, patient, sql):
+    sql.on('INSERT INTO timetable', 0)
+    assert client.post('/api/appointment/create', json=SLOT).status_code == 404
+
+
+def test_slot_held_by_another_patient_returns_409(app, client, patient, sql):
+    assert app.config['slot_holds'].hold(3, '2030-01-15', '10:30', 99)
+    response = client.post('/api/appointment/create', json=SLOT)
+    assert response.status_code == 409
+    assert not sql.queries('INSERT INTO timetable')
+
+
+@pytest.mark.parametrize('slot', [
+    dict(SLOT, time='10'), dict(SLOT, date='15.01.2030'), dict(SLOT, doctor_id='third'), dict(SLOT, time=None)
+])
+def test_bad_slot_is_rejected_before_insert(app, client, patient, sql, slot):
+    assert client.post('/api/appointment/create', json=slot).status_code == 400
+    assert not sql.queries('INSERT INTO timetable')
+
+
+def test_cache_failure_after_insert_keeps_201(app, client, patient, sql, monkeypatch):
+    def unavailable(*args, **kwargs):
+        raise RedisError('Connection refused')
+
+    sql.on('INSERT INTO timetable', 1)
+    monkeypatch.setattr(app.config['slot_index'], 'mark', unavailable)
+    assert client.post('/api/appointment/create', json=SLOT).status_code == 201
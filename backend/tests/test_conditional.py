@@ -0,0 +1,91 @@
+from datetime import date, timedelta
+import pytest
+from redis import RedisError
+from app.database.response_cache import TAGS_KEY
+from app.routes.auth import create_session
+
+PATIENT = {'patient_id': 5, 'doctor_id': None, 'department_id': None}
+APPOINTMENT = {
+    'id': 11, 'date': date(2030, 1, 15), 'time': timedelta(hours=10, minutes=30), 'appearance': 'Личное',
+    'doctor_name': 'Зимина О.В.', 'cabinet_type': 'Терапевтический', 'cabinet_number': 2,
+    'diagnosis': None, 'complaints': None, 'visit_id': None
+}
+
+
+def login(app, client, user_id, identity=PATIENT):
+    with app.app_context():
+        client.set_cookie('session_id', create_session(user_id, 'patient', identity))
+
+
+@pytest.fixture
+def appointments(sql):
+    sql.on('FROM timetable t', [APPOINTMENT])
+    return lambda: sql.queries('FROM timetable t')
+
+
+def test_history_revalidates_without_queries(app, client, appointments):
+    login(app, client, 7)
+    first = client.get('/api/profile/appointments')
+    assert first.status_code == 200
+    assert first.headers['Cache-Control'] == 'private, no-cache'
+    etag = first.headers['ETag']
+    assert len(appointments()) == 1
+
+    second = client.get('/api/profile/appointments', headers={'If-None-Match': etag})
+    assert second.status_code == 304
+    assert second.headers['ETag'] == etag
+    # 304 отдан по версиям таблиц, запрос к БД не выполнялся
+    assert len(appointments()) == 1
+
+
+def test_history_etag_changes_on_write(app, client, appointments):
+    login(app, client, 7)
+    etag = client.get('/api/profile/appointments').headers['ETag']
+    app.config['response_cache'].invalidate('timetable')
+    response = client.get('/api/profile/appointments', headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert response.headers['ETag'] != etag
+    assert len(appointments()) == 2
+
+
+def test_history_etag_is_per_user_and_query(app, client, appointments):
+    login(app, client, 7)
+    etag = client.get('/api/profile/appointments').headers['ETag']
+    assert client.get('/api/profile/appointments?limit=10').headers['ETag'] != etag
+    login(app, client, 8, dict(PATIENT, patient_id=6))
+    assert client.get('/api/profile/appointments', headers={'If-None-Match': etag}).status_code == 200
+
+
+def test_history_falls_back_to_content_etag_without_tag_versions(app, client, redis, appointments, monkeypatch):
+    login(app, client, 7)
+    hgetall = redis.hgetall
+
+    def tags_unavailable(key):
+        if key == TAGS_KEY:
+            raise RedisError('Connection refused')
+        return hgetall(key)
+
+    monkeypatch.setattr(redis, 'hgetall', tags_unavailable)
+    # Без версий 304 по ним отдать нельзя: ответ собирается, ETag считается по телу
+    first = client.get('/api/profile/appointments')
+    second = client.get('/api/profile/appointments', headers={'If-None-Match': first.headers['ETag']})
+    assert second.status_code == 304
+    assert len(appointments()) == 2
+
+
+def test_cached_endpoint_answers_304_from_cache(app, client, sql):
+    sql.on('department', [{'id_dep': 1, 'name': 'Терапия'}])
+    first = client.get('/api/schedule/departments')
+    etag = first.headers['ETag']
+    second = client.get('/api/schedule/departments', headers={'If-None-Match': etag})
+    assert second.status_code == 304
+    assert len(sql.calls) == 1
+
+
+def test_plain_endpoint_uses_content_etag(app, client, sql):
+    login(app, client, 7)
+    sql.on('FROM patient p', [{'id_patient': 5, 'login': 'ivanov'}])
+    etag = client.get('/api/profile/patient').headers['ETag']
+    assert client.get('/api/profile/patient', headers={'If-None-Match': etag}).status_code == 304
+    sql.on('FROM patient p', [{'id_patient': 5, 'login': 'petrov'}])
+    assert client.get('/api/profile/patient', headers={'If-None-Match': etag}).status_code == 200
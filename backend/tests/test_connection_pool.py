@@ -0,0 +1,129 @@
+import pytest
+import mysql.connector
+from app.database import connection_pool
+from app.database.connection_pool import ConnectionPool, PoolTimeoutError
+
+
+class FakeConnection:
+    def __init__(self):
+        self.alive = True
+        self.closed = False
+        self.in_transaction = False
+        self.rollbacks = 0
+
+    def ping(self, reconnect=False):
+        if not self.alive:
+            raise mysql.connector.errors.InterfaceError('connection lost')
+
+    def rollback(self):
+        self.rollbacks += 1
+        self.in_transaction = False
+
+    def close(self):
+        self.closed = True
+
+
+@pytest.fixture
+def opened(monkeypatch):
+    """Все соединения, открытые пулом"""
+    connections = []
+
+    def connect(**params):
+        connections.append(FakeConnection())
+        return connections[-1]
+
+    monkeypatch.setattr(connection_pool.mysql.connector, 'connect', connect)
+    return connections
+
+
+def make_pool(**kwargs):
+    return ConnectionPool({}, **dict({'min_size': 2, 'max_size': 3, 'timeout': 0.05}, **kwargs))
+
+
+def test_fill_opens_min_size_connections(opened):
+    pool = make_pool()
+    assert pool.fill() == 2
+    assert pool.stats()['size'] == pool.stats()['idle'] == 2
+    assert pool.fill() == 0
+    # Запросы получают уже открытые соединения
+    assert pool.acquire() in opened
+    assert len(opened) == 2
+
+
+def test_fill_survives_unavailable_database(monkeypatch):
+    def connect(**params):
+        raise mysql.connector.errors.InterfaceError("Can't connect")
+
+    monkeypatch.setattr(connection_pool.mysql.connector, 'connect', connect)
+    pool = make_pool()
+    assert pool.fill() == 0
+    assert pool.stats()['size'] == 0
+
+
+def test_idle_eviction_keeps_min_size(opened, monkeypatch):
+    pool = make_pool(max_idle_time=10)
+    connections = [pool.acquire() for _ in range(3)]
+    for connection in connections:
+        pool.release(connection)
+    now = connection_pool.time.monotonic()
+    monkeypatch.setattr(connection_pool.time, 'monotonic', lambda: now + 60)
+    pool.release(pool.acquire())
+    assert pool.stats()['size'] == 2
+    assert sum(connection.closed for connection in opened) == 1
+
+
+def test_expired_connections_are_refilled(opened, monkeypatch, wait_for):
+    pool = make_pool(max_lifetime=10)
+    pool.fill()
+    now = connection_pool.time.monotonic()
+    monkeypatch.setattr(connection_pool.time, 'monotonic', lambda: now + 60)
+    connection = pool.acquire()
+    # Оба старых соединения закрыты, запрос получил новое, пул пополняется до min_size в фоне
+    assert connection in opened[2:]
+    assert opened[0].closed and opened[1].closed
+    wait_for(lambda: pool.stats()['size'] == 2 and len(opened) == 4)
+
+
+def test_dead_connections_are_replaced(opened, monkeypatch):
+    pool = make_pool()
+    pool.fill()
+    refills = []
+    monkeypatch.setattr(pool, 'fill_async', lambda: refills.append(pool.stats()['size']))
+    for connection in opened:
+        connection.alive = False
+    connection = pool.acquire()
+    # Оба соединения не ответили на ping и закрыты, запрос получил новое
+    assert connection is opened[2]
+    assert opened[0].closed and opened[1].closed
+    assert refills == [1, 0]
+    assert pool.fill() == 1
+    assert pool.stats()['size'] == 2
+
+
+def test_acquire_times_out_at_max_size(opened):
+    pool = make_pool()
+    held = [pool.acquire() for _ in range(3)]
+    with pytest.raises(PoolTimeoutError):
+        pool.acquire()
+    assert pool.stats()['timeouts'] == 1
+    pool.release(held[0])
+    assert pool.acquire() is held[0]
+
+
+def test_open_transaction_is_rolled_back_on_release(opened):
+    pool = make_pool()
+    connection = pool.acquire()
+    connection.in_transaction = True
+    pool.release(connection)
+    assert connection.rollbacks == 1
+    assert pool.acquire() is connection
+
+
+def test_broken_connection_is_not_returned_to_pool(opened, wait_for):
+    pool = make_pool(min_size=0)
+    with pytest.raises(mysql.connector.errors.OperationalError):
+        with pool.connection() as connection:
+            raise mysql.connector.errors.OperationalError('lost')
+    assert connection.closed
+    assert pool.stats()['size'] == 0
+    assert pool.acquire() is not connection
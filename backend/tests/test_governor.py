@@ -0,0 +1,163 @@
+import threading
+import time
+import pytest
+from mysql.connector import errorcode
+from mysql.connector.cursor import MySQLCursorPrepared
+from mysql.connector.errors import DatabaseError
+from app.database.governor import (
+    QueryGovernor, QueryLimits, QueryRowLimitError, QueryTimeoutError, QueryWatch, _Watchdog
+)
+
+
+class FakeConnection:
+    """Минимальное соединение для MySQLCursorPrepared: считает PREPARE и CLOSE"""
+
+    charset = 'utf8mb4'
+    get_warnings = False
+    raise_on_warnings = False
+
+    def __init__(self):
+        self.prepares = 0
+        self.closes = 0
+
+    def cmd_stmt_prepare(self, operation):
+        self.prepares += 1
+        return {'statement_id': self.prepares, 'parameters': [object()], 'columns': []}
+
+    def cmd_stmt_close(self, statement_id):
+        self.closes += 1
+
+    def cmd_stmt_reset(self, statement_id):
+        pass
+
+    def cmd_stmt_execute(self, statement_id, data=(), parameters=()):
+        return {'affected_rows': 0, 'insert_id': 0, 'warning_count': 0, 'info_msg': '', 'status_flag': 0}
+
+
+def make_cursor():
+    cursor = MySQLCursorPrepared()
+    connection = FakeConnection()
+    cursor._connection = connection
+    return cursor, connection
+
+
+def test_hinted_query_is_prepared_once():
+    governor = QueryGovernor()
+    limits = QueryLimits(timeout=3)
+    query = 'SELECT id_user FROM user WHERE login = %s'
+    cursor, connection = make_cursor()
+
+    for _ in range(5):
+        cursor.execute(governor.add_hint(query, limits), ('login',))
+
+    assert connection.prepares == 1
+    assert connection.closes == 0
+
+
+def test_hint_is_added_only_to_select():
+    governor = QueryGovernor()
+    limits = QueryLimits(timeout=1.5)
+    assert governor.add_hint('SELECT 1', limits) == 'SELECT /*+ MAX_EXECUTION_TIME(1500) */ 1'
+    assert governor.add_hint('UPDATE user SET login = %s', limits) == 'UPDATE user SET login = %s'
+    assert governor.add_hint('SELECT 1', QueryLimits()) == 'SELECT 1'
+
+
+def test_different_timeouts_get_different_hints():
+    governor = QueryGovernor()
+    query = 'SELECT 1'
+    assert governor.add_hint(query, QueryLimits(timeout=1)) != governor.add_hint(query, QueryLimits(timeout=2))
+
+
+class FakeCursor:
+    def __init__(self, rows):
+        self.rows = rows
+
+    def fetchmany(self, size):
+        return self.rows[:size]
+
+    def fetchall(self):
+        return list(self.rows)
+
+
+class KillRecorder:
+    connection_id = 42
+
+    def __init__(self, governor, monkeypatch):
+        self.killed = []
+        monkeypatch.setattr(
+            governor, 'kill_query',
+            lambda params, connection_id, blueprint=None: self.killed.append(connection_id)
+        )
+
+
+def test_row_cap_kills_query_and_raises(monkeypatch):
+    governor = QueryGovernor()
+    connection = KillRecorder(governor, monkeypatch)
+    with pytest.raises(QueryRowLimitError):
+        governor.fetch(FakeCursor(list(range(11))), QueryLimits(max_rows=10), {}, connection)
+    assert connection.killed == [42]
+    assert governor.stats()['totals']['row_limit_hits'] == 1
+    # Ровно max_rows строк - не превышение
+    assert governor.fetch(FakeCursor(list(range(10))), QueryLimits(max_rows=10), {}, connection) == list(range(10))
+
+
+def test_server_timeout_becomes_query_timeout_error():
+    governor = QueryGovernor()
+    error = DatabaseError(msg='maximum statement execution time exceeded', errno=errorcode.ER_QUERY_TIMEOUT)
+    assert isinstance(governor.translate(error, None), QueryTimeoutError)
+    assert governor.stats()['totals']['timeouts'] == 1
+
+
+def test_interrupted_query_is_a_timeout_only_if_watchdog_killed_it():
+    governor = QueryGovernor()
+    error = DatabaseError(msg='Query execution was interrupted', errno=errorcode.ER_QUERY_INTERRUPTED)
+    assert governor.translate(error, QueryWatch()) is error
+    watch = QueryWatch()
+    watch.killed = True
+    assert isinstance(governor.translate(error, watch), QueryTimeoutError)
+
+
+def test_watchdog_kills_slow_query_once(monkeypatch):
+    governor = QueryGovernor(kill_grace=0)
+    connection = KillRecorder(governor, monkeypatch)
+    watch = governor.watch({}, connection, QueryLimits(timeout=0.02))
+    time.sleep(0.1)
+    governor.unwatch(watch)
+    assert watch.killed
+    assert connection.killed == [42]
+    assert not governor._watchdog._active
+
+
+def test_unwatched_query_is_not_killed(monkeypatch):
+    governor = QueryGovernor(kill_grace=0)
+    connection = KillRecorder(governor, monkeypatch)
+    watch = governor.watch({}, connection, QueryLimits(timeout=0.05))
+    governor.unwatch(watch)
+    time.sleep(0.1)
+    assert not watch.killed
+    assert connection.killed == []
+    assert not governor._watchdog._active
+
+
+def test_cancel_waits_for_running_callback():
+    watchdog = _Watchdog()
+    started = threading.Event()
+    release = threading.Event()
+    finished = []
+
+    def slow_kill():
+        started.set()
+        release.wait(1)
+        finished.append(True)
+
+    token = watchdog.schedule(0, slow_kill)
+    assert started.wait(1)
+    cancelled = threading.Event()
+    canceller = threading.Thread(target=lambda: (watchdog.cancel(token), cancelled.set()))
+    canceller.start()
+    # Пока KILL QUERY выполняется, соединение нельзя возвращать в пул
+    assert not cancelled.wait(0.05)
+    release.set()
+    assert cancelled.wait(1)
+    assert finished == [True]
+    canceller.join()
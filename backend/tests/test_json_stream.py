@@ -0,0 +1,74 @@
+import json
+from datetime import date
+import pytest
+from flask import Flask
+from app.database.compact_result import CompactResult
+from app.utils import json_stream
+from app.utils.json_stream import stream_json_response
+
+ROWS = [{'id': 1, 'name': 'Зимина', 'birth': date(1980, 5, 1)}, {'id': 2, 'name': 'Орлов', 'birth': None}]
+COLUMNS = [{'COLUMN_NAME': 'id'}, {'COLUMN_NAME': 'name'}]
+
+
+@pytest.fixture
+def flask_app():
+    return Flask(__name__)
+
+
+def body(flask_app, query_string, rows, **kwargs):
+    with flask_app.test_request_context(query_string=query_string):
+        response = stream_json_response(rows, **kwargs)
+        return response.mimetype, b''.join(response.response).decode('utf-8')
+
+
+def test_json_object_with_fields(flask_app):
+    mimetype, text = body(flask_app, {}, iter(ROWS), fields={'columns': COLUMNS}, array_key='data')
+    assert mimetype == 'application/json'
+    assert json.loads(text) == {
+        'columns': COLUMNS,
+        'data': [dict(ROWS[0], birth='1980-05-01'), ROWS[1]]
+    }
+
+
+def test_ndjson_keeps_fields_as_header_line(flask_app):
+    mimetype, text = body(flask_app, {'format': 'ndjson'}, iter(ROWS), fields={'columns': COLUMNS}, array_key='data')
+    assert mimetype == 'application/x-ndjson'
+    lines = [json.loads(line) for line in text.splitlines()]
+    assert lines[0] == {'columns': COLUMNS}
+    assert [line['id'] for line in lines[1:]] == [1, 2]
+
+
+def test_ndjson_compact_rows(flask_app):
+    result = CompactResult(['id', 'name'], iter([(1, 'Зимина'), (2, 'Орлов')]))
+    _, text = body(flask_app, {'format': 'ndjson'}, result, fields={'columns': COLUMNS}, array_key='data')
+    assert [json.loads(line) for line in text.splitlines()] == [
+        {'columns': COLUMNS}, ['id', 'name'], [1, 'Зимина'], [2, 'Орлов']
+    ]
+
+
+def test_ndjson_without_fields_is_rows_only(flask_app):
+    _, text = body(flask_app, {'format': 'ndjson'}, iter(ROWS))
+    assert len(text.splitlines()) == 2
+
+
+def test_chunks_are_measured_in_bytes(flask_app, monkeypatch):
+    monkeypatch.setattr(json_stream, 'CHUNK_BYTES', 200)
+    rows = [{'id': i, 'name': 'Ж' * 40} for i in range(20)]
+    with flask_app.test_request_context():
+        chunks = list(stream_json_response(iter(rows)).response)
+    assert all(isinstance(chunk, bytes) for chunk in chunks)
+    row_bytes = len(json.dumps(rows[0], ensure_ascii=False).encode('utf-8'))
+    # Каждый фрагмент, кроме последнего, набран до порога в байтах и превышает его не больше чем на строку
+    for chunk in chunks[:-1]:
+        assert 200 <= len(chunk) < 200 + row_bytes + 2
+    assert json.loads(b''.join(chunks)) == rows
+
+
+def test_query_error_before_first_row_is_raised_immediately(flask_app):
+    def failing():
+        raise RuntimeError('query failed')
+        yield
+
+    with flask_app.test_request_context():
+        with pytest.raises(RuntimeError):
+            stream_json_response(failing())
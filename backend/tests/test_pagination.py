@@ -0,0 +1,107 @@
+from datetime import date, timedelta
+import pytest
+from flask import Flask
+from app.routes.auth import create_session
+from app.utils.pagination import MAX_PAGE_SIZE, UNPAGED_LIMIT, Page, decode_cursor, encode_cursor
+
+
+def page_for(query_string):
+    with Flask(__name__).test_request_context(query_string=query_string):
+        return Page.from_request()
+
+
+def rows(count, day=date(2030, 1, 15)):
+    """Строки по убыванию (дата, время, id), как их отдаёт запрос"""
+    return [
+        {'date': day, 'time': timedelta(hours=18) - timedelta(minutes=30 * i), 'appointment_id': 100 - i}
+        for i in range(count)
+    ]
+
+
+def test_cursor_round_trip():
+    token = encode_cursor(date(2030, 1, 15), timedelta(hours=9, minutes=30), 17)
+    assert decode_cursor(token) == (date(2030, 1, 15), '09:30:00', 17)
+
+
+@pytest.mark.parametrize('token', ['garbage', encode_cursor(date(2030, 1, 15), 'nonsense', 1)])
+def test_bad_cursor_is_rejected(token):
+    with pytest.raises(ValueError):
+        decode_cursor(token)
+
+
+def test_unpaged_request_returns_everything():
+    page = page_for({})
+    assert not page.paged
+    assert page.params()['limit'] == UNPAGED_LIMIT
+    assert page.split(rows(3), 'date', 'time', 'appointment_id') == (rows(3), None)
+    assert page.response([1, 2], None) == [1, 2]
+
+
+@pytest.mark.parametrize('limit', ['0', str(MAX_PAGE_SIZE + 1)])
+def test_limit_bounds(limit):
+    with pytest.raises(ValueError):
+        page_for({'limit': limit})
+
+
+def test_cursor_without_limit_uses_default_page():
+    page = page_for({'cursor': encode_cursor(date(2030, 1, 15), '10:00:00', 5)})
+    assert page.paged
+    assert page.params()['cursor_id'] == 5
+
+
+def test_page_fetches_one_extra_row():
+    assert page_for({'limit': '3'}).params(patient_id=5)['limit'] == 4
+
+
+def test_exactly_limit_rows_is_the_last_page():
+    page = page_for({'limit': '3'})
+    assert page.split(rows(3), 'date', 'time', 'appointment_id') == (rows(3), None)
+
+
+def test_extra_row_yields_cursor_on_last_returned_row():
+    page = page_for({'limit': '3'})
+    items, next_cursor = page.split(rows(4), 'date', 'time', 'appointment_id')
+    assert items == rows(3)
+    assert decode_cursor(next_cursor) == (date(2030, 1, 15), '17:00:00', 98)
+
+
+def test_date_window():
+    page = page_for({'from': '2030-01-01', 'to': '2030-01-31'})
+    assert (page.params()['date_from'], page.params()['date_to']) == (date(2030, 1, 1), date(2030, 1, 31))
+    with pytest.raises(ValueError):
+        page_for({'from': '31.01.2030'})
+
+
+@pytest.fixture
+def patient(app, client):
+    with app.app_context():
+        client.set_cookie('session_id', create_session(7, 'patient', {'patient_id': 5, 'doctor_id': None, 'department_id': None}))
+
+
+def test_patient_appointments_are_paged(app, client, patient, sql):
+    sql.on('FROM timetable t', rows(3))
+    response = client.get('/api/patient/appointments/5?limit=2')
+    assert response.status_code == 200
+    body = response.get_json()
+    assert [item['appointment_id'] for item in body['items']] == [100, 99]
+    assert body['items'][0]['time'] == '18:00'
+    (_, params, _), = sql.queries('FROM timetable t')
+    assert params['patient_id'] == 5 and params['limit'] == 3
+
+    sql.on('FROM timetable t', rows(3)[2:])
+    response = client.get(f"/api/patient/appointments/5?cursor={body['next_cursor']}")
+    assert response.get_json()['next_cursor'] is None
+    _, params, _ = sql.queries('FROM timetable t')[-1]
+    assert (params['cursor_date'], params['cursor_time'], params['cursor_id']) == (date(2030, 1, 15), '17:30:00', 99)
+
+
+def test_patient_cannot_read_another_patients_history(app, client, patient, sql):
+    assert client.get('/api/patient/diagnoses/6').status_code == 403
+    assert not sql.calls
+
+
+def test_doctor_can_read_patient_diagnoses(app, client, sql):
+    with app.app_context():
+        client.set_cookie('session_id', create_session(3, 'doctor', {'patient_id': None, 'doctor_id': 2, 'department_id': 1}))
+    sql.on('FROM visiting v', [])
+    assert client.get('/api/patient/diagnoses/6').get_json() == []
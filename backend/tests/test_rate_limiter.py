@@ -0,0 +1,45 @@
+import pytest
+from app.database.rate_limiter import REJECTED_KEY, Bucket, RateLimiter, retry_after_header
+
+
+@pytest.fixture
+def limiter(redis_client):
+    return RateLimiter({'ip': Bucket('ip', 3, 0.5), 'login': Bucket('login', 2, 0.1)})
+
+
+def test_burst_then_reject_with_retry_after(limiter):
+    for _ in range(2):
+        assert limiter.hit({'ip': '10.0.0.1', 'login': 'ivanov'}) == (True, 0.0)
+    allowed, retry_after = limiter.hit({'ip': '10.0.0.1', 'login': 'ivanov'})
+    assert not allowed
+    # Отказала корзина логина: токен появится через 1 / 0.1 секунды
+    assert 9 < retry_after <= 10
+    assert retry_after_header(retry_after) == '10'
+
+
+def test_rejected_attempt_does_not_spend_other_buckets(limiter):
+    limiter.hit({'ip': '10.0.0.1', 'login': 'ivanov'})
+    limiter.hit({'ip': '10.0.0.1', 'login': 'ivanov'})
+    assert not limiter.hit({'ip': '10.0.0.1', 'login': 'ivanov'})[0]
+    # Корзина IP потратила только два токена из трёх
+    assert limiter.hit({'ip': '10.0.0.1', 'login': None})[0]
+
+
+def test_rejections_are_counted_per_bucket(limiter):
+    for _ in range(4):
+        limiter.hit({'ip': '10.0.0.2', 'login': None})
+    assert limiter.stats()['rejected'] == {'ip': 1}
+
+
+def test_every_touched_key_is_declared(limiter, monkeypatch):
+    calls = []
+    script = limiter._get_script()
+    monkeypatch.setattr(limiter, '_script', lambda keys, args: calls.append((keys, args)) or script(keys=keys, args=args))
+    limiter.hit({'ip': '10.0.0.3', 'login': 'ivanov'})
+    keys, args = calls[0]
+    assert keys == ['ratelimit:ip:10.0.0.3', 'ratelimit:login:ivanov', REJECTED_KEY]
+    assert REJECTED_KEY not in args
+
+
+def test_no_values_is_always_allowed(limiter):
+    assert limiter.hit({'ip': None}) == (True, 0.0)
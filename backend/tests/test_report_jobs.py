@@ -0,0 +1,86 @@
+import pytest
+from app.database.report_jobs import JOB_DONE, JOB_FAILED, QUEUE_KEY, ReportJobQueue
+
+TTL = 600
+
+
+@pytest.fixture
+def jobs(redis_client):
+    return ReportJobQueue(job_ttl=TTL)
+
+
+def test_same_request_is_deduplicated_while_pending(jobs, redis_client):
+    first, created = jobs.enqueue(7, 1, {'b': 2, 'a': 1})
+    assert created
+    # Порядок ключей параметров не важен
+    second, created = jobs.enqueue(7, 1, {'a': 1, 'b': 2})
+    assert (second, created) == (first, False)
+    other, created = jobs.enqueue(8, 1, {'a': 1, 'b': 2})
+    assert created and other != first
+    assert redis_client.llen(QUEUE_KEY) == 2
+
+
+def test_claim_marks_job_running(jobs, redis_client):
+    job_id, _ = jobs.enqueue(7, 1, {})
+    job = jobs.claim('w1')
+    assert job['id'] == job_id
+    assert job['status'] == 'running'
+    assert job['worker'] == 'w1'
+    assert redis_client.lrange('reportjobs:processing:w1', 0, -1) == [job_id]
+    assert 0 < redis_client.ttl(f'reportjob:{job_id}') <= TTL
+    assert jobs.claim('w1') is None
+
+
+def test_claim_skips_expired_job(jobs, redis_client):
+    job_id, _ = jobs.enqueue(7, 1, {})
+    redis_client.delete(f'reportjob:{job_id}')
+    assert jobs.claim('w1') is None
+    # Хеш не создан заново без TTL, и задача не висит в processing
+    assert not redis_client.exists(f'reportjob:{job_id}')
+    assert redis_client.llen('reportjobs:processing:w1') == 0
+
+
+def test_progress_does_not_recreate_expired_job(jobs, redis_client):
+    job_id, _ = jobs.enqueue(7, 1, {})
+    jobs.progress(job_id, 40)
+    assert jobs.get(job_id)['progress'] == '40'
+    redis_client.delete(f'reportjob:{job_id}')
+    jobs.progress(job_id, 60)
+    assert jobs.get(job_id) is None
+
+
+def test_complete_frees_dedup_and_keeps_result(jobs, redis_client):
+    job_id, _ = jobs.enqueue(7, 1, {})
+    job = jobs.claim('w1')
+    jobs.complete('w1', job, '{"ok":true}', 42)
+    done = jobs.get(job_id)
+    assert done['status'] == JOB_DONE
+    assert done['result'] == '{"ok":true}'
+    assert done['report_id'] == '42'
+    assert 0 < redis_client.ttl(f'reportjob:{job_id}') <= TTL
+    assert redis_client.llen('reportjobs:processing:w1') == 0
+    # Такой же запрос теперь ставит новую задачу
+    again, created = jobs.enqueue(7, 1, {})
+    assert created and again != job_id
+
+
+def test_fail_records_error(jobs):
+    job_id, _ = jobs.enqueue(7, 1, {})
+    jobs.fail('w1', jobs.claim('w1'), 'boom')
+    failed = jobs.get(job_id)
+    assert failed['status'] == JOB_FAILED
+    assert failed['error'] == 'boom'
+    assert jobs.enqueue(7, 1, {})[1]
+
+
+def test_orphaned_jobs_are_requeued_and_claimed_again(jobs, redis_client):
+    first, _ = jobs.enqueue(7, 1, {'n': 1})
+    second, _ = jobs.enqueue(7, 1, {'n': 2})
+    assert jobs.claim('w1')['id'] == first
+    assert jobs.claim('w1')['id'] == second
+    # Воркер упал; после перезапуска под тем же именем задачи возвращаются в очередь по порядку
+    assert jobs.requeue_orphaned('w1') == 2
+    assert redis_client.llen('reportjobs:processing:w1') == 0
+    assert jobs.claim('w1')['id'] == first
+    assert jobs.claim('w1')['id'] == second
+    assert jobs.requeue_orphaned('w2') == 0
@@ -0,0 +1,81 @@
+import json
+import pytest
+from app.database.governor import QueryRowLimitError
+from app.database.redis_provider import RedisProvider
+from app.database.report_jobs import JOB_DONE, JOB_FAILED, ReportJobQueue
+
+worker = pytest.importorskip('worker')
+
+REPORT_TYPE = {'id_report_type': 2, 'name': 'Общий отчет за месяц', 'parameters': '{"required": ["year", "month"]}'}
+VISIT = {'patient_id_patient': 5, 'doctor_id_doc': 3, 'date': '2030-01-15', 'diagnosis': 'ОРВИ'}
+
+
+class FakeReportsSQL:
+    """Провайдер для build_report: отчёт сохраняется, детали читаются потоком с ограничением строк"""
+
+    def __init__(self, max_rows):
+        self.max_rows = max_rows
+        self.inserted_details = []
+        self.statements = []
+
+    def get_query(self, name):
+        return name
+
+    def execute_query(self, query, params=None, **kwargs):
+        self.statements.append(query)
+        if 'INSERT INTO report (' in query:
+            return 77
+        if query.startswith('DELETE'):
+            return 1
+        if 'FROM report_type' in query:
+            return [REPORT_TYPE]
+        return [{'total_patients': 2}]
+
+    def stream_query(self, query, params=None, limits=None):
+        def rows():
+            for count in range(3):
+                if count >= self.max_rows:
+                    # Так governor прерывает чтение сверх max_rows
+                    raise QueryRowLimitError(f"Результат превышает {self.max_rows} строк")
+                yield VISIT
+        return rows()
+
+    def bulk_insert(self, table, columns, rows, batch_size=None):
+        # Как и настоящий bulk_insert: вся вставка - одна транзакция
+        batch = list(rows)
+        self.inserted_details.extend(batch)
+        return {'affected_rows': len(batch), 'batches': [len(batch)]}
+
+
+@pytest.fixture
+def jobs(redis_client, monkeypatch):
+    # Приложение воркера создаётся при импорте: очередь нужна своя, со скриптами на Redis этого теста
+    monkeypatch.setitem(worker.app.config, 'report_jobs', ReportJobQueue())
+    return worker.app.config['report_jobs']
+
+
+def run(jobs, sql, monkeypatch):
+    monkeypatch.setitem(worker.app.config, 'sql_provider', sql)
+    job_id, _ = jobs.enqueue(7, 2, {'year': 2030, 'month': 1})
+    worker.run_job('w1', jobs.claim('w1'))
+    return jobs.get(job_id)
+
+
+def test_report_job_completes(jobs, monkeypatch):
+    sql = FakeReportsSQL(max_rows=10)
+    job = run(jobs, sql, monkeypatch)
+    assert job['status'] == JOB_DONE
+    assert job['report_id'] == '77'
+    assert json.loads(job['result'])['report_id'] == 77
+    assert len(sql.inserted_details) == 3
+
+
+def test_details_row_cap_fails_the_job(jobs, monkeypatch):
+    sql = FakeReportsSQL(max_rows=2)
+    job = run(jobs, sql, monkeypatch)
+    assert job['status'] == JOB_FAILED
+    assert 'превышает 2 строк' in job['error']
+    assert sql.inserted_details == []
+    # Отчёт без деталей не остаётся в истории
+    assert 'DELETE FROM report WHERE id_report = %s' in sql.statements
+    assert RedisProvider.get_client().llen('reportjobs:processing:w1') == 0
@@ -0,0 +1,155 @@
+import base64
+import json
+import time
+import pytest
+from app.routes.auth import (
+    SESSION_MODE_TOKEN, create_session, load_session, revoke_session, revoke_user_sessions,
+    session_key, user_sessions_key
+)
+
+IDENTITY = {'patient_id': 5, 'doctor_id': None, 'department_id': None}
+
+
+def test_session_is_stored_as_hash_and_indexed(app, redis, client, whoami):
+    with app.app_context():
+        session_id = create_session(7, 'patient', IDENTITY)
+    assert redis.type(session_key(session_id)) == 'hash'
+    assert redis.hgetall(session_key(session_id)) == {'u': '7', 'r': 'patient', 'p': '5'}
+    assert redis.smembers(user_sessions_key(7)) == {session_id}
+
+    client.set_cookie('session_id', session_id)
+    response = client.get(whoami)
+    assert response.status_code == 200
+    assert response.get_json() == {
+        'user_id': 7, 'role': 'patient', 'patient_id': 5, 'doctor_id': None, 'department_id': None
+    }
+
+
+def test_logout_revokes_session(app, redis, client, whoami):
+    with app.app_context():
+        session_id = create_session(7, 'patient', IDENTITY)
+    client.set_cookie('session_id', session_id)
+    assert client.post('/api/auth/logout').status_code == 200
+    client.set_cookie('session_id', session_id)
+    assert client.get(whoami).status_code == 401
+    assert not redis.exists(session_key(session_id))
+    assert redis.smembers(user_sessions_key(7)) == set()
+
+
+def test_legacy_json_session_is_upgraded(app, redis, sql, client, whoami):
+    redis.set(session_key('legacy'), json.dumps({'user_id': 7, 'role': 'patient'}), ex=600)
+    # Старая сессия без идентичности - её дочитывает auth/get_identity.sql
+    sql.on('', [{'patient_id': 5, 'doctor_id': None, 'department_id': None}])
+
+    client.set_cookie('session_id', 'legacy')
+    response = client.get(whoami)
+    assert response.status_code == 200
+    assert response.get_json()['patient_id'] == 5
+    assert redis.type(session_key('legacy')) == 'hash'
+    assert 'legacy' in redis.smembers(user_sessions_key(7))
+    assert 0 < redis.ttl(session_key('legacy')) <= 86400
+
+
+def test_logout_with_legacy_json_session(app, redis, client, whoami):
+    redis.set(session_key('legacy'), json.dumps({'user_id': 7, 'role': 'patient'}), ex=600)
+    redis.sadd(user_sessions_key(7), 'legacy')
+    client.set_cookie('session_id', 'legacy')
+
+    assert client.post('/api/auth/logout').status_code == 200
+    assert not redis.exists(session_key('legacy'))
+    assert redis.smembers(user_sessions_key(7)) == set()
+    client.set_cookie('session_id', 'legacy')
+    assert client.get(whoami).status_code == 401
+
+
+def test_revoke_user_sessions(app, redis):
+    with app.app_context():
+        first = create_session(7, 'patient', IDENTITY)
+        second = create_session(7, 'patient', IDENTITY)
+        other = create_session(8, 'patient', IDENTITY)
+        assert revoke_user_sessions(7) == 2
+        assert load_session(first) is None
+        assert load_session(second) is None
+        assert load_session(other) is not None
+
+
+def test_cached_session_is_dropped_on_revoke(app, redis, wait_for):
+    cache = app.config['session_cache']
+    with app.app_context():
+        session_id = create_session(7, 'patient', IDENTITY)
+        # Первое обращение запускает подписку на отзывы
+        assert load_session(session_id) is not None
+        wait_for(lambda: cache.stats()['listening'])
+        assert load_session(session_id) is not None
+        assert load_session(session_id) is not None
+        assert cache.stats()['hits'] >= 1
+
+        revoke_session(session_id)
+        assert load_session(session_id) is None
+
+
+@pytest.fixture
+def token_mode(app):
+    app.config['SESSION_MODE'] = SESSION_MODE_TOKEN
+    # Отзыв видим сразу, без ожидания перечитывания denylist
+    app.config['session_denylist'].refresh_interval = 0
+
+
+def test_token_session_round_trip(app, token_mode, client, whoami):
+    with app.app_context():
+        token = create_session(7, 'doctor', {'patient_id': None, 'doctor_id': 3, 'department_id': 1})
+    client.set_cookie('session_id', token)
+    response = client.get(whoami)
+    assert response.status_code == 200
+    assert response.get_json()['doctor_id'] == 3
+
+
+def test_token_logout_and_bulk_revoke(app, token_mode, client, whoami):
+    with app.app_context():
+        first = create_session(7, 'patient', IDENTITY)
+        second = create_session(7, 'patient', IDENTITY)
+        other = create_session(8, 'patient', IDENTITY)
+
+    client.set_cookie('session_id', first)
+    client.post('/api/auth/logout')
+    client.set_cookie('session_id', first)
+    assert client.get(whoami).status_code == 401
+    client.set_cookie('session_id', second)
+    assert client.get(whoami).status_code == 200
+
+    with app.app_context():
+        revoke_user_sessions(7)
+    assert client.get(whoami).status_code == 401
+    client.set_cookie('session_id', other)
+    assert client.get(whoami).status_code == 200
+
+
+def test_relogin_right_after_bulk_revoke_is_valid(app, token_mode, client, whoami):
+    with app.app_context():
+        old = create_session(7, 'patient', IDENTITY)
+        revoke_user_sessions(7)
+        # В ту же секунду, что и отзыв
+        fresh = create_session(7, 'patient', IDENTITY)
+    client.set_cookie('session_id', old)
+    assert client.get(whoami).status_code == 401
+    client.set_cookie('session_id', fresh)
+    assert client.get(whoami).status_code == 200
+
+
+def test_legacy_token_without_iat_is_accepted_and_revocable(app, token_mode, client, whoami):
+    signer = app.config['session_signer']
+    payload = json.dumps([7, 'patient', 5, None, None, int(time.time()) + 3600, 'legacy'], separators=(',', ':'))
+    encoded = base64.urlsafe_b64encode(payload.encode('utf-8')).rstrip(b'=').decode('ascii')
+    token = f"{encoded}.{signer._sign(encoded)}"
+    client.set_cookie('session_id', token)
+    assert client.get(whoami).status_code == 200
+    with app.app_context():
+        revoke_user_sessions(7)
+    assert client.get(whoami).status_code == 401
+
+
+@pytest.mark.parametrize('token', ['garbage', 'abc.def', '', 'абв.где'])
+def test_malformed_token_is_rejected(app, token_mode, client, whoami, token):
+    assert app.config['session_signer'].verify(token) is None
+    client.set_cookie('session_id', token)
+    assert client.get(whoami).status_code == 401
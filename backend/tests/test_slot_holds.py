@@ -0,0 +1,61 @@
+from datetime import date
+import pytest
+from app.database.slot_holds import SlotHolds
+from app.routes.auth import create_session
+
+DAY = date(2030, 1, 15)
+
+
+@pytest.fixture
+def holds(redis_client):
+    return SlotHolds(ttl=300)
+
+
+def test_hold_is_exclusive(holds):
+    assert holds.hold(3, DAY, '10:30', 7)
+    assert not holds.hold(3, DAY, '10:30', 8)
+    # Повторное удержание своим пользователем продлевает его
+    assert holds.hold(3, DAY, '10:30:00', 7)
+
+
+def test_holds_are_hidden_from_other_users_only(holds):
+    holds.hold(3, DAY, '10:30', 7)
+    assert holds.held_by_others(3, [DAY], 8) == {DAY: {'10:30'}}
+    assert holds.held_by_others(3, [DAY], 7) == {DAY: set()}
+
+
+def test_new_hold_replaces_previous_one(holds, redis_client):
+    holds.hold(3, DAY, '10:30', 7)
+    holds.hold(4, DAY, '11:00', 7)
+    assert not redis_client.exists(f'hold:3:{DAY}:10:30')
+    assert holds.held_by_others_many([(3, DAY), (4, DAY)], 8) == {(3, DAY): set(), (4, DAY): {'11:00'}}
+    assert holds.hold(3, DAY, '10:30', 8)
+
+
+def test_release(holds, redis_client):
+    holds.hold(3, DAY, '10:30', 7)
+    assert not holds.release(3, DAY, '10:30', 8)
+    assert holds.release(3, DAY, '10:30', 7)
+    assert not redis_client.exists('hold:user:7')
+    assert holds.held_by_others(3, [DAY], 8) == {DAY: set()}
+    # Свободный слот снимать нечего - это не ошибка
+    assert holds.release(3, DAY, '10:30', 8)
+
+
+def test_expired_hold_is_not_reported(holds, redis_client):
+    holds.hold(3, DAY, '10:30', 7)
+    redis_client.zadd(f'holds:3:{DAY}', {'10:30|7': 1})
+    assert holds.held_by_others(3, [DAY], 8) == {DAY: set()}
+
+
+def test_hold_endpoint_conflicts(app, client, sql):
+    sql.on('doctor_schedule', [{'start_time': '09:00', 'end_time': '12:00'}])
+    app.config['slot_holds'].hold(3, DAY, '10:30', 99)
+    with app.app_context():
+        client.set_cookie('session_id', create_session(7, 'patient', {'patient_id': 5, 'doctor_id': None, 'department_id': None}))
+    response = client.post('/api/appointment/hold', json={'doctor_id': 3, 'date': DAY.isoformat(), 'time': '10:30'})
+    assert response.status_code == 409
+    assert response.get_json() == {'error': 'Это время сейчас оформляет другой пациент'}
+    response = client.post('/api/appointment/hold', json={'doctor_id': 3, 'date': DAY.isoformat(), 'time': '11:00'})
+    assert response.status_code == 201
+    assert response.get_json()['expires_in'] == app.config['slot_holds'].ttl
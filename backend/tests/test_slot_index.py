@@ -0,0 +1,95 @@
+from datetime import date, timedelta
+import pytest
+from app.database.slot_index import DayAvailability, SlotAvailabilityIndex
+
+DAY = date(2030, 1, 15)
+OTHER_DAY = date(2030, 1, 16)
+
+
+@pytest.fixture
+def index(redis_client):
+    return SlotAvailabilityIndex(ttl=600)
+
+
+def test_build_marks_busy_slots():
+    day = DayAvailability.build(timedelta(hours=9), timedelta(hours=11), [timedelta(hours=9, minutes=30), '10:30:00'])
+    assert day.count == 4
+    assert day.free_slots() == ['09:00', '10:00']
+
+
+def test_build_ignores_times_outside_the_grid():
+    day = DayAvailability.build('09:00', '10:00', ['08:30', '09:15', '10:00'])
+    assert day.free_slots() == ['09:00', '09:30']
+
+
+def test_partial_last_slot_counts():
+    assert DayAvailability.build('09:00', '10:15', []).free_slots() == ['09:00', '09:30', '10:00']
+
+
+def test_empty_index_returns_generation(index):
+    day, generation = index.get(3, DAY)
+    assert day is None
+    assert generation == ''
+
+
+def test_store_and_read_back(index, redis_client):
+    _, generation = index.get(3, DAY)
+    index.store(3, DAY, DayAvailability.build('09:00', '12:00', ['10:00']), generation)
+    day, _ = index.get(3, DAY)
+    assert day.free_slots() == ['09:00', '09:30', '10:30', '11:00', '11:30']
+    assert 0 < redis_client.ttl(f'slots:3:{DAY}') <= 600
+
+
+def test_day_without_slots_is_cached_as_empty(index):
+    _, generation = index.get(3, DAY)
+    index.store(3, DAY, DayAvailability.build('09:00', '09:00', []), generation)
+    day, _ = index.get(3, DAY)
+    assert day is not None and day.free_slots() == []
+
+
+def test_mark_updates_built_day(index):
+    _, generation = index.get(3, DAY)
+    index.store(3, DAY, DayAvailability.build('09:00', '10:00', []), generation)
+    index.mark(3, DAY, '09:30', free=False)
+    assert index.get(3, DAY)[0].free_slots() == ['09:00']
+    index.mark(3, DAY, timedelta(hours=9, minutes=30), free=True)
+    assert index.get(3, DAY)[0].free_slots() == ['09:00', '09:30']
+
+
+def test_mark_does_not_create_unbuilt_day(index):
+    index.mark(3, DAY, '09:30', free=False)
+    assert index.get(3, DAY)[0] is None
+
+
+def test_store_after_concurrent_change_is_dropped(index):
+    _, generation = index.get(3, DAY)
+    # Пока день перестраивался из БД, кто-то записался к врачу
+    index.mark(3, DAY, '09:30', free=False)
+    index.store(3, DAY, DayAvailability.build('09:00', '10:00', []), generation)
+    assert index.get(3, DAY)[0] is None
+
+
+def test_get_many_reads_several_days(index):
+    days, generation = index.get_many(3, [DAY, OTHER_DAY])
+    index.store_many(3, {DAY: DayAvailability.build('09:00', '10:00', ['09:00'])}, generation)
+    days, _ = index.get_many(3, [DAY, OTHER_DAY])
+    assert days[DAY].free_slots() == ['09:30']
+    assert days[OTHER_DAY] is None
+
+
+def test_invalidate_doctor_drops_only_that_doctor(index):
+    for doctor_id in (3, 4):
+        _, generation = index.get(doctor_id, DAY)
+        index.store(doctor_id, DAY, DayAvailability.build('09:00', '10:00', []), generation)
+    index.invalidate_doctor(3)
+    assert index.get(3, DAY)[0] is None
+    assert index.get(4, DAY)[0] is not None
+
+
+def test_invalidate_all(index, redis_client):
+    _, generation = index.get(3, DAY)
+    index.store(3, DAY, DayAvailability.build('09:00', '10:00', []), generation)
+    redis_client.set('cache:tags', 'x')
+    index.invalidate_all()
+    assert index.get(3, DAY)[0] is None
+    assert redis_client.exists('cache:tags')
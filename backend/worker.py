@@ -0,0 +1,73 @@
+"""Воркер очереди отчётов: python worker.py
+
+Берёт задачи из Redis и строит отчёты не больше чем в REPORT_WORKER_CONCURRENCY потоков.
+Имя воркера (REPORT_WORKER_NAME, по умолчанию имя хоста) должно сохраняться между перезапусками:
+по нему воркер находит и возвращает в очередь задачи, оборванные прошлым запуском.
+"""
+import json
+import os
+import signal
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from app import create_app
+from app.routes.reports import JSONEncoder, build_report, get_report_type
+
+app = create_app()
+
+
+def run_job(worker_name: str, job: dict):
+    jobs = app.config['report_jobs']
+    with app.app_context():
+        try:
+            report_type = get_report_type(int(job['report_type_id']))
+            if report_type is None:
+                raise ValueError('Тип отчета не найден')
+            jobs.progress(job['id'], 10)
+            report_id, payload = build_report(
+                report_type,
+                json.loads(job['parameters']),
+                int(job['user_id']),
+                limits=app.config['REPORT_JOB_LIMITS'],
+                progress=lambda percent: jobs.progress(job['id'], percent)
+            )
+            jobs.complete(worker_name, job, json.dumps(payload, cls=JSONEncoder, ensure_ascii=False), report_id)
+        except Exception as e:
+            print(f"Report job {job['id']} failed: {str(e)}")
+            jobs.fail(worker_name, job, str(e))
+
+
+def main():
+    worker_name = os.getenv('REPORT_WORKER_NAME', socket.gethostname())
+    concurrency = app.config['REPORT_WORKER_CONCURRENCY']
+    jobs = app.config['report_jobs']
+    stopping = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *_: stopping.set())
+    signal.signal(signal.SIGINT, lambda *_: stopping.set())
+
+    requeued = jobs.requeue_orphaned(worker_name)
+    print(f"Report worker {worker_name}: concurrency {concurrency}, requeued {requeued}")
+
+    # Семафор не даёт забрать из очереди больше задач, чем есть свободных потоков
+    slots = threading.BoundedSemaphore(concurrency)
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='report-job') as executor:
+        while not stopping.is_set():
+            if not slots.acquire(timeout=1):
+                continue
+            try:
+                job = jobs.claim(worker_name)
+            except Exception as e:
+                slots.release()
+                print(f"Report queue unavailable: {str(e)}")
+                time.sleep(1)
+                continue
+            if job is None:
+                slots.release()
+                continue
+            executor.submit(run_job, worker_name, job).add_done_callback(lambda _: slots.release())
+    # Выход из with дожидается задач, которые уже выполняются
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,131 @@
+-- Обновление существующей базы до текущей schema.sql: уникальность слота врача и индексы
+-- для поиска свободного времени и постраничных списков приёмов.
+-- Повторный запуск ничего не меняет. Новые установки получают всё это из schema.sql.
+-- Удалённые дубли записей сохраняются в timetable_removed_duplicates: после запуска проверьте
+-- эту таблицу - пациентов из неё нужно предупредить, что их запись на занятое время отменена.
+-- Запуск: docker exec -i mysql_db mysql -uroot -pclinic clinic < database/migrations/001_timetable_slot_unique_and_indexes.sql
+USE clinic;
+
+-- Журнал удалённых дублей: строка timetable целиком и запись, которая осталась на этом слоте
+CREATE TABLE IF NOT EXISTS `timetable_removed_duplicates` (
+  `id_tit` int NOT NULL,
+  `cabinet_id_cab` int NOT NULL,
+  `doctor_id_doc` int NOT NULL,
+  `patient_id_patient` int NOT NULL,
+  `admission` date NOT NULL,
+  `time` time NOT NULL,
+  `appearance` varchar(100) DEFAULT NULL,
+  `kept_id_tit` int NOT NULL,
+  `removed_at` datetime NOT NULL DEFAULT CURRENT_TIMESTAMP,
+  PRIMARY KEY (`id_tit`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+
+-- Дубли записей на один слот врача (doctor, admission, time): оставляем запись, по которой уже
+-- был приём, иначе самую раннюю. Приёмы с удаляемых дублей переводим на оставшуюся запись
+-- (пациент приёма хранится в visiting, так что он не теряется)
+DROP TEMPORARY TABLE IF EXISTS `timetable_slot_keep`;
+CREATE TEMPORARY TABLE `timetable_slot_keep` AS
+SELECT
+    t.doctor_id_doc,
+    t.admission,
+    t.time,
+    COALESCE(MIN(CASE WHEN v.id_vis IS NOT NULL THEN t.id_tit END), MIN(t.id_tit)) AS keep_id
+FROM timetable t
+LEFT JOIN visiting v ON v.timetable_id = t.id_tit
+GROUP BY t.doctor_id_doc, t.admission, t.time
+HAVING COUNT(DISTINCT t.id_tit) > 1;
+
+INSERT INTO timetable_removed_duplicates
+    (id_tit, cabinet_id_cab, doctor_id_doc, patient_id_patient, admission, time, appearance, kept_id_tit)
+SELECT t.id_tit, t.cabinet_id_cab, t.doctor_id_doc, t.patient_id_patient, t.admission, t.time, t.appearance, k.keep_id
+FROM timetable t
+JOIN timetable_slot_keep k
+    ON k.doctor_id_doc = t.doctor_id_doc AND k.admission = t.admission AND k.time = t.time
+WHERE t.id_tit <> k.keep_id;
+
+UPDATE visiting v
+JOIN timetable t ON t.id_tit = v.timetable_id
+JOIN timetable_slot_keep k
+    ON k.doctor_id_doc = t.doctor_id_doc AND k.admission = t.admission AND k.time = t.time
+SET v.timetable_id = k.keep_id
+WHERE t.id_tit <> k.keep_id;
+
+DELETE t FROM timetable t
+JOIN timetable_slot_keep k
+    ON k.doctor_id_doc = t.doctor_id_doc AND k.admission = t.admission AND k.time = t.time
+WHERE t.id_tit <> k.keep_id;
+
+DROP TEMPORARY TABLE `timetable_slot_keep`;
+
+-- В MySQL 8.0 нет ADD INDEX IF NOT EXISTS: проверяем information_schema и выполняем ALTER через PREPARE
+SET @ddl = IF(
+    (SELECT COUNT(*) FROM information_schema.statistics
+     WHERE table_schema = DATABASE() AND table_name = 'timetable' AND index_name = 'uq_timetable_doctor_slot') = 0,
+    'ALTER TABLE `timetable` ADD UNIQUE KEY `uq_timetable_doctor_slot` (`doctor_id_doc`, `admission`, `time`)',
+    'DO 0'
+);
+PREPARE stmt FROM @ddl;
+EXECUTE stmt;
+DEALLOCATE PREPARE stmt;
+
+SET @ddl = IF(
+    (SELECT COUNT(*) FROM information_schema.statistics
+     WHERE table_schema = DATABASE() AND table_name = 'timetable' AND index_name = 'idx_timetable_patient_admission') = 0,
+    'ALTER TABLE `timetable` ADD KEY `idx_timetable_patient_admission` (`patient_id_patient`, `admission`, `time`)',
+    'DO 0'
+);
+PREPARE stmt FROM @ddl;
+EXECUTE stmt;
+DEALLOCATE PREPARE stmt;
+
+SET @ddl = IF(
+    (SELECT COUNT(*) FROM information_schema.statistics
+     WHERE table_schema = DATABASE() AND table_name = 'visiting' AND index_name = 'idx_visiting_patient_date') = 0,
+    'ALTER TABLE `visiting` ADD KEY `idx_visiting_patient_date` (`patient_id_patient`, `date`, `time`)',
+    'DO 0'
+);
+PREPARE stmt FROM @ddl;
+EXECUTE stmt;
+DEALLOCATE PREPARE stmt;
+
+SET @ddl = IF(
+    (SELECT COUNT(*) FROM information_schema.statistics
+     WHERE table_schema = DATABASE() AND table_name = 'doctor' AND index_name = 'idx_doctor_specialization') = 0,
+    'ALTER TABLE `doctor` ADD KEY `idx_doctor_specialization` (`specialization`)',
+    'DO 0'
+);
+PREPARE stmt FROM @ddl;
+EXECUTE stmt;
+DEALLOCATE PREPARE stmt;
+
+-- Прежние одностолбцовые индексы внешних ключей покрыты новыми составными (тот же первый столбец),
+-- поэтому удаляются, как и в schema.sql. Внешним ключам хватает составных индексов
+SET @ddl = IF(
+    (SELECT COUNT(*) FROM information_schema.statistics
+     WHERE table_schema = DATABASE() AND table_name = 'timetable' AND index_name = 'fk_timetable_doctor1_idx') > 0,
+    'ALTER TABLE `timetable` DROP INDEX `fk_timetable_doctor1_idx`',
+    'DO 0'
+);
+PREPARE stmt FROM @ddl;
+EXECUTE stmt;
+DEALLOCATE PREPARE stmt;
+
+SET @ddl = IF(
+    (SELECT COUNT(*) FROM information_schema.statistics
+     WHERE table_schema = DATABASE() AND table_name = 'timetable' AND index_name = 'fk_timetable_patient1_idx') > 0,
+    'ALTER TABLE `timetable` DROP INDEX `fk_timetable_patient1_idx`',
+    'DO 0'
+);
+PREPARE stmt FROM @ddl;
+EXECUTE stmt;
+DEALLOCATE PREPARE stmt;
+
+SET @ddl = IF(
+    (SELECT COUNT(*) FROM information_schema.statistics
+     WHERE table_schema = DATABASE() AND table_name = 'visiting' AND index_name = 'fk_visiting_patient1_idx') > 0,
+    'ALTER TABLE `visiting` DROP INDEX `fk_visiting_patient1_idx`',
+    'DO 0'
+);
+PREPARE stmt FROM @ddl;
+EXECUTE stmt;
+DEALLOCATE PREPARE stmt;
\ No newline at end of file
@@ -60,6 +60,7 @@ CREATE TABLE `doctor` (
   `user_id` int DEFAULT NULL,
   PRIMARY KEY (`id_doc`),
   KEY `fk_doctor_department_idx` (`department_id_dep`),
+  KEY `idx_doctor_specialization` (`specialization`),
   CONSTRAINT `fk_doctor_department` FOREIGN KEY (`department_id_dep`) REFERENCES `department` (`id_dep`),
   CONSTRAINT `fk_doctor_user` FOREIGN KEY (`user_id`) REFERENCES `user` (`id_user`)
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
@@ -93,8 +94,8 @@ CREATE TABLE `timetable` (
   `appearance` varchar(100) DEFAULT NULL,
   PRIMARY KEY (`id_tit`),
   KEY `fk_timetable_cabinet1_idx` (`cabinet_id_cab`),
-  KEY `fk_timetable_doctor1_idx` (`doctor_id_doc`),
-  KEY `fk_timetable_patient1_idx` (`patient_id_patient`),
+  UNIQUE KEY `uq_timetable_doctor_slot` (`doctor_id_doc`, `admission`, `time`),
+  KEY `idx_timetable_patient_admission` (`patient_id_patient`, `admission`, `time`),
   CONSTRAINT `fk_timetable_cabinet1` FOREIGN KEY (`cabinet_id_cab`) REFERENCES `cabinet` (`id_cab`),
   CONSTRAINT `fk_timetable_doctor1` FOREIGN KEY (`doctor_id_doc`) REFERENCES `doctor` (`id_doc`),
   CONSTRAINT `fk_timetable_patient1` FOREIGN KEY (`patient_id_patient`) REFERENCES `patient` (`id_patient`)
@@ -115,7 +116,7 @@ CREATE TABLE `visiting` (
   `timetable_id` int NOT NULL,
   PRIMARY KEY (`id_vis`),
   UNIQUE KEY `id_vis_UNIQUE` (`id_vis`),
-  KEY `fk_visiting_patient1_idx` (`patient_id_patient`),
+  KEY `idx_visiting_patient_date` (`patient_id_patient`, `date`, `time`),
   KEY `fk_visiting_doctor1_idx` (`doctor_id_doc`),
   KEY `fk_visiting_timetable1_idx` (`timetable_id`),
   CONSTRAINT `fk_visiting_doctor1` FOREIGN KEY (`doctor_id_doc`) REFERENCES `doctor` (`id_doc`),
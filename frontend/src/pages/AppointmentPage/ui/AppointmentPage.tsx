@@ -104,6 +104,38 @@ const AppointmentPage = () => {
     }
   }, [appointmentData.selectedDoctor, appointmentData.selectedDate]);
 
+  // Удерживаем выбранное время, пока пациент подтверждает запись
+  const handleSelectTime = async (time: string) => {
+    try {
+      const response = await fetch(API_ENDPOINTS.APPOINTMENT.HOLD, {
+        method: 'POST',
+        headers: {
+          'Content-Type': 'application/json',
+        },
+        body: JSON.stringify({
+          doctor_id: appointmentData.selectedDoctor,
+          date: appointmentData.selectedDate,
+          time,
+        }),
+        credentials: 'include',
+      });
+
+      if (response.ok) {
+        setError('');
+        setAppointmentData({
+          ...appointmentData,
+          selectedTime: time
+        });
+      } else {
+        const data = await response.json();
+        setError(data.error || 'Это время недоступно');
+        fetchAvailableSlots();
+      }
+    } catch (err) {
+      setError('Ошибка при выборе времени');
+    }
+  };
+
   const handleNext = () => {
     setStep(prev => prev + 1);
   };
@@ -214,10 +246,7 @@ const AppointmentPage = () => {
                     <button
                       key={time}
                       className={`${styles.timeSlot} ${appointmentData.selectedTime === time ? styles.selected : ''}`}
-                      onClick={() => setAppointmentData({
-                        ...appointmentData,
-                        selectedTime: time
-                      })}
+                      onClick={() => handleSelectTime(time)}
                     >
                       {time}
                     </button>
@@ -198,12 +198,39 @@ const ReportsPage = () => {
             const data = await response.json();
             
             if (response.ok) {
+                setSuccess('Отчет формируется...');
+                waitForReportJob(data.job_id);
+            } else {
+                setError(data.error || 'Ошибка при генерации отчета');
+            }
+        } catch (err) {
+            setError('Ошибка при генерации отчета');
+        }
+    };
+
+    // Отчет строится в фоне - опрашиваем статус задачи, пока она не завершится
+    const waitForReportJob = async (jobId: string) => {
+        try {
+            const response = await fetch(API_ENDPOINTS.REPORTS.JOB(jobId), {
+                credentials: 'include'
+            });
+            const data = await response.json();
+
+            if (!response.ok) {
+                setSuccess('');
+                setError(data.error || 'Ошибка при генерации отчета');
+            } else if (data.status === 'done') {
                 setSuccess('Отчет успешно сгенерирован');
                 fetchReportsHistory();
-            } else {
+            } else if (data.status === 'failed') {
+                setSuccess('');
                 setError(data.error || 'Ошибка при генерации отчета');
+            } else {
+                setSuccess(`Отчет формируется... ${data.progress}%`);
+                setTimeout(() => waitForReportJob(jobId), 1000);
             }
         } catch (err) {
+            setSuccess('');
             setError('Ошибка при генерации отчета');
         }
     };
@@ -25,6 +25,7 @@ export const API_ENDPOINTS = {
         CREATE: `${API_BASE_URL}/api/appointment/create`,
         AVAILABLE_SLOTS: (doctorId: number, date: string) => 
             `${API_BASE_URL}/api/appointment/available-slots?doctor_id=${doctorId}&date=${date}`,
+        HOLD: `${API_BASE_URL}/api/appointment/hold`,
     },
     REPORTS: {
         TYPES: `${API_BASE_URL}/api/reports/types`,
@@ -35,6 +36,7 @@ export const API_ENDPOINTS = {
         AVAILABLE_MONTHS_BY_DOCTOR: (doctorId: string) => 
             `${API_BASE_URL}/api/reports/available-months/${doctorId}`,
         GENERATE: `${API_BASE_URL}/api/reports/generate`,
+        JOB: (jobId: string) => `${API_BASE_URL}/api/reports/jobs/${jobId}`,
         DETAILS: (reportId: number) => `${API_BASE_URL}/api/reports/details/${reportId}`,
         DELETE: (reportId: number) => `${API_BASE_URL}/api/reports/${reportId}`,
     },